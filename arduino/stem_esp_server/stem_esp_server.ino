@@ -56,6 +56,11 @@ CardRecord cards[MAX_CARDS];
 // Счётчики маршрутов
 uint16_t routeCounts[ROUTES_COUNT] = { 0, 0, 0 };
 
+// Версия заявок: растёт при каждом изменении, по ней строится ETag ответа /data
+uint32_t dataVersion = 0;
+// Метка запуска в ETag: после перезагрузки версия начинается заново
+uint32_t bootId = 0;
+
 // Приём по Serial
 String serialLine;
 
@@ -100,11 +105,23 @@ const char INDEX_HTML[] PROGMEM = R"HTML(
   </div>
 
 <script>
+let lastTag = null;
+let lastTotal = 0;
+
 async function load(){
   try{
-    const r = await fetch('/data', { cache: 'no-store' });
+    // no-cache: браузер сверяет ETag, без изменений сервер отвечает 304 без тела
+    const r = await fetch('/data', { cache: 'no-cache' });
     if(!r.ok) throw new Error('HTTP ' + r.status);
+    const tag = r.headers.get('ETag');
+    if(tag !== null && tag === lastTag){
+      document.getElementById('status').textContent =
+        'Обновлено: ' + new Date().toLocaleTimeString() + ' | Всего заявок: ' + lastTotal;
+      return;
+    }
+    lastTag = tag;
     const data = await r.json(); // { routes:[{name,count,index},...], total }
+    lastTotal = data.total;
 
     const ul = document.getElementById('list');
     ul.innerHTML = '';
@@ -210,6 +227,7 @@ void applyVote(uint32_t hash, uint8_t uidLen, uint8_t route) {
     if (oldRoute < ROUTES_COUNT && routeCounts[oldRoute] > 0) routeCounts[oldRoute]--;
     cards[pos].route = route;
     routeCounts[route]++;
+    dataVersion++;
     return;
   }
 
@@ -226,6 +244,7 @@ void applyVote(uint32_t hash, uint8_t uidLen, uint8_t route) {
   cards[freePos].uidLen = uidLen;
   cards[freePos].route = route;
   routeCounts[route]++;
+  dataVersion++;
 }
 
 // Удаление заявки по карте
@@ -237,6 +256,7 @@ bool removeVote(uint32_t hash, uint8_t uidLen) {
   if (r < ROUTES_COUNT && routeCounts[r] > 0) routeCounts[r]--;
 
   cards[pos].used = false;
+  dataVersion++;
   return true;
 }
 
@@ -244,6 +264,7 @@ bool removeVote(uint32_t hash, uint8_t uidLen) {
 void resetAll() {
   for (uint16_t i = 0; i < MAX_CARDS; i++) cards[i].used = false;
   for (uint8_t r = 0; r < ROUTES_COUNT; r++) routeCounts[r] = 0;
+  dataVersion++;
 }
 
 // Сброс заявок конкретного маршрута
@@ -261,6 +282,7 @@ void resetRoute(uint8_t route) {
   for (uint16_t i = 0; i < MAX_CARDS; i++) {
     if (cards[i].used && cards[i].route < ROUTES_COUNT) routeCounts[cards[i].route]++;
   }
+  dataVersion++;
 }
 
 // Хэндлер для корня /
@@ -269,7 +291,20 @@ void handleRoot() {
 }
 
 // Хэндлер для /data — отдаём JSON с данными
+// С If-None-Match и текущим ETag — 304 без тела (данные не менялись)
 void handleData() {
+  String etag = "\"";
+  etag += String(bootId, HEX);
+  etag += "-";
+  etag += String(dataVersion);
+  etag += "\"";
+  server.sendHeader("ETag", etag);
+  server.sendHeader("Cache-Control", "no-cache");
+  if (server.header("If-None-Match") == etag) {
+    server.send(304);
+    return;
+  }
+
   String json;
   json.reserve(512);
 
@@ -286,6 +321,8 @@ void handleData() {
   }
   json += "],\"total\":";
   json += String(totalCards());
+  json += ",\"version\":";
+  json += String(dataVersion);
   json += "}";
 
   server.send(200, "application/json; charset=utf-8", json);
@@ -435,6 +472,11 @@ void setup() {
   server.on("/data", HTTP_GET, handleData);
   server.on("/reset", HTTP_GET, handleReset);
 
+  // Заголовок If-None-Match нужен handleData (по умолчанию сервер их не хранит)
+  static const char* headerKeys[] = { "If-None-Match" };
+  server.collectHeaders(headerKeys, 1);
+  bootId = ESP.random();
+
   server.begin();
   Serial.println("HTTP server started.");
 }
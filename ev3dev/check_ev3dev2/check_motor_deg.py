@@ -5,7 +5,8 @@ from time import sleep
 from ev3dev2.motor import LargeMotor, OUTPUT_B, OUTPUT_C, SpeedPercent
 from ev3dev2.display import Display
 
-lcd = Display()
+# Дисплей создаётся в main(), а не при импорте модуля
+lcd = None
 
 b_state = "READY"
 c_state = "READY"
@@ -66,6 +67,9 @@ def rotate_motor_deg(motor, degrees, label,
 
 
 def main():
+    global lcd
+    lcd = Display()
+
     motor_b = LargeMotor(OUTPUT_B)
     motor_c = LargeMotor(OUTPUT_C)
 
@@ -5,7 +5,8 @@ from time import sleep
 from ev3dev2.motor import MoveTank, OUTPUT_B, OUTPUT_C, SpeedPercent
 from ev3dev2.display import Display
 
-lcd = Display()
+# Дисплей создаётся в main(), а не при импорте модуля
+lcd = None
 
 b_state = "READY"
 c_state = "READY"
@@ -75,6 +76,9 @@ def move_tank_deg(tank, deg_b, deg_c,
 
 
 def main():
+    global lcd
+    lcd = Display()
+
     tank = MoveTank(OUTPUT_B, OUTPUT_C)
 
     SPEED = 35
@@ -6,7 +6,8 @@ from ev3dev2.sensor.lego import ColorSensor
 from ev3dev2.sensor import INPUT_2, INPUT_3
 from ev3dev2.display import Display
 
-lcd = Display()
+# Дисплей создаётся в main(), а не при импорте модуля
+lcd = None
 
 
 def draw(v2, v3):
@@ -18,6 +19,9 @@ def draw(v2, v3):
 
 
 def main():
+    global lcd
+    lcd = Display()
+
     s2 = ColorSensor(INPUT_2)
     s3 = ColorSensor(INPUT_3)
 
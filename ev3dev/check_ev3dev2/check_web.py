@@ -5,7 +5,7 @@ import time
 import json
 import sys
 
-from urllib.request import urlopen
+from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 from ev3dev2.display import Display
 
@@ -14,12 +14,32 @@ ESP_IP = "192.168.1.104"
 REFRESH_SEC = 1.0
 HTTP_TIMEOUT = 2.0
 
+_routes_cache = {} # ip -> (ETag, маршруты) последнего ответа
+
 
 def fetch_routes(ip):
+    """
+    Маршруты с сервера и признак изменения (routes, changed)
+    Как в run.fetch_routes: с If-None-Match сервер отвечает 304 без тела,
+    пока заявки не менялись, - тогда возвращаются прошлые маршруты
+    """
+    cached = _routes_cache.get(ip)
+    headers = {"Accept": "application/json"}
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
     url = "http://{}/data".format(ip)
-    r = urlopen(url, timeout=HTTP_TIMEOUT)
+    try:
+        r = urlopen(Request(url, headers=headers), timeout=HTTP_TIMEOUT)
+    except HTTPError as e:
+        if e.code == 304 and cached is not None:
+            return cached[1], False
+        raise
     data = json.loads(r.read().decode("utf-8", "replace"))
-    return data.get("routes", [])
+    routes = data.get("routes", [])
+    etag = r.headers.get("ETag")
+    if etag:
+        _routes_cache[ip] = (etag, routes)
+    return routes, True
 
 
 def leader_index(routes):
@@ -64,13 +84,17 @@ def main():
         ip = sys.argv[1].strip()
 
     disp = Display()
+    shown = False # на экране актуальный список маршрутов
 
     while True:
         try:
-            routes = fetch_routes(ip)
-            draw_success(disp, ip, routes)
+            routes, changed = fetch_routes(ip)
+            if changed or not shown:
+                draw_success(disp, ip, routes)
+                shown = True
         except (HTTPError, URLError, ValueError, Exception):
             draw_error(disp, ip)
+            shown = False
 
         time.sleep(REFRESH_SEC)
 
@@ -12,8 +12,9 @@ from ev3dev2.sensor import INPUT_2, INPUT_3
 from ev3dev2.button import Button
 from ev3dev2.display import Display
 
-lcd = Display()
-btn = Button()
+# Дисплей и кнопки создаются в main(), а не при импорте модуля
+lcd = None
+btn = None
 
 def draw_menu():
     lcd.text_grid("LINE FOLLOWER", clear_screen=True, x=0, y=0, font="charB12")
@@ -166,6 +167,10 @@ class LineFollowerTwoSensors(object):
         return True
 
 def main():
+    global lcd, btn
+    lcd = Display()
+    btn = Button()
+
     robot = DifferentialDrive()
     follower = LineFollowerTwoSensors(
         base_speed=260,
@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Автоподбор настроек регулятора на симуляторе
+
+KP, BASE_SPEED, MAX_SPEED, TURN_SPEED и TURN_DEGREES из run.py подбираются
+по поездкам настоящего run.movement() на sim.SimTank (инерция моторов,
+ограниченное сцепление, шум датчиков). Трасса - круг из sim.lap_line() с
+двумя линиями через центр и меткой на нижней стороне; маршрут COURSE_PLAN
+проходит остановку, повороты налево и направо, проезды прямо и углы круга.
+
+Оценка поездки (меньше - лучше, секунды модельного времени):
+    время поездки (не доехал - TIME_LIMIT_S)
+    + LOSS_PENALTY за каждый сход с линии
+    + MISCOUNT_PENALTY за каждый перекрёсток, засчитанный не там или пропущенный.
+Оценка набора - среднее по --seeds прогонам с разным шумом датчиков.
+
+Поиск (--search):
+    grid   - сетка --grid значений по каждому параметру;
+    random - --samples случайных наборов;
+    bayes  - сначала --init случайных наборов, затем партиями по --jobs наборы,
+             у которых отношение плотностей лучших и остальных оценок
+             (оценка Парзена, как в TPE) наибольшее.
+Наборы считаются параллельно в пуле процессов (--jobs). Оценки кэшируются в
+tuning/cache.json вместе с отпечатком исходников симулятора и программы:
+повторный запуск не пересчитывает уже оценённые наборы, а после изменения
+run.py кэш не используется.
+
+Лучший набор сохраняется в tuning/<робот>.json; run.main() и демон перед
+поездкой подставляют его вместо констант run.py (run.apply_tuning()).
+Константы, которые зависят от подбираемых, пересчитываются вместе с ними
+(derived()): UTURN_DEGREES - в UTURN_RATIO раз больше TURN_DEGREES (в
+маршруте подбора нет разворота), LONG_EDGE_SPEED - в LONG_EDGE_RATIO раз
+больше BASE_SPEED (иначе при большой BASE_SPEED длинные участки по карте
+трассы шли бы медленнее подъездов к перекрёсткам).
+С --model поездки идут на моторах из модели робота (motor_model.py), а имя
+робота для профиля берётся из файла модели.
+
+Запуск (на компьютере):
+    ./autotune.py [--search bayes] [--samples 60] [--jobs 4] [--model motors/ev3dev.json] [--dry-run]
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TUNING_DIR = os.path.join(HERE, "tuning") # Каталог профилей настроек и кэша оценок
+CACHE_FILE = os.path.join(TUNING_DIR, "cache.json") # Кэш оценок
+
+# Параметр run.py, нижняя и верхняя граница, шаг
+SPACE = (
+    ("KP", 0.05, 1.0, 0.01),
+    ("BASE_SPEED", 20, 70, 1),
+    ("MAX_SPEED", 50, 100, 1),
+    ("TURN_SPEED", 10, 50, 1),
+    ("TURN_DEGREES", 140, 230, 1),
+)
+
+# Модули, от которых зависит оценка поездки (отпечаток кэша): симулятор и всё,
+# что run.py импортирует для поездки (вывод - дисплей, метрики, профилировщик - не влияет)
+SOURCES = ("autotune.py", "run.py", "sim.py", "motion.py", "recovery.py", "intersection.py", "filters.py",
+           "speed_control.py", "odometry.py", "planner.py", "track.py", "calibration.py", "motor_model.py",
+           "realtime.py")
+
+MOTOR_TAU = 0.08 # Постоянная времени мотора (секунды), как в bench_speed.py
+TRACTION = 1500.0 # Предельное ускорение колеса по полу (мм/с^2)
+SENSOR_SPACING = 32.0 # Расстояние между датчиками (мм)
+COURSE_RADIUS = 200.0 # Радиус скругления углов круга (мм)
+LOST_ABORT_S = 10.0 # Сколько можно быть без линии до прекращения поездки (секунды)
+TIME_LIMIT_S = 120.0 # Предел модельного времени на поездку
+LOSS_PENALTY = 5.0 # Штраф за сход с линии (секунды)
+MISCOUNT_PENALTY = 20.0 # Штраф за перекрёсток не на своём месте (секунды)
+CROSSING_TOLERANCE = 60.0 # Насколько далеко от перекрёстка может быть засчитано (мм)
+GOOD_FRACTION = 0.25 # Доля лучших оценок для поиска bayes
+BAYES_CANDIDATES = 64 # Кандидатов на один выбранный набор в поиске bayes
+UTURN_RATIO = 2.0 # UTURN_DEGREES / TURN_DEGREES (360 / 180 в run.py)
+LONG_EDGE_RATIO = 1.5 # LONG_EDGE_SPEED / BASE_SPEED (45 / 30 в run.py)
+
+# Маршрут (после остановки на первой метке) и перекрёстки, на которых засчитывается каждое действие
+COURSE_PLAN = ("left", "straight", "right", "right", "straight", "left", "straight", "stop")
+COURSE_CROSSINGS = ((500.0, 0.0), (700.0, 0.0), (700.0, 400.0), (700.0, 800.0), (1400.0, 400.0),
+                    (700.0, 400.0), (0.0, 400.0), (500.0, 0.0), (700.0, 0.0))
+COURSE_ROUTE = "tuning" # Имя маршрута для сценария COURSE_PLAN
+
+
+def tuning_path(robot=None):
+    """Путь к профилю настроек робота"""
+    from calibration import robot_name
+
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", robot or robot_name())
+    return os.path.join(TUNING_DIR, name + ".json")
+
+
+def save_tuning(params, robot=None, info=None):
+    """Сохранить профиль настроек, вернуть путь к файлу"""
+    from calibration import robot_name
+
+    path = tuning_path(robot)
+    if not os.path.isdir(TUNING_DIR):
+        os.makedirs(TUNING_DIR)
+
+    data = dict(params)
+    data.update(derived(params)) # для просмотра; load_tuning() пересчитывает их сам
+    data.update(info or {})
+    data["robot"] = robot or robot_name()
+    data["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+def load_tuning(robot=None):
+    """Загрузить профиль настроек (параметры SPACE и derived()) или вернуть None, если его нет"""
+    try:
+        with open(tuning_path(robot)) as f:
+            data = json.load(f)
+        params = dict((name, _cast(name, data[name])) for name, _, _, _ in SPACE if name in data)
+    except (OSError, IOError, ValueError, KeyError, TypeError):
+        return None
+    if not params:
+        return None
+    params.update(derived(params))
+    return params
+
+
+def derived(params):
+    """Константы run.py, пересчитываемые из подобранных: UTURN_DEGREES и LONG_EDGE_SPEED"""
+    result = {}
+    if "TURN_DEGREES" in params:
+        result["UTURN_DEGREES"] = int(round(UTURN_RATIO * params["TURN_DEGREES"]))
+    if "BASE_SPEED" in params:
+        result["LONG_EDGE_SPEED"] = min(100, int(round(LONG_EDGE_RATIO * params["BASE_SPEED"])))
+    return result
+
+
+def _cast(name, value):
+    """Значение параметра с его шагом: KP - дробное, остальные - целые"""
+    for key, lo, hi, step in SPACE:
+        if key == name:
+            value = min(hi, max(lo, round(float(value) / step) * step))
+            return int(value) if isinstance(step, int) else round(value, 6)
+    raise KeyError(name)
+
+
+def normalize(params):
+    """Набор параметров в границах SPACE и на их шаге (ключ кэша)"""
+    return dict((name, _cast(name, params[name])) for name, _, _, _ in SPACE)
+
+
+def course():
+    """Отрезки линии трассы: круг, линии через центр и метка остановки"""
+    from sim import lap_line
+
+    segments, _, _ = lap_line(radius=COURSE_RADIUS)
+    segments.append((700.0, 0.0, 700.0, 800.0))
+    segments.append((0.0, 400.0, 1400.0, 400.0))
+    segments.append((500.0, -60.0, 500.0, 60.0))
+    return segments
+
+
+class TripAbort(Exception):
+    """Поездка прекращена монитором (долго без линии или предел времени)"""
+
+
+class TripMonitor(object):
+    """
+    Наблюдатель модели и замена metrics в run.movement(): считает сходы с
+    линии (кроме манёвров on_for_degrees) и запоминает, где засчитан каждый перекрёсток
+    """
+    def __init__(self, world, line, sensors):
+        self.world = world
+        self.line = line
+        self.sensors = sensors
+        self.lost = False
+        self.lost_since = 0.0
+        self.line_losses = 0
+        self.crossings = [] # середина между датчиками в момент засчитанного перекрёстка
+        self.result = None
+
+    def _middle(self):
+        left, right = self.sensors
+        lx, ly = left.position()
+        rx, ry = right.position()
+        return (lx + rx) / 2.0, (ly + ry) / 2.0
+
+    def __call__(self, world):
+        if world.left.target is None and world.right.target is None:
+            x, y = self._middle()
+            gone = self.line.distance(x, y) > SENSOR_SPACING / 2.0 + self.line.half_width
+            if gone and not self.lost:
+                self.lost = True
+                self.lost_since = world.time
+                self.line_losses += 1
+            elif not gone and self.lost:
+                self.lost = False
+        if (self.lost and world.time - self.lost_since > LOST_ABORT_S) or world.time > TIME_LIMIT_S:
+            raise TripAbort()
+
+    # --- интерфейс metrics.RobotMetrics, который вызывает movement() ---
+
+    def trip_started(self, now):
+        pass
+
+    def tick(self, now):
+        pass
+
+    def intersection(self):
+        self.crossings.append(self._middle())
+
+    def trip_finished(self, result, now, line_losses=0):
+        self.result = result
+
+
+class NullDisplay(object):
+    def update(self, *args, **kwargs):
+        pass
+
+
+class NullButton(object):
+    down = False
+
+
+def run_trip(params, seed=1, model=None):
+    """
+    Одна поездка по трассе с настройками params
+    Возвращает словарь: time, finished, losses, miscounts, score
+    """
+    import run
+    from run import Robot, LineFollower, L_BLACK, L_WHITE, R_BLACK, R_WHITE
+    from sim import SimWorld, SimTank, SimLine, line_sensors
+
+    line = SimLine(course())
+    world = SimWorld(run.WHEEL_DIAMETER, run.AXLE_TRACK, seed=seed, motor_tau=MOTOR_TAU, traction=TRACTION)
+    if model is not None:
+        world.apply_motor_model(model)
+    world.place(COURSE_RADIUS, 0.0, 0.0)
+    sensors = line_sensors(world, line, SENSOR_SPACING)
+    follower = LineFollower(sensors=sensors)
+    follower.set_calibration(L_BLACK, L_WHITE, R_BLACK, R_WHITE)
+    robot = Robot(tank=SimTank(world, auto_step=True))
+    monitor = TripMonitor(world, line, sensors)
+    world.observers.append(monitor)
+
+    overrides = dict(params)
+    overrides.update(derived(params))
+    overrides.update(ROUTE_POST_STOP_ACTIONS={COURSE_ROUTE: COURSE_PLAN}, STOP_DELAY=0.0, PAUSE_DELAY=0.0)
+    saved = dict((name, getattr(run, name)) for name in overrides)
+    try:
+        for name, value in overrides.items():
+            setattr(run, name, value)
+        run.movement(robot, follower, NullDisplay(), NullButton(), route_name=COURSE_ROUTE, stop_at=1,
+                     clock=world.clock, metrics=monitor)
+    except TripAbort:
+        pass
+    finally:
+        for name, value in saved.items():
+            setattr(run, name, value)
+
+    finished = monitor.result == "finished"
+    miscounts = len(COURSE_CROSSINGS) - len(monitor.crossings) if len(monitor.crossings) < len(COURSE_CROSSINGS) else 0
+    for (x, y), (ex, ey) in zip(monitor.crossings, COURSE_CROSSINGS):
+        if math.hypot(x - ex, y - ey) > CROSSING_TOLERANCE:
+            miscounts += 1
+    miscounts += max(0, len(monitor.crossings) - len(COURSE_CROSSINGS))
+    trip_time = world.time if finished else TIME_LIMIT_S
+    return {
+        "time": round(trip_time, 2),
+        "finished": finished,
+        "losses": monitor.line_losses,
+        "miscounts": miscounts,
+        "score": round(trip_time + LOSS_PENALTY * monitor.line_losses + MISCOUNT_PENALTY * miscounts, 3),
+    }
+
+
+def _trip_task(task):
+    """Задача пула процессов: (ключ набора, параметры, seed, модель) -> (ключ, seed, результат)"""
+    key, params, seed, model = task
+    return key, seed, run_trip(params, seed, model)
+
+
+def fingerprint(model=None):
+    """Отпечаток исходников и модели моторов: оценки с другим отпечатком не используются"""
+    import hashlib
+
+    digest = hashlib.sha1()
+    for name in SOURCES:
+        with open(os.path.join(HERE, name), "rb") as f:
+            digest.update(f.read())
+    digest.update(json.dumps(model, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def params_key(params):
+    return json.dumps(normalize(params), sort_keys=True)
+
+
+class Evaluator(object):
+    """Оценка наборов в пуле процессов с кэшем по (отпечаток, набор, seed)"""
+    def __init__(self, jobs, seeds, model=None, cache_file=CACHE_FILE):
+        self.jobs = jobs
+        self.seeds = seeds
+        self.model = model
+        self.cache_file = cache_file
+        self.source_key = fingerprint(model)
+        self.cache = {}
+        self.hits = 0
+        self.trips = 0
+        self.results = {} # ключ набора -> (набор, средняя оценка, результаты по seed)
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    self.cache = json.load(f)
+            except (OSError, IOError, ValueError):
+                self.cache = {}
+        self.pool = None
+        if jobs > 1:
+            # multiprocessing импортируется здесь: import run (и autotune из него) остаётся быстрым
+            import multiprocessing
+            self.pool = multiprocessing.Pool(jobs)
+
+    def _cache_key(self, key, seed):
+        return "{} {} {}".format(self.source_key, seed, key)
+
+    def evaluate(self, candidates):
+        """Оценить наборы (уже оценённые пропускаются); возвращает [(набор, оценка)] в порядке candidates"""
+        tasks = []
+        pending = {}
+        for params in candidates:
+            params = normalize(params)
+            key = params_key(params)
+            if key in self.results or key in pending:
+                continue
+            pending[key] = (params, {})
+            for seed in range(1, self.seeds + 1):
+                cached = self.cache.get(self._cache_key(key, seed))
+                if cached is not None:
+                    pending[key][1][seed] = cached
+                    self.hits += 1
+                else:
+                    tasks.append((key, params, seed, self.model))
+
+        if self.pool is not None:
+            done = self.pool.imap_unordered(_trip_task, tasks)
+        else:
+            done = (_trip_task(task) for task in tasks)
+        for key, seed, result in done:
+            self.trips += 1
+            pending[key][1][seed] = result
+            self.cache[self._cache_key(key, seed)] = result
+
+        for key, (params, trips) in pending.items():
+            score = sum(r["score"] for r in trips.values()) / float(len(trips))
+            self.results[key] = (params, round(score, 3), [trips[seed] for seed in sorted(trips)])
+        return [self.results[params_key(p)][:2] for p in candidates]
+
+    def ranked(self):
+        return sorted(self.results.values(), key=lambda item: item[1])
+
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        if not os.path.isdir(os.path.dirname(self.cache_file)):
+            os.makedirs(os.path.dirname(self.cache_file))
+        tmp_path = self.cache_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.cache, f, sort_keys=True)
+        os.rename(tmp_path, self.cache_file)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+def current_params():
+    """Настройки из констант run.py"""
+    import run
+
+    return normalize(dict((name, getattr(run, name)) for name, _, _, _ in SPACE))
+
+
+def grid_candidates(points):
+    import itertools
+
+    axes = []
+    for name, lo, hi, step in SPACE:
+        axes.append([lo + (hi - lo) * k / float(max(1, points - 1)) for k in range(points)])
+    names = [name for name, _, _, _ in SPACE]
+    return [dict(zip(names, values)) for values in itertools.product(*axes)]
+
+
+def random_candidate(rnd):
+    return normalize(dict((name, rnd.uniform(lo, hi)) for name, lo, hi, _ in SPACE))
+
+
+def _density(point, sample, bandwidth):
+    """Оценка Парзена: средняя гауссова плотность точки по выборке (в долях диапазонов)"""
+    total = 0.0
+    for other in sample:
+        d2 = 0.0
+        for name, lo, hi, _ in SPACE:
+            d2 += ((point[name] - other[name]) / float(hi - lo)) ** 2
+        total += math.exp(-d2 / (2.0 * bandwidth * bandwidth))
+    return total / len(sample) + 1e-12
+
+
+def bayes_candidates(evaluator, count, rnd, bandwidth=0.1):
+    """
+    Следующая партия поиска bayes: кандидаты рождаются возле лучших наборов,
+    выбираются с наибольшим отношением плотностей лучших и остальных (TPE)
+    """
+    ranked = [params for params, _, _ in evaluator.ranked()]
+    split = max(2, int(len(ranked) * GOOD_FRACTION))
+    good, bad = ranked[:split], ranked[split:] or ranked[-1:]
+    chosen = []
+    seen = set(evaluator.results)
+    for _ in range(count):
+        best, best_ratio = None, -1.0
+        for _ in range(BAYES_CANDIDATES):
+            center = rnd.choice(good)
+            candidate = normalize(dict((name, rnd.gauss(center[name], bandwidth * (hi - lo)))
+                                       for name, lo, hi, _ in SPACE))
+            key = params_key(candidate)
+            if key in seen:
+                continue
+            ratio = _density(candidate, good, bandwidth) / _density(candidate, bad, bandwidth)
+            if ratio > best_ratio:
+                best, best_ratio = candidate, ratio
+        if best is None:
+            best = random_candidate(rnd)
+        seen.add(params_key(best))
+        chosen.append(best)
+    return chosen
+
+
+def _format(params):
+    return " ".join("{}={}".format(name, params[name]) for name, _, _, _ in SPACE)
+
+
+def main():
+    import argparse
+
+    from motor_model import load_model
+
+    parser = argparse.ArgumentParser(description="Controller gain autotuner on the simulator")
+    parser.add_argument("--search", choices=("grid", "random", "bayes"), default="bayes", help="способ поиска")
+    parser.add_argument("--samples", type=int, default=60, help="наборов для random и bayes")
+    parser.add_argument("--init", type=int, default=16, help="случайных наборов перед поиском bayes")
+    parser.add_argument("--grid", type=int, default=3, help="значений каждого параметра для grid")
+    parser.add_argument("--seeds", type=int, default=2, help="поездок с разным шумом датчиков на набор")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="процессов")
+    parser.add_argument("--seed", type=int, default=1, help="seed случайного поиска")
+    parser.add_argument("--model", help="файл модели моторов (motor_model.py)")
+    parser.add_argument("--robot", help="имя робота для профиля (по умолчанию из модели или hostname)")
+    parser.add_argument("--no-cache", action="store_true", help="не читать и не писать кэш оценок")
+    parser.add_argument("--dry-run", action="store_true", help="не сохранять профиль")
+    args = parser.parse_args()
+
+    model = None
+    robot = args.robot
+    if args.model:
+        model = load_model(path=args.model)
+        if model is None:
+            parser.error("cannot load motor model {}".format(args.model))
+        robot = robot or model.get("robot")
+
+    rnd = random.Random(args.seed)
+    started = time.time()
+    evaluator = Evaluator(args.jobs, args.seeds, model, None if args.no_cache else CACHE_FILE)
+    try:
+        baseline = current_params()
+        baseline_score = evaluator.evaluate([baseline])[0][1]
+        if args.search == "grid":
+            evaluator.evaluate(grid_candidates(args.grid))
+        elif args.search == "random":
+            evaluator.evaluate([random_candidate(rnd) for _ in range(args.samples)])
+        else:
+            evaluator.evaluate([random_candidate(rnd) for _ in range(min(args.init, args.samples))])
+            while len(evaluator.results) < args.samples + 1:
+                batch = min(args.jobs, args.samples + 1 - len(evaluator.results))
+                evaluator.evaluate(bayes_candidates(evaluator, batch, rnd))
+                best = evaluator.ranked()[0]
+                print("{:>4} evaluated, best {:.2f}: {}".format(len(evaluator.results), best[1], _format(best[0])))
+    finally:
+        evaluator.close()
+        evaluator.save_cache()
+
+    ranked = evaluator.ranked()
+    print("{} sets, {} trips simulated, {} cached, {:.1f} s".format(
+        len(ranked), evaluator.trips, evaluator.hits, time.time() - started))
+    print("{:>8} {:>7} {:>7} {:>6} {:>6}  {}".format("score", "trip s", "losses", "miss", "done", "parameters"))
+    for params, score, trips in ranked[:10]:
+        print("{:>8.2f} {:>7.2f} {:>7.1f} {:>6.1f} {:>4}/{}  {}".format(
+            score, sum(t["time"] for t in trips) / len(trips), sum(t["losses"] for t in trips) / float(len(trips)),
+            sum(t["miscounts"] for t in trips) / float(len(trips)), sum(1 for t in trips if t["finished"]),
+            len(trips), _format(params)))
+    print("run.py constants: {:.2f}  {}".format(baseline_score, _format(baseline)))
+
+    best, best_score, _ = ranked[0]
+    if args.dry_run:
+        return
+    path = save_tuning(best, robot, {"score": best_score, "baseline_score": baseline_score,
+                                     "search": args.search, "seeds": args.seeds})
+    print("saved to {} (derived: {})".format(
+        path, " ".join("{}={}".format(name, value) for name, value in sorted(derived(best).items()))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Стоимость проверки кнопки в такте movement() и задержка события
+
+Сравнивается чтение button.down:
+    ev3dev2  - ev3dev2 Button (состояние читается из устройства при каждом обращении);
+    ioctl    - прямой запрос состояния кнопок EVIOCGKEY (то же без обёртки ev3dev2);
+    service  - ButtonService: атрибут, который обновляет фоновый поток.
+Первые два варианта доступны только на роботе. Задержка от события в
+устройстве до смены атрибута замеряется на FakeInputDevice.
+
+Запуск:
+    ./bench_buttons.py [-n 20000]
+"""
+
+import os
+import time
+import fcntl
+import argparse
+
+from buttons import ButtonService, FakeInputDevice, EV3_BUTTONS_DEVICE, _eviocgkey
+
+
+def per_call_us(func, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) * 1e6 / n
+
+
+def event_latency_us(service, fake, repeats=200):
+    """Время от записи события в устройство до смены service.down (мкс, медиана)"""
+    samples = []
+    for k in range(repeats):
+        pressed = k % 2 == 0
+        start = time.perf_counter()
+        if pressed:
+            fake.press("down")
+        else:
+            fake.release("down")
+        while service.down != pressed:
+            pass
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Button check cost per control tick")
+    parser.add_argument("-n", type=int, default=20000, help="число проверок на вариант")
+    args = parser.parse_args()
+
+    results = []
+    if os.path.exists(EV3_BUTTONS_DEVICE):
+        try:
+            from ev3dev2.button import Button
+
+            button = Button()
+            results.append(("ev3dev2", per_call_us(lambda: button.down, args.n)))
+        except ImportError:
+            pass
+
+        fd = os.open(EV3_BUTTONS_DEVICE, os.O_RDONLY | os.O_NONBLOCK)
+        state = bytearray(96)
+        request = _eviocgkey(len(state))
+        results.append(("ioctl", per_call_us(lambda: fcntl.ioctl(fd, request, state), args.n)))
+        os.close(fd)
+
+    fake = FakeInputDevice()
+    service = ButtonService(fake.fd)
+    results.append(("service", per_call_us(lambda: service.down, args.n)))
+    latency = event_latency_us(service, fake)
+    reads = service.read_calls
+    service.close()
+    fake.close()
+
+    print("{:<8} {:>12}".format("variant", "us / check"))
+    for name, us in results:
+        print("{:<8} {:>12.2f}".format(name, us))
+    if len(results) > 1:
+        print("saved per tick: {:.2f} us".format(results[0][1] - results[-1][1]))
+    print("event -> flag latency (median): {:.0f} us, device reads: {}".format(latency, reads))
+
+
+if __name__ == "__main__":
+    main()
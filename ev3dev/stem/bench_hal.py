@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Задержка вызовов HAL для разных бэкендов
+
+Для каждого доступного бэкенда замеряется среднее время одного вызова:
+    on same     - tank.on() с той же скоростью (повтор пропускается);
+    on same raw - то же без пропуска повторов (elide=False);
+    on change   - tank.on() с новой скоростью каждый раз;
+    position    - чтение энкодера левого мотора;
+    sensor      - чтение датчика отражения;
+    button      - проверка buttons.down.
+sim доступен всегда; sysfs - на роботе, а вне робота на фальшивом дереве
+hal.sysfs.make_fake_sysfs() (замер стоимости системных вызовов без драйвера);
+ev3dev2 и ev3dev - на роботе с установленной библиотекой.
+
+Запуск:
+    ./bench_hal.py [-n 2000] [--backends sim sysfs ev3dev2]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import hal
+from hal.sysfs import SYSFS_ROOT, make_fake_sysfs
+
+CALLS = ("on same", "on same raw", "on change", "position", "sensor", "button")
+
+
+def per_call_us(func, n):
+    start = time.perf_counter()
+    for k in range(n):
+        func(k)
+    return (time.perf_counter() - start) * 1e6 / n
+
+
+def measure(backend, n):
+    """Время вызовов (мкс) для одного бэкенда"""
+    tank = backend.tank()
+    raw_tank = backend.tank(elide=False)
+    sensor = backend.color_sensor("2")
+    sensor.mode = "COL-REFLECT"
+    buttons = backend.buttons()
+
+    results = {}
+    try:
+        results["on same"] = per_call_us(lambda k: tank.on(20, 20), n)
+        results["on same raw"] = per_call_us(lambda k: raw_tank.on(20, 20), n)
+        results["on change"] = per_call_us(lambda k: tank.on(20 + k % 10, 20 - k % 10), n)
+        results["position"] = per_call_us(lambda k: tank.left_motor.position, n)
+        results["sensor"] = per_call_us(lambda k: sensor.value(), n)
+        results["button"] = per_call_us(lambda k: buttons.down, n)
+    finally:
+        tank.off()
+        if hasattr(buttons, "close"):
+            buttons.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call latency of HAL backends")
+    parser.add_argument("-n", type=int, default=2000, help="вызовов на замер")
+    parser.add_argument("--backends", nargs="+", default=sorted(hal.BACKENDS), help="какие бэкенды замерять")
+    args = parser.parse_args()
+
+    fake_root = None
+    rows = []
+    for name in args.backends:
+        options = {}
+        label = name
+        if name == "sysfs" and not os.path.isdir(os.path.join(SYSFS_ROOT, "tacho-motor")):
+            fake_root = make_fake_sysfs(tempfile.mkdtemp(prefix="stem-sysfs-"))
+            options["root"] = fake_root
+            label = "sysfs*"
+        try:
+            backend = hal.open_backend(name, **options)
+            rows.append((label, measure(backend, args.n)))
+        except (ImportError, IOError, OSError, RuntimeError) as e:
+            print("{}: unavailable ({})".format(name, e))
+
+    if fake_root is not None:
+        shutil.rmtree(fake_root, ignore_errors=True)
+
+    print("{:<8}".format("us/call") + "".join("{:>13}".format(call) for call in CALLS))
+    for label, results in rows:
+        print("{:<8}".format(label) + "".join("{:>13.2f}".format(results[call]) for call in CALLS))
+    if fake_root is not None:
+        print("* fake sysfs tree in a temporary directory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Замер времени импорта модулей программы робота
+
+Каждый модуль импортируется в отдельном свежем интерпретаторе несколько раз,
+в отчёт выводится медиана. Если интерпретатор поддерживает -X importtime
+(Python 3.7+), дополнительно печатается разбивка по самым дорогим вложенным
+модулям.
+
+Запуск:
+    ./bench_import.py                  # модули stem и ev3dev2
+    ./bench_import.py run display -n 9 # только выбранные модули
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Модули программы и тяжёлые зависимости, с которыми стоит сравнить
+DEFAULT_MODULES = (
+    "display",
+    "run",
+    "daemon",
+    "stemctl",
+    "ev3dev2.motor",
+    "ev3dev2.sensor.lego",
+    "ev3dev2.display",
+    "urllib.request",
+)
+
+TIMER_CODE = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def time_import(module, repeat):
+    """Время импорта модуля в свежем интерпретаторе (список секунд) или None"""
+    samples = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", TIMER_CODE.format(module=module)],
+            cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        if proc.returncode != 0:
+            return None
+        samples.append(float(proc.stdout.decode().strip()))
+    return samples
+
+
+def importtime_breakdown(module, top):
+    """Самые дорогие вложенные модули по данным -X importtime (мкс)"""
+    if sys.version_info < (3, 7):
+        return []
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    rows = []
+    for line in proc.stderr.decode("utf-8", "replace").splitlines():
+        # Формат: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us = int(parts[0]), int(parts[1])
+        rows.append((self_us, cumulative_us, parts[2].strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="запусков на модуль")
+    parser.add_argument("--top", type=int, default=8, help="строк разбивки на модуль")
+    args = parser.parse_args()
+
+    print("{:<22} {:>10} {:>10}".format("module", "median ms", "min ms"))
+    for module in args.modules:
+        samples = time_import(module, args.repeat)
+        if samples is None:
+            print("{:<22} {:>10}".format(module, "n/a"))
+            continue
+        print("{:<22} {:>10.2f} {:>10.2f}".format(module, median(samples) * 1000.0, min(samples) * 1000.0))
+
+    for module in args.modules:
+        rows = importtime_breakdown(module, args.top)
+        if not rows:
+            continue
+        print("\n{} (self us / cumulative us):".format(module))
+        for self_us, cumulative_us, name in rows:
+            print("  {:>8} {:>10}  {}".format(self_us, cumulative_us, name))
+
+
+if __name__ == "__main__":
+    main()
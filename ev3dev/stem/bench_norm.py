@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Микро-бенчмарк нормализации отражения за один такт управления
+
+Сравнивает прежний путь (формула + clamp() на каждый такт, порог перекрёстка
+пересчитывается при каждом вызове) и табличный путь LineFollower
+(read_error() + detect_intersection() через индексацию таблиц).
+Датчики заменены заглушками, поэтому замеряется только вычислительная часть.
+
+Запуск (на роботе или на компьютере):
+    ./bench_norm.py [-n 200000]
+"""
+
+import random
+import argparse
+import timeit
+
+from run import LineFollower, L_BLACK, L_WHITE, R_BLACK, R_WHITE
+from traces import ReplaySensor
+
+
+class LegacyFollower(LineFollower):
+    """Прежняя реализация нормализации (формула на каждый такт)"""
+    def read_error(self):
+        l_raw = int(self.left.value())
+        r_raw = int(self.right.value())
+
+        l = self.norm_reflect(l_raw, self.l_black, self.l_white)
+        r = self.norm_reflect(r_raw, self.r_black, self.r_white)
+
+        return l - r
+
+    def detect_intersection(self):
+        l_raw = int(self.left.value())
+        r_raw = int(self.right.value())
+
+        threshold = (self.l_black + self.l_white) / 2
+        return l_raw < threshold and r_raw < threshold
+
+
+def make_follower(cls, seed, **kwargs):
+    """Создать follower на заглушках датчиков"""
+    rnd = random.Random(seed)
+    sensors = (
+        ReplaySensor([rnd.randint(0, 100) for _ in range(1000)]),
+        ReplaySensor([rnd.randint(0, 100) for _ in range(1000)]),
+    )
+    follower = cls(sensors=sensors, **kwargs)
+    follower.set_calibration(L_BLACK, L_WHITE, R_BLACK, R_WHITE)
+    return follower
+
+
+def tick(follower):
+    """Вычисления одного такта movement(): перекрёсток + ошибка"""
+    follower.detect_intersection()
+    return follower.read_error()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-tick normalization benchmark")
+    parser.add_argument("-n", "--number", type=int, default=200000, help="тактов в замере")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="повторов замера")
+    args = parser.parse_args()
+
+    # Табличный путь замеряется без фильтров (чистое сравнение с формулой)
+    # и с фильтрами по умолчанию из run.py
+    no_filters = dict(error_filter="none", intersection_filter="none", hysteresis=0)
+    variants = (
+        ("formula", LegacyFollower, no_filters),
+        ("table", LineFollower, no_filters),
+        ("table+filters", LineFollower, {}),
+    )
+
+    results = []
+    for label, cls, kwargs in variants:
+        follower = make_follower(cls, seed=1, **kwargs)
+        best = min(timeit.repeat(lambda: tick(follower), number=args.number, repeat=args.repeat))
+        per_tick_us = best / args.number * 1e6
+        results.append(per_tick_us)
+        print("{:<14} {:>8.3f} us/tick".format(label, per_tick_us))
+
+    print("speedup        {:>8.2f}x".format(results[0] / results[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Датчики линии: частота обновления, задержка чтения и шум по режимам
+
+check_sensor_line.py показывает значения раз в 50 мс, но не отвечает, как
+часто датчик на самом деле даёт новое значение. Здесь оба датчика
+опрашиваются без пауз в каждом режиме (COL-REFLECT, REF-RAW); время и
+значение каждого чтения пишутся в заранее выделенные массивы. По записи:
+    reads/s   - сколько чтений успевает цикл;
+    updates/s - сколько раз значение изменилось (нижняя оценка частоты
+                обновления: одинаковые подряд отсчёты не отличить);
+    stale ms  - средний возраст значения в момент чтения;
+    p50..max  - распределение задержки одного чтения (мкс);
+    std, std% - шум значения (абсолютный и в % шкалы режима).
+Шум и частоту обновления честно видно, когда датчик неподвижен над краем
+линии (серое поле): над чистым белым значение COL-REFLECT почти не
+меняется. В конце - рекомендация: режим с меньшим шумом среди тех, с
+которыми работает run.py (SUPPORTED_MODES: LineFollower читает COL-REFLECT
+через таблицы RAW_LUT_SIZE), и частота цикла управления, выше которой цикл
+будет перечитывать одно и то же значение. Если тише режим, который run.py
+не поддерживает, это печатается отдельно.
+
+На роботе работает через выбранный бэкенд HAL (без --backend - бэкенд по
+умолчанию, а если библиотеки ev3dev2 нет - sysfs); вне робота sysfs
+замеряется на фальшивом дереве hal.sysfs.make_fake_sysfs(), в которое
+фоновый поток пишет шумные значения с частотой --fake-rate (проверка в CI).
+
+Запуск:
+    ./bench_sensors.py [--backend sysfs] [--seconds 2] [--modes COL-REFLECT REF-RAW]
+"""
+
+import os
+import math
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from array import array
+
+import hal
+from hal.sysfs import SYSFS_ROOT, make_fake_sysfs
+
+MODES = ("COL-REFLECT", "REF-RAW") # Режимы датчика цвета для линии
+SUPPORTED_MODES = ("COL-REFLECT",) # Режимы, с которыми работает run.LineFollower
+FULL_SCALE = {"COL-REFLECT": 100.0, "REF-RAW": 1023.0} # Шкала значения режима
+MAX_READS = 100000 # Размер массивов записи (на датчик и режим)
+MODE_SETTLE_S = 0.3 # Пауза после смены режима (датчик перенастраивается)
+LOOP_READ_SHARE = 0.5 # Какую долю такта цикла можно отдать на чтение датчиков
+
+
+class Recording(object):
+    """Заранее выделенные массивы: момент чтения, значение, длительность чтения"""
+    def __init__(self, size=MAX_READS):
+        self.t = array("d", [0.0]) * size
+        self.value = array("l", [0]) * size
+        self.latency = array("d", [0.0]) * size
+        self.count = 0
+
+
+def record(sensors, seconds, recordings):
+    """Опрос датчиков по очереди без пауз; останавливается по времени или заполнению"""
+    clock = time.perf_counter
+    for rec in recordings:
+        rec.count = 0
+    size = len(recordings[0].t)
+    end = clock() + seconds
+    i = 0
+    while i < size:
+        for sensor, rec in zip(sensors, recordings):
+            start = clock()
+            value = sensor.value()
+            done = clock()
+            rec.t[i] = done
+            rec.value[i] = int(value)
+            rec.latency[i] = done - start
+            rec.count = i + 1
+        i += 1
+        if done > end:
+            break
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * p / 100.0)))]
+
+
+def analyze(rec, full_scale):
+    """Метрики одной записи"""
+    n = rec.count
+    duration = rec.t[n - 1] - rec.t[0] if n > 1 else 0.0
+    updates = 0
+    stale_sum = 0.0
+    changed_at = rec.t[0]
+    total = 0.0
+    square = 0.0
+    for i in range(n):
+        value = rec.value[i]
+        if i and value != rec.value[i - 1]:
+            updates += 1
+            changed_at = rec.t[i]
+        stale_sum += rec.t[i] - changed_at
+        total += value
+        square += value * value
+    mean = total / n
+    std = math.sqrt(max(0.0, square / n - mean * mean))
+    latency = sorted(rec.latency[i] * 1e6 for i in range(n))
+    return {
+        "reads_hz": (n - 1) / duration if duration else 0.0,
+        "updates_hz": updates / duration if duration else 0.0,
+        "stale_ms": 1000.0 * stale_sum / n,
+        "p50_us": _percentile(latency, 50),
+        "p90_us": _percentile(latency, 90),
+        "p99_us": _percentile(latency, 99),
+        "max_us": latency[-1],
+        "mean": mean,
+        "std": std,
+        "std_pct": 100.0 * std / full_scale,
+    }
+
+
+def _noise(results, mode):
+    return max(r["std_pct"] for r in results[mode])
+
+
+def quietest(results):
+    """Режим с меньшим шумом среди всех замеренных"""
+    return min(results, key=lambda mode: _noise(results, mode))
+
+
+def recommend(results):
+    """
+    Режим с меньшим шумом среди SUPPORTED_MODES (если ни один не замерен -
+    среди всех) и частота цикла для него: не чаще обновления датчика и так,
+    чтобы чтение обоих датчиков (p90) занимало не больше LOOP_READ_SHARE такта
+    """
+    supported = [mode for mode in results if mode in SUPPORTED_MODES] or list(results)
+    best_mode = min(supported, key=lambda mode: _noise(results, mode))
+    stats = results[best_mode]
+    update_hz = min(r["updates_hz"] for r in stats)
+    read_s = sum(r["p90_us"] for r in stats) / 1e6
+    budget_hz = LOOP_READ_SHARE / read_s if read_s else float("inf")
+    return best_mode, min(update_hz, budget_hz) if update_hz else budget_hz, update_hz, budget_hz
+
+
+class FakeSensorWriter(object):
+    """Пишет шумные значения в value0 фальшивых датчиков с заданной частотой"""
+    def __init__(self, root, rate_hz=1000.0, noise=1.5, seed=1):
+        self.period = 1.0 / rate_hz
+        self.noise = noise
+        self.rnd = random.Random(seed)
+        self.files = []
+        class_dir = os.path.join(root, "lego-sensor")
+        for name in sorted(os.listdir(class_dir)):
+            path = os.path.join(class_dir, name)
+            self.files.append((os.open(os.path.join(path, "mode"), os.O_RDONLY),
+                               os.open(os.path.join(path, "value0"), os.O_WRONLY)))
+        self._running = True
+        self.thread = threading.Thread(target=self._loop, name="fake-sensors")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _loop(self):
+        while self._running:
+            for mode_fd, value_fd in self.files:
+                # Режим в файле дописан поверх прежнего (pwrite без усечения) - смотрим начало
+                raw = os.pread(mode_fd, 64, 0).startswith(b"REF-RAW")
+                level = 500.0 if raw else 40.0
+                value = level + self.rnd.gauss(0.0, self.noise * (10.0 if raw else 1.0))
+                # Запись фиксированной ширины: файл не укорачивается, читатель видит целое число
+                os.pwrite(value_fd, "{:6d}\n".format(int(round(value))).encode("ascii"), 0)
+            time.sleep(self.period)
+
+    def close(self):
+        self._running = False
+        self.thread.join(1.0)
+        for fds in self.files:
+            for fd in fds:
+                os.close(fd)
+
+
+def default_backend():
+    """Бэкенд по умолчанию; sysfs, если библиотеки ev3dev2 нет (вне робота)"""
+    if hal.DEFAULT_BACKEND != "ev3dev2":
+        return hal.DEFAULT_BACKEND
+    try:
+        import ev3dev2
+    except ImportError:
+        return "sysfs"
+    return "ev3dev2"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Line sensor update rate, read latency and noise per mode")
+    parser.add_argument("--backend", help="бэкенд HAL (по умолчанию {}, без ev3dev2 - sysfs)".format(
+        hal.DEFAULT_BACKEND))
+    parser.add_argument("--ports", nargs=2, default=["2", "3"], help="порты левого и правого датчиков")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), help="режимы датчика")
+    parser.add_argument("--seconds", type=float, default=2.0, help="длительность опроса в каждом режиме")
+    parser.add_argument("--fake", action="store_true", help="sysfs на фальшивом дереве даже на роботе")
+    parser.add_argument("--fake-rate", type=float, default=1000.0, help="частота значений фальшивых датчиков (Гц)")
+    args = parser.parse_args()
+    args.backend = args.backend or default_backend()
+
+    fake_root = None
+    writer = None
+    options = {}
+    label = args.backend
+    if args.backend == "sysfs" and (args.fake or not os.path.isdir(os.path.join(SYSFS_ROOT, "lego-sensor"))):
+        fake_root = make_fake_sysfs(tempfile.mkdtemp(prefix="stem-sysfs-"))
+        writer = FakeSensorWriter(fake_root, args.fake_rate)
+        options["root"] = fake_root
+        label = "sysfs*"
+
+    results = {}
+    try:
+        try:
+            backend = hal.open_backend(args.backend, **options)
+            sensors = [backend.color_sensor(port) for port in args.ports]
+        except ImportError as e:
+            parser.error("backend {} is not available here: {}".format(args.backend, e))
+        recordings = [Recording(), Recording()]
+        for mode in args.modes:
+            for sensor in sensors:
+                sensor.mode = mode
+            time.sleep(MODE_SETTLE_S)
+            record(sensors, args.seconds, recordings)
+            results[mode] = [analyze(rec, FULL_SCALE.get(mode, 100.0)) for rec in recordings]
+    finally:
+        if writer is not None:
+            writer.close()
+        if fake_root is not None:
+            shutil.rmtree(fake_root, ignore_errors=True)
+
+    print("backend {}, {:.1f} s per mode".format(label, args.seconds))
+    print("{:<12} {:>4} {:>9} {:>9} {:>8} {:>7} {:>7} {:>7} {:>7} {:>8} {:>6} {:>6}".format(
+        "mode", "port", "reads/s", "updates/s", "stale ms", "p50 us", "p90 us", "p99 us", "max us",
+        "mean", "std", "std%"))
+    for mode in args.modes:
+        for port, r in zip(args.ports, results[mode]):
+            print("{:<12} {:>4} {:>9.0f} {:>9.0f} {:>8.2f} {:>7.1f} {:>7.1f} {:>7.1f} {:>7.0f} {:>8.1f} {:>6.2f} {:>6.2f}".format(
+                mode, port, r["reads_hz"], r["updates_hz"], r["stale_ms"], r["p50_us"], r["p90_us"],
+                r["p99_us"], r["max_us"], r["mean"], r["std"], r["std_pct"]))
+
+    mode, loop_hz, update_hz, budget_hz = recommend(results)
+    print("recommended: {} at {:.0f} Hz ({:.1f} ms per tick; sensor updates {:.0f} Hz, read budget {:.0f} Hz)".format(
+        mode, loop_hz, 1000.0 / loop_hz, update_hz, budget_hz))
+    quiet = quietest(results)
+    if mode not in SUPPORTED_MODES:
+        print("note: run.py reads only {} (LineFollower lookup tables of RAW_LUT_SIZE), not {}".format(
+            ", ".join(SUPPORTED_MODES), mode))
+    elif quiet != mode:
+        print("note: {} is quieter, but run.py reads only {} (LineFollower lookup tables of RAW_LUT_SIZE)".format(
+            quiet, ", ".join(SUPPORTED_MODES)))
+    if fake_root is not None:
+        print("* fake sysfs tree in a temporary directory, values written at {:.0f} Hz".format(args.fake_rate))
+
+
+if __name__ == "__main__":
+    main()
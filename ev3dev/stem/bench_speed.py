@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Время круга и сходы с линии на симуляторе при разных скоростях
+
+Круг из sim.lap_line() (четыре перекрёстка-метки) проезжается настоящим
+run.movement() на SimTank с инерцией мотора и ограниченным сцеплением
+колёс. Для каждой скорости BASE_SPEED сравниваются:
+    constant - прежнее поведение: постоянная скорость, мгновенные скачки;
+    profile  - профиль скорости (разгон, торможение, замедление на изгибах).
+Сход с линии - оба датчика по одну сторону от линии дальше её края;
+если робот не вернулся на линию за LOST_ABORT_S секунд, круг не засчитан.
+Поиск линии после схода (recovery.py) работает в обоих вариантах, кроме
+запуска с --no-recovery; для него выводятся число поисков и их время.
+
+С --model моторы симулятора берутся из модели моторов робота (motor_model.py).
+
+Запуск (на компьютере):
+    ./bench_speed.py [--speeds 30 45 60 75 90] [--radius 200] [--model motors/ev3dev.json]
+"""
+
+import argparse
+
+import run
+from run import Robot, LineFollower, L_BLACK, L_WHITE, R_BLACK, R_WHITE
+from recovery import LineRecovery
+from motor_model import load_model
+from sim import SimWorld, SimTank, SimLine, lap_line, line_sensors
+
+MOTOR_TAU = 0.08 # Постоянная времени мотора (секунды)
+TRACTION = 1500.0 # Предельное ускорение колеса по полу (мм/с^2)
+SENSOR_SPACING = 32.0 # Расстояние между датчиками (мм)
+LOST_ABORT_S = 10.0 # Сколько можно быть без линии (вместе с поиском) до прекращения круга
+TIME_LIMIT_S = 120.0 # Предел модельного времени на круг
+
+
+class NullDisplay(object):
+    def update(self, *args, **kwargs):
+        pass
+
+
+class NullButton(object):
+    down = False
+
+
+class LapMonitor(object):
+    """Считает сходы с линии после каждого шага модели; заменяет событие cancel"""
+    def __init__(self, line, sensors):
+        self.line = line
+        self.sensors = sensors
+        self.lost = False
+        self.lost_since = 0.0
+        self.line_losses = 0
+        self.aborted = False
+
+    def __call__(self, world):
+        left, right = self.sensors
+        lx, ly = left.position()
+        rx, ry = right.position()
+        # Середина между датчиками дальше, чем половина базы плюс край линии
+        gone = self.line.distance((lx + rx) / 2.0, (ly + ry) / 2.0) > SENSOR_SPACING / 2.0 + self.line.half_width
+        if gone and not self.lost:
+            self.lost = True
+            self.lost_since = world.time
+            self.line_losses += 1
+        elif not gone and self.lost:
+            self.lost = False
+        if (self.lost and world.time - self.lost_since > LOST_ABORT_S) or world.time > TIME_LIMIT_S:
+            self.aborted = True
+
+    def is_set(self):
+        return self.aborted
+
+
+def run_lap(speed, use_profile, radius, seed=1, use_recovery=True, model=None):
+    """Один круг; возвращает (время круга или None, число сходов с линии, LineRecovery)"""
+    segments, markers, _ = lap_line(radius=radius)
+    line = SimLine(segments)
+    world = SimWorld(run.WHEEL_DIAMETER, run.AXLE_TRACK, seed=seed, motor_tau=MOTOR_TAU, traction=TRACTION)
+    if model is not None:
+        world.apply_motor_model(model)
+    world.place(radius, 0.0, 0.0)
+    sensors = line_sensors(world, line, SENSOR_SPACING)
+    follower = LineFollower(sensors=sensors)
+    follower.set_calibration(L_BLACK, L_WHITE, R_BLACK, R_WHITE)
+    robot = Robot(tank=SimTank(world, auto_step=True))
+    monitor = LapMonitor(line, sensors)
+    world.observers.append(monitor)
+    recovery = LineRecovery(robot, follower, run.LINE_LOST_DEGREES if use_recovery else 0, run.RECOVERY_SPEED,
+                            run.RECOVERY_SWEEP_DEGREES, run.RECOVERY_SWEEPS, clock=world.clock)
+
+    saved = dict((name, getattr(run, name)) for name in ("BASE_SPEED", "ACCELERATION", "DECELERATION", "CURVE_SLOWDOWN"))
+    try:
+        run.BASE_SPEED = speed
+        if not use_profile:
+            run.ACCELERATION = run.DECELERATION = 1e9
+            run.CURVE_SLOWDOWN = 0.0
+        run.movement(robot, follower, NullDisplay(), NullButton(), total_intersections=len(markers),
+                     stop_at=0, cancel=monitor, clock=world.clock, recovery=recovery)
+    finally:
+        for name, value in saved.items():
+            setattr(run, name, value)
+
+    finished = not monitor.aborted and not recovery.failed
+    return (world.time if finished else None), monitor.line_losses, recovery
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lap time and line losses on the simulator")
+    parser.add_argument("--speeds", type=int, nargs="+", default=[30, 45, 60, 75, 90], help="значения BASE_SPEED (%)")
+    parser.add_argument("--radius", type=float, default=200.0, help="радиус скругления углов круга (мм)")
+    parser.add_argument("--seeds", type=int, default=3, help="прогонов с разным шумом датчиков на вариант")
+    parser.add_argument("--no-recovery", action="store_true", help="без поиска линии после схода")
+    parser.add_argument("--model", help="файл модели моторов (motor_model.py)")
+    args = parser.parse_args()
+    model = None
+    if args.model:
+        model = load_model(path=args.model)
+        if model is None:
+            parser.error("cannot load motor model {}".format(args.model))
+
+    print("lap: radius {:.0f} mm, motor tau {:.2f} s, traction {:.0f} mm/s^2".format(args.radius, MOTOR_TAU, TRACTION))
+    print("{:>6} {:<9} {:>10} {:>8} {:>10} {:>11} {:>6}".format(
+        "speed", "variant", "lap s", "losses", "recovered", "recovery ms", "done"))
+    for speed in args.speeds:
+        for variant, use_profile in (("constant", False), ("profile", True)):
+            times, losses, searches, found, durations = [], 0, 0, 0, []
+            for seed in range(1, args.seeds + 1):
+                lap_time, lost, recovery = run_lap(speed, use_profile, args.radius, seed, not args.no_recovery, model)
+                losses += lost
+                searches += len(recovery.events)
+                found += sum(1 for e in recovery.events if e.found)
+                durations.extend(e.duration for e in recovery.events if e.found)
+                if lap_time is not None:
+                    times.append(lap_time)
+            lap = "{:.2f}".format(sum(times) / len(times)) if times else "-"
+            recovery_ms = "{:.0f}".format(1000.0 * sum(durations) / len(durations)) if durations else "-"
+            print("{:>6} {:<9} {:>10} {:>8} {:>6}/{:<3} {:>11} {:>3}/{}".format(
+                speed, variant, lap, losses, found, searches, recovery_ms, len(times), args.seeds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Набор бенчмарков горячих путей программы робота с порогами регрессии
+
+Замеряется время одного вызова (лучший из --repeat замеров; замеры разных
+бенчмарков чередуются, так что временное замедление машины задевает
+каждый бенчмарк лишь в части замеров):
+    read_error          - LineFollower.read_error() на датчиках фальшивого sysfs;
+    detect_intersection - LineFollower.detect_intersection() там же (с фильтрами run.py);
+    drive               - Robot.drive() с меняющимися скоростями на моторах фальшивого sysfs;
+    get_leader          - get_leader() по четырём маршрутам;
+    fetch_routes        - fetch_routes() целиком: HTTP к локальному серверу-заглушке + JSON;
+    fetch_routes_304    - fetch_routes() с ETag, сервер отвечает 304;
+    decode_json         - разбор тела /data в JSON (часть fetch_routes);
+    decode_binary       - _unpack_routes() для двоичного ответа route_server.py;
+    display_frame       - кадр DisplayUpdater.draw_frame() на дисплее-заглушке
+                          (картинка PIL 178x128, как у ev3dev2 Display; без PIL - пустой дисплей).
+
+Результаты дописываются в историю (--history, JSON-список прогонов). Каждый
+замер сравнивается с последними --window прогонами той же среды (компьютер,
+версия Python, дисплей): граница - медиана плюс MAD_K разбросов (MAD,
+приведённый к сигме), но не меньше --threshold от медианы (THRESHOLDS для
+сетевых замеров); пока в истории меньше MIN_RUNS прогонов - медиана плюс
+FALLBACK_THRESHOLD. Медленнее границы - REGRESSION и код выхода 1; замеры,
+отмеченные регрессией, в базу не входят, так что повторные запуски не
+делают замедление нормой. С --accept замедление намеренное: код выхода 0,
+и база этих замеров начинается заново с этого прогона. Прогон записывается
+в историю всегда, с отметкой регрессий: иначе база сдвигается к самым
+быстрым прогонам.
+
+Запуск (на роботе или на компьютере):
+    ./bench_suite.py [--cases read_error drive] [--repeat 5] [--scale 0.2] [--no-save] [--accept]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import timeit
+
+import hal
+import run
+from display import DisplayUpdater
+from hal.base import NullDisplay
+from hal.sysfs import make_fake_sysfs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(HERE, "bench_history.json") # История прогонов
+THRESHOLD = 0.1 # Замедление меньше этой доли медианы не считается регрессией при любом разбросе
+THRESHOLDS = {"fetch_routes": 0.3, "fetch_routes_304": 0.3} # То же для сетевых замеров
+MAD_K = 5.0 # Регрессия - медленнее медианы больше чем на MAD_K разбросов
+MAD_SIGMA = 1.4826 # MAD -> сигма нормального распределения
+MIN_RUNS = 5 # С меньшим числом прогонов в истории разброс не оценивается
+FALLBACK_THRESHOLD = 0.5 # Допустимое замедление, пока разброс не оценить (доля медианы)
+WINDOW = 10 # Сколько последних прогонов той же среды составляют базу
+SCREEN_SIZE = (178, 128) # Экран EV3 (пиксели)
+ROUTES = [{"index": k, "name": "Route {}".format(k + 1), "count": c} for k, c in enumerate((3, 7, 1, 5))]
+
+
+class StandInServer(object):
+    """Сервер маршрутов на localhost: /data в JSON, с ETag или без (разбор на каждом запросе)"""
+    def __init__(self, etag):
+        # http.server импортируется здесь, как в metrics.start_server()
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+
+        body = json.dumps({"routes": ROUTES, "total": sum(r["count"] for r in ROUTES)}).encode("utf-8")
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if etag and self.headers.get("If-None-Match") == '"bench"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", '"bench"')
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.body = body
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.address = "127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, name="bench-server")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FrameDisplay(object):
+    """Дисплей-заглушка с отрисовкой в картинку PIL, как ev3dev2 Display (без framebuffer)"""
+    def __init__(self):
+        from PIL import Image, ImageDraw, ImageFont
+
+        self.image = Image.new("1", SCREEN_SIZE, 1)
+        self.draw = ImageDraw.Draw(self.image)
+        self.font = ImageFont.load_default()
+        self.frame = b""
+
+    def clear(self):
+        self.draw.rectangle((0, 0) + SCREEN_SIZE, fill=1)
+
+    def text_grid(self, text, clear_screen=True, x=0, y=0, text_color="black", font=None):
+        if clear_screen:
+            self.clear()
+        self.draw.text((x * 8, y * 10), text, fill=0, font=self.font)
+
+    def update(self):
+        self.frame = self.image.tobytes()
+
+
+def make_display():
+    """(дисплей, его имя в среде прогона)"""
+    try:
+        return FrameDisplay(), "pil"
+    except ImportError:
+        return NullDisplay(), "null"
+
+
+class Suite(object):
+    """Заглушки устройств и сервера на время прогона; cases() - функции одного вызова"""
+    def __init__(self):
+        self.root = make_fake_sysfs(tempfile.mkdtemp(prefix="stem-bench-"))
+        backend = hal.open_backend("sysfs", root=self.root)
+        self.follower = run.LineFollower(sensors=(backend.color_sensor("2"), backend.color_sensor("3")))
+        self.robot = run.Robot(tank=backend.tank("C", "B"))
+        self.json_server = StandInServer(etag=False)
+        self.etag_server = StandInServer(etag=True)
+        run.fetch_routes(self.etag_server.address) # ответ и ETag в кэше fetch_routes
+        display, self.display_kind = make_display()
+        self.display = DisplayUpdater(display)
+        self.binary = self._pack(ROUTES)
+        self._speed = 0
+
+    @staticmethod
+    def _pack(routes):
+        """Двоичный /data в формате server/protocol.py: pack_data"""
+        import struct
+
+        # Заголовок: магия, формат, число маршрутов, версия, total
+        body = struct.pack("!2sBBII", b"SR", 1, len(routes), 0, sum(r["count"] for r in routes))
+        for route in routes:
+            name = route["name"].encode("ascii")
+            body += struct.pack("!IB", route["count"], len(name)) + name
+        return body
+
+    def _drive(self):
+        self._speed = (self._speed + 1) % 20
+        self.robot.drive(30 + self._speed, 30 - self._speed)
+
+    def cases(self):
+        """Имя -> (функция одного вызова, вызовов в замере)"""
+        body = self.json_server.body
+        return {
+            "read_error": (self.follower.read_error, 20000),
+            "detect_intersection": (self.follower.detect_intersection, 20000),
+            "drive": (self._drive, 10000),
+            "get_leader": (lambda: run.get_leader(ROUTES), 100000),
+            "fetch_routes": (lambda: run.fetch_routes(self.json_server.address), 200),
+            "fetch_routes_304": (lambda: run.fetch_routes(self.etag_server.address), 200),
+            "decode_json": (lambda: json.loads(body.decode("utf-8", "replace")).get("routes", []), 50000),
+            "decode_binary": (lambda: run._unpack_routes(self.binary), 50000),
+            "display_frame": (lambda: self.display.draw_frame("Driving", "192.168.1.104", 2, 3, "Route 2"), 2000),
+        }
+
+    def close(self):
+        self.robot.stop()
+        self.json_server.close()
+        self.etag_server.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+def measure(cases, repeat):
+    """Лучшее время одного вызова (мкс) для {имя: (функция, вызовов)}; замеры идут по кругу"""
+    best = {}
+    for func, _ in cases.values():
+        func()
+    for _ in range(repeat):
+        for name, (func, number) in cases.items():
+            elapsed = timeit.timeit(func, number=number) / number * 1e6
+            best[name] = min(best.get(name, elapsed), elapsed)
+    return best
+
+
+def environment(display_kind):
+    """Среда прогона: сравниваются только прогоны с одинаковой средой"""
+    return {
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": "{}.{}".format(*sys.version_info[:2]),
+        "display": display_kind,
+    }
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+    os.rename(tmp, path)
+
+
+def baseline(history, env, window):
+    """
+    (медиана, MAD, прогонов) каждого замера по последним window значениям среды env
+    Замеры, отмеченные в прогоне как регрессия, в базу не входят: повторный
+    запуск не делает замедление новой нормой. Принятая (--accept) регрессия
+    начинает базу замера заново - прогоны до неё не учитываются
+    """
+    runs = [entry for entry in history if entry.get("env") == env]
+    values = {}
+    closed = set() # замеры, для которых найдена принятая регрессия
+    for entry in reversed(runs):
+        regressions = entry.get("regressions", ())
+        for name, value in entry["results"].items():
+            series = values.setdefault(name, [])
+            if name in closed or len(series) >= window:
+                continue
+            if name in regressions:
+                if not entry.get("accepted"):
+                    continue
+                closed.add(name)
+            series.append(value)
+    values = dict((name, series) for name, series in values.items() if series)
+    runs = runs[-window:]
+    stats = {}
+    for name, series in values.items():
+        median = _median(series)
+        stats[name] = (median, _median([abs(v - median) for v in series]), len(series))
+    return stats, len(runs)
+
+
+def limit(median, mad, runs, floor):
+    """Наибольшее время вызова без регрессии"""
+    if runs < MIN_RUNS:
+        return median * (1.0 + FALLBACK_THRESHOLD)
+    return median + max(MAD_K * MAD_SIGMA * mad, floor * median)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path benchmarks with regression thresholds")
+    parser.add_argument("--cases", nargs="+", help="какие бенчмарки запускать (по умолчанию все)")
+    parser.add_argument("-r", "--repeat", type=int, default=9, help="повторов замера")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель числа вызовов (меньше - быстрее, шумнее)")
+    parser.add_argument("--history", default=HISTORY_FILE, help="файл истории (JSON)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="замедление, не считающееся регрессией при любом разбросе (доля)")
+    parser.add_argument("--window", type=int, default=WINDOW, help="прогонов истории в базе")
+    parser.add_argument("--no-save", action="store_true", help="не записывать прогон в историю")
+    parser.add_argument("--accept", action="store_true", help="замедление намеренное: код выхода 0")
+    args = parser.parse_args()
+
+    suite = Suite()
+    try:
+        cases = suite.cases()
+        names = args.cases or sorted(cases)
+        unknown = [name for name in names if name not in cases]
+        if unknown:
+            parser.error("unknown cases: {} (expected: {})".format(", ".join(unknown), ", ".join(sorted(cases))))
+        selected = dict((name, (cases[name][0], max(1, int(cases[name][1] * args.scale)))) for name in names)
+        results = dict((name, round(value, 3)) for name, value in measure(selected, args.repeat).items())
+    finally:
+        suite.close()
+
+    env = environment(suite.display_kind)
+    history = load_history(args.history)
+    base, runs = baseline(history, env, args.window)
+
+    regressions = []
+    print("{:<20} {:>11} {:>11} {:>11} {:>8}".format("us/call", "now", "baseline", "limit", "change"))
+    for name in names:
+        value = results[name]
+        if name not in base:
+            print("{:<20} {:>11.3f} {:>11} {:>11} {:>8}".format(name, value, "-", "-", ""))
+            continue
+        median, mad, count = base[name]
+        bound = limit(median, mad, count, THRESHOLDS.get(name, args.threshold))
+        change = value / median - 1.0 if median > 0 else 0.0
+        mark = ""
+        if value > bound:
+            regressions.append(name)
+            mark = "  REGRESSION"
+        print("{:<20} {:>11.3f} {:>11.3f} {:>11.3f} {:>+7.0f}%{}".format(
+            name, value, median, bound, 100.0 * change, mark))
+    print("baseline: median and spread of {} run(s) on {host} ({machine}, Python {python}, display {display})".format(
+        runs, **env))
+
+    if args.no_save:
+        print("not saved to {}".format(args.history))
+    else:
+        history.append({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": commit(), "env": env,
+                        "results": results, "regressions": regressions, "accepted": args.accept})
+        save_history(args.history, history)
+        print("saved to {} ({} runs)".format(args.history, len(history)))
+
+    if regressions:
+        print("regressions: {}{}".format(", ".join(regressions), " (accepted)" if args.accept else ""))
+        if not args.accept:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Кнопки EV3 по событиям Linux input вместо опроса устройства
+
+ev3dev2 Button при каждом обращении к button.down читает состояние кнопок
+из устройства (ioctl), а movement() проверяет кнопку каждый такт. Здесь
+фоновый поток ждёт событий устройства /dev/input/... через select и
+обновляет атрибуты up/down/left/right/enter/backspace, поэтому проверка в
+такте - чтение атрибута. Нажатия и отпускания дополнительно складываются в
+очередь events (deque, без блокировок) для тех, кому важен каждый клик.
+
+ButtonService повторяет используемую часть интерфейса ev3dev2 Button
+(атрибуты кнопок, buttons_pressed, any()) и подставляется вместо него.
+FakeInputDevice - канал с событиями в формате ядра для проверок вне робота.
+"""
+
+import os
+import time
+import errno
+import fcntl
+import select
+import struct
+import threading
+from collections import deque
+
+EV3_BUTTONS_DEVICE = "/dev/input/by-path/platform-gpio_keys-event" # Кнопки блока EV3 в ev3dev
+
+# struct input_event: время (timeval), тип, код, значение
+EVENT_FORMAT = "llHHi"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+EV_SYN = 0x00
+EV_KEY = 0x01
+
+# Коды клавиш linux/input-event-codes.h для кнопок блока
+KEY_CODES = {
+    103: "up",
+    108: "down",
+    105: "left",
+    106: "right",
+    28: "enter",
+    14: "backspace",
+}
+BUTTON_CODES = dict((name, code) for code, name in KEY_CODES.items())
+
+EVENTS_MAXLEN = 64 # Сколько последних событий хранить в очереди
+
+
+def _eviocgkey(length):
+    """Номер ioctl EVIOCGKEY(len): текущее состояние всех клавиш устройства"""
+    return (2 << 30) | (length << 16) | (ord("E") << 8) | 0x18
+
+
+class ButtonService(object):
+    """Состояние кнопок из событий устройства, обновляется фоновым потоком"""
+    def __init__(self, device=EV3_BUTTONS_DEVICE):
+        self.up = False
+        self.down = False
+        self.left = False
+        self.right = False
+        self.enter = False
+        self.backspace = False
+
+        # (кнопка, нажата, время) - нажатия и отпускания по порядку
+        self.events = deque(maxlen=EVENTS_MAXLEN)
+        self.changed = threading.Event()
+        self.read_calls = 0 # сколько раз поток читал устройство (для бенчмарка)
+
+        # device - путь к устройству или уже открытый дескриптор (FakeInputDevice.fd)
+        if isinstance(device, int):
+            self.fd = device
+            self.own_fd = False
+        else:
+            self.fd = os.open(device, os.O_RDONLY | os.O_NONBLOCK)
+            self.own_fd = True
+        self._sync_state()
+
+        self._wake_r, self._wake_w = os.pipe()
+        self._running = True
+        self.thread = threading.Thread(target=self._loop, name="buttons")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _sync_state(self):
+        """Начальное состояние кнопок (зажатая при старте кнопка не даёт события)"""
+        state = bytearray(96) # KEY_MAX = 0x2ff -> 768 бит
+        try:
+            fcntl.ioctl(self.fd, _eviocgkey(len(state)), state)
+        except (IOError, OSError):
+            return # не устройство input (канал FakeInputDevice) - считаем, что ничего не нажато
+        for code, name in KEY_CODES.items():
+            setattr(self, name, bool(state[code // 8] & (1 << (code % 8))))
+
+    def _loop(self):
+        buf = b""
+        while self._running:
+            try:
+                ready, _, _ = select.select([self.fd, self._wake_r], [], [])
+            except (IOError, OSError, ValueError):
+                break
+            if self._wake_r in ready or not self._running:
+                break
+            try:
+                chunk = os.read(self.fd, EVENT_SIZE * 16)
+            except (IOError, OSError) as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                break
+            if not chunk:
+                break # устройство закрыто
+            self.read_calls += 1
+
+            buf += chunk
+            whole = len(buf) - len(buf) % EVENT_SIZE
+            for offset in range(0, whole, EVENT_SIZE):
+                _, _, etype, code, value = struct.unpack_from(EVENT_FORMAT, buf, offset)
+                if etype == EV_KEY and code in KEY_CODES and value in (0, 1):
+                    name = KEY_CODES[code]
+                    setattr(self, name, value == 1)
+                    self.events.append((name, value == 1, time.time()))
+                    self.changed.set()
+            buf = buf[whole:]
+
+    @property
+    def buttons_pressed(self):
+        return [name for name in BUTTON_CODES if getattr(self, name)]
+
+    def any(self):
+        return bool(self.buttons_pressed)
+
+    def wait_release(self, timeout=None):
+        """Дождаться, пока отпустят все кнопки (без опроса: ждём события)"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.any():
+            self.changed.clear()
+            if self.any():
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+        return True
+
+    def wait_press(self, names=None, timeout=None):
+        """
+        Дождаться нажатия одной из кнопок names (по умолчанию любой) и её отпускания
+        Возвращает имя кнопки или None по таймауту
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        self.events.clear()
+        while True:
+            self.changed.clear()
+            while self.events:
+                name, pressed, _ = self.events.popleft()
+                if pressed and (names is None or name in names):
+                    self.wait_release(None if deadline is None else max(0.0, deadline - time.time()))
+                    return name
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            self.changed.wait(remaining)
+
+    def close(self):
+        """Остановить фоновый поток и закрыть устройство"""
+        self._running = False
+        os.write(self._wake_w, b"x")
+        self.thread.join(1.0)
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+        if self.own_fd:
+            os.close(self.fd)
+
+
+class FakeInputDevice(object):
+    """Канал, в который пишутся события кнопок в формате ядра (ButtonService(device=fake.fd))"""
+    def __init__(self):
+        self.fd, self._write_fd = os.pipe()
+
+    def _write(self, etype, code, value):
+        now = time.time()
+        sec = int(now)
+        os.write(self._write_fd, struct.pack(EVENT_FORMAT, sec, int((now - sec) * 1e6), etype, code, value))
+
+    def press(self, name):
+        self._write(EV_KEY, BUTTON_CODES[name], 1)
+        self._write(EV_SYN, 0, 0)
+
+    def release(self, name):
+        self._write(EV_KEY, BUTTON_CODES[name], 0)
+        self._write(EV_SYN, 0, 0)
+
+    def click(self, name):
+        self.press(name)
+        self.release(name)
+
+    def close(self):
+        os.close(self._write_fd)
+        os.close(self.fd)
+
+
+def open_buttons():
+    """ButtonService для кнопок блока; если устройства нет - обычный ev3dev2 Button"""
+    try:
+        return ButtonService()
+    except (IOError, OSError):
+        from ev3dev2.button import Button
+
+        return Button()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Автоматическая калибровка датчиков линии
+
+Робот ставится на линию, поворачивается на месте влево и вправо так, чтобы
+оба датчика прошли над белым и чёрным, и всё это время опрашивает датчики.
+Чёрное и белое берутся как нижний и верхний перцентили выборки, поэтому
+одиночные выбросы не портят калибровку.
+
+Результат сохраняется в профиль calibration/<робот>_<трасса>.json и
+загружается LineFollower при запуске.
+
+Запуск (робот стоит на линии):
+    ./calibration.py [TRACK]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CALIBRATION_DIR = os.path.join(HERE, "calibration") # Каталог профилей калибровки
+DEFAULT_TRACK = os.environ.get("STEM_TRACK", "default") # Имя трассы по умолчанию
+
+SWEEP_SPEED = 15 # Скорость поворота при калибровке (% от максимальной)
+SWEEP_DEGREES = 150 # Поворот моторов в каждую сторону от линии (градусы)
+SAMPLE_DELAY = 0.002 # Пауза между опросами датчиков (секунды)
+BLACK_PERCENTILE = 5 # Перцентиль для уровня чёрного
+WHITE_PERCENTILE = 95 # Перцентиль для уровня белого
+MIN_CONTRAST = 20 # Минимальная разница белое - чёрное для успешной калибровки
+
+
+class CalibrationError(Exception):
+    """Калибровка не удалась (мало данных или низкий контраст)"""
+
+
+def robot_name():
+    """Имя робота для профиля калибровки (hostname блока EV3)"""
+    return os.environ.get("STEM_ROBOT") or socket.gethostname()
+
+
+def percentile(values, p):
+    """Перцентиль p (0..100) с линейной интерполяцией"""
+    if not values:
+        raise ValueError("percentile of empty sequence")
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * p / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def profile_path(robot=None, track=None):
+    """Путь к файлу профиля для робота и трассы"""
+    name = "{}_{}".format(robot or robot_name(), track or DEFAULT_TRACK)
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+    return os.path.join(CALIBRATION_DIR, name + ".json")
+
+
+def compute_profile(left_samples, right_samples):
+    """Уровни чёрного и белого для обоих датчиков по выборкам"""
+    if len(left_samples) < 10 or len(right_samples) < 10:
+        raise CalibrationError("not enough samples: {}".format(min(len(left_samples), len(right_samples))))
+
+    profile = {
+        "l_black": int(round(percentile(left_samples, BLACK_PERCENTILE))),
+        "l_white": int(round(percentile(left_samples, WHITE_PERCENTILE))),
+        "r_black": int(round(percentile(right_samples, BLACK_PERCENTILE))),
+        "r_white": int(round(percentile(right_samples, WHITE_PERCENTILE))),
+        "samples": len(left_samples),
+    }
+
+    for side in ("l", "r"):
+        contrast = profile[side + "_white"] - profile[side + "_black"]
+        if contrast < MIN_CONTRAST:
+            raise CalibrationError("low contrast on {} sensor: {}".format(side, contrast))
+
+    return profile
+
+
+def save_profile(profile, robot=None, track=None):
+    """Сохранить профиль на диск, вернуть путь к файлу"""
+    path = profile_path(robot, track)
+    if not os.path.isdir(CALIBRATION_DIR):
+        os.makedirs(CALIBRATION_DIR)
+
+    data = dict(profile)
+    data["robot"] = robot or robot_name()
+    data["track"] = track or DEFAULT_TRACK
+    data["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    # Пишем во временный файл и переименовываем, чтобы не оставить битый профиль
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+def load_profile(robot=None, track=None):
+    """Загрузить профиль калибровки или вернуть None, если его нет"""
+    path = profile_path(robot, track)
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return dict((key, int(data[key])) for key in ("l_black", "l_white", "r_black", "r_white"))
+    except (OSError, IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _sample_while_turning(robot, follower, left_speed, right_speed, degrees, left_samples, right_samples):
+    """Повернуть робота на месте, опрашивая датчики до окончания движения"""
+    robot.drive_degrees(left_speed, right_speed, degrees, block=False)
+    # Даём моторам перейти в состояние running
+    time.sleep(0.05)
+    while robot.is_running():
+        left_samples.append(int(follower.left.value()))
+        right_samples.append(int(follower.right.value()))
+        time.sleep(SAMPLE_DELAY)
+
+
+def sweep_calibrate(robot, follower, speed=SWEEP_SPEED, degrees=SWEEP_DEGREES):
+    """
+    Калибровка поворотом через линию: влево, вправо на двойной угол и
+    обратно на линию. Возвращает профиль (словарь уровней) и применяет его
+    """
+    left_samples = []
+    right_samples = []
+
+    try:
+        _sample_while_turning(robot, follower, -speed, speed, degrees, left_samples, right_samples)
+        _sample_while_turning(robot, follower, speed, -speed, 2 * degrees, left_samples, right_samples)
+        _sample_while_turning(robot, follower, -speed, speed, degrees, left_samples, right_samples)
+    finally:
+        robot.stop()
+
+    profile = compute_profile(left_samples, right_samples)
+    follower.set_calibration(profile["l_black"], profile["l_white"], profile["r_black"], profile["r_white"])
+    return profile
+
+
+def main():
+    from run import Robot, LineFollower
+
+    track = sys.argv[1] if len(sys.argv) > 1 else None
+
+    robot = Robot()
+    follower = LineFollower(track=track)
+
+    print("Sweep calibration...")
+    try:
+        profile = sweep_calibrate(robot, follower)
+    except CalibrationError as e:
+        print("FAILED: {}".format(e))
+        return 1
+
+    path = save_profile(profile, track=track)
+    print("L: B={l_black} W={l_white}  R: B={r_black} W={r_white}  ({samples} samples)".format(**profile))
+    print("Saved: {}".format(path))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка одометрии на симуляторе привода с известной геометрией
+
+Сценарии (прямая, поворот на месте, дуга, квадрат) прогоняются на
+sim.SimTank; положение из Odometry сравнивается с истинным положением
+SimWorld. Без проскальзывания ошибка определяется только округлением
+энкодеров до градуса, с проскальзыванием показывает накопление дрейфа.
+
+Запуск:
+    ./check_odometry.py [--slip 0.02]
+Код возврата 1, если ошибка без проскальзывания превышает допуск.
+"""
+
+import sys
+import math
+import argparse
+
+from odometry import Odometry
+from run import Robot, WHEEL_DIAMETER, AXLE_TRACK
+from sim import SimWorld, SimTank
+
+POSITION_TOLERANCE_MM = 2.0 # Допуск по положению без проскальзывания
+HEADING_TOLERANCE_DEG = 1.0 # Допуск по курсу без проскальзывания
+
+
+def drive_for(world, robot, odometry, left_speed, right_speed, seconds):
+    """Непрерывное движение с обновлением одометрии каждый такт"""
+    robot.drive(left_speed, right_speed)
+    for _ in range(int(seconds / world.dt)):
+        world.step()
+        odometry.update()
+    robot.stop()
+
+
+def scenario_straight(world, robot, odometry):
+    drive_for(world, robot, odometry, 40, 40, 3.0)
+
+
+def scenario_spin(world, robot, odometry):
+    robot.drive_degrees(-25, 25, 360)
+    odometry.update()
+
+
+def scenario_arc(world, robot, odometry):
+    drive_for(world, robot, odometry, 20, 40, 4.0)
+
+
+def scenario_square(world, robot, odometry):
+    # Поворот на 90 градусов: дуга колеса axle_track * pi / 4 мм
+    turn_degrees = AXLE_TRACK * math.pi / 4.0 / (math.pi * WHEEL_DIAMETER / 360.0)
+    for _ in range(4):
+        robot.drive_degrees(40, 40, 720)
+        odometry.update()
+        robot.drive_degrees(-20, 20, turn_degrees)
+        odometry.update()
+
+
+SCENARIOS = (
+    ("straight", scenario_straight),
+    ("spin", scenario_spin),
+    ("arc", scenario_arc),
+    ("square", scenario_square),
+)
+
+
+def run_scenario(func, slip):
+    world = SimWorld(WHEEL_DIAMETER, AXLE_TRACK, slip=slip)
+    robot = Robot(tank=SimTank(world))
+    odometry = Odometry(robot.tank, WHEEL_DIAMETER, AXLE_TRACK)
+    func(world, robot, odometry)
+
+    position_error = math.hypot(odometry.x - world.x, odometry.y - world.y)
+    heading_error = math.degrees(abs((odometry.heading - world.heading + math.pi) % (2 * math.pi) - math.pi))
+    return world, odometry, position_error, heading_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Odometry check on the simulated tank")
+    parser.add_argument("--slip", type=float, default=0.02, help="шум проскальзывания для второго прогона")
+    args = parser.parse_args()
+
+    failed = False
+    for slip in (0.0, args.slip):
+        print("slip = {}".format(slip))
+        print("  {:<9} {:>17} {:>17} {:>9} {:>9}".format("scenario", "true x,y,deg", "odometry x,y,deg", "err mm", "err deg"))
+        for name, func in SCENARIOS:
+            world, odo, pos_err, head_err = run_scenario(func, slip)
+            print("  {:<9} {:>6.0f},{:>5.0f},{:>4.0f} {:>6.0f},{:>5.0f},{:>4.0f} {:>9.2f} {:>9.2f}".format(
+                name, world.x, world.y, math.degrees(world.heading),
+                odo.x, odo.y, math.degrees(odo.heading), pos_err, head_err))
+            if slip == 0.0 and (pos_err > POSITION_TOLERANCE_MM or head_err > HEADING_TOLERANCE_DEG):
+                failed = True
+
+    print("FAILED" if failed else "OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка управления скоростью колёс при разной батарее на симуляторе
+
+Одна и та же программа (прямая 60%, поворот 90/50%, прямая 95%) едет на
+sim.SimTank с инерцией мотора и трением при нескольких напряжениях батареи
+в двух режимах Robot (трение регулятору не сообщается - SPEED_DRAG_DUTY = 0,
+его компенсирует интегральная часть):
+    percent - tank.on() в %, скорость держит регулятор драйвера;
+    dps     - WheelSpeedController (град/с, поправка на напряжение).
+Для каждого участка по энкодерам во второй его половине считается
+фактическая скорость колёс; выводятся отклонение скорости на прямой,
+отношение скоростей колёс на повороте (заданное 1.80) и скорость на
+прямой 95%, которая при севшей батарее недостижима.
+
+С --model моторы симулятора и прямая связь регулятора берутся из модели
+моторов (motor_model.py) вместо MOTOR_TAU / MOTOR_DRAG.
+
+Запуск:
+    ./check_speed_control.py [--volts 8.0 7.4 6.8] [--model motors/ev3dev.json]
+Код возврата 1, если в режиме dps отношение скоростей на повороте
+отличается от заданного больше чем на RATIO_TOLERANCE.
+"""
+
+import sys
+import argparse
+
+from run import Robot, WHEEL_DIAMETER, AXLE_TRACK
+from motor_model import load_model
+from sim import SimWorld, SimTank, MAX_SPEED_DPS
+
+MOTOR_TAU = 0.08 # Постоянная времени мотора (секунды)
+MOTOR_DRAG = 4.0 # Потери на трение в режиме скважности (%)
+RATIO_TOLERANCE = 0.03 # Допустимое отклонение отношения скоростей на повороте
+PHASES = (("straight", 60, 60, 1.5), ("turn", 90, 50, 2.0), ("fast", 95, 95, 1.5))
+
+
+def run_program(volts, mode, model=None):
+    """Проехать PHASES; возвращает {участок: (левая, правая скорость в град/с)} и регулятор"""
+    world = SimWorld(WHEEL_DIAMETER, AXLE_TRACK, motor_tau=MOTOR_TAU, battery_voltage=volts, motor_drag=MOTOR_DRAG)
+    if model is not None:
+        world.apply_motor_model(model)
+    robot = Robot(tank=SimTank(world, auto_step=True), drive_mode=mode,
+                  voltage=lambda: world.battery_voltage, clock=world.clock, motor_model=model)
+
+    speeds = {}
+    for name, left, right, seconds in PHASES:
+        ticks = int(seconds / world.dt)
+        for tick in range(ticks):
+            if tick == ticks // 2:
+                start = (world.left.exact_position, world.right.exact_position, world.time)
+            robot.drive(left, right)
+        elapsed = world.time - start[2]
+        speeds[name] = ((world.left.exact_position - start[0]) / elapsed,
+                        (world.right.exact_position - start[1]) / elapsed)
+    robot.stop()
+    return speeds, robot.speed_control
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wheel speed tracking at different battery voltages")
+    parser.add_argument("--volts", type=float, nargs="+", default=[8.0, 7.4, 6.8], help="напряжения батареи (В)")
+    parser.add_argument("--model", help="файл модели моторов (motor_model.py)")
+    args = parser.parse_args()
+    model = None
+    if args.model:
+        model = load_model(path=args.model)
+        if model is None:
+            parser.error("cannot load motor model {}".format(args.model))
+
+    print("motor tau {:.2f} s, drag {:.0f}%, 100% = {:.0f} deg/s".format(MOTOR_TAU, MOTOR_DRAG, MAX_SPEED_DPS))
+    print("{:>6} {:<8} {:>14} {:>11} {:>14} {:>10}".format(
+        "volts", "mode", "straight err%", "turn ratio", "fast deg/s", "rms deg/s"))
+    failed = False
+    target_ratio = float(PHASES[1][1]) / PHASES[1][2]
+    for volts in args.volts:
+        for mode in ("percent", "dps"):
+            speeds, control = run_program(volts, mode, model)
+            left, right = speeds["straight"]
+            target = PHASES[0][1] / 100.0 * MAX_SPEED_DPS
+            straight_error = 100.0 * ((left + right) / 2.0 - target) / target
+            ratio = speeds["turn"][0] / speeds["turn"][1]
+            fast = sum(speeds["fast"]) / 2.0
+            rms = control.summary()["rms_dps"] if control is not None else None
+            print("{:>6.1f} {:<8} {:>14.1f} {:>11.2f} {:>14.0f} {:>10}".format(
+                volts, mode, straight_error, ratio, fast, "-" if rms is None else "{:.1f}".format(rms)))
+            if mode == "dps" and abs(ratio - target_ratio) / target_ratio > RATIO_TOLERANCE:
+                failed = True
+
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
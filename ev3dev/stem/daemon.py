@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Резидентный режим программы робота
+
+Датчики, моторы, кнопки и дисплей инициализируются один раз при запуске
+демона, после чего он принимает команды через локальный UNIX-сокет:
+- start [ROUTE_NAME [ROUTE_INDEX]] - запустить поездку по маршруту
+  (без аргументов маршрут берётся с сервера, как в run.py)
+- calibrate [auto] - автоматическая калибровка поворотом через линию
+  (профиль сохраняется на диск, см. calibration.py)
+- calibrate white|black - запомнить текущие показания датчиков как белое/чёрное
+- stop - прервать текущую поездку
+- status - состояние робота (в том числе паузы сборщика мусора, см. realtime.py)
+- profile - включить/выключить профилировщик (profiler.py, файл в traces/)
+- quit - остановить демон
+
+Перед каждой поездкой модуль run.py перезагружается, поэтому изменения
+констант и сценариев маршрутов применяются без перезапуска интерпретатора;
+профиль автоподбора (autotune.py) подставляется после перезагрузки.
+Клиент для отправки команд - stemctl.py
+"""
+
+import os
+import sys
+import json
+import socket
+import threading
+import time
+import importlib
+
+import run
+import calibration
+from hal import get_backend
+from traces import TRACES_DIR
+from metrics import METRICS, start_server
+from profiler import install as install_profiler
+from realtime import REALTIME
+
+SOCKET_PATH = "/tmp/stem.sock" # Путь к UNIX-сокету демона
+MAX_COMMAND_LEN = 1024 # Максимальная длина строки команды (байт)
+
+
+class DaemonRunning(Exception):
+    """На сокете уже отвечает работающий демон"""
+
+
+def claim_socket(socket_path):
+    """
+    Убрать сокет, оставшийся от упавшего демона
+    Если на сокете отвечает работающий демон - DaemonRunning: второй демон
+    отнял бы сокет, и первый остался бы без команд
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except FileNotFoundError:
+        return
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise DaemonRunning("daemon already running on {}".format(socket_path))
+
+
+class StemDaemon(object):
+    """Держит устройства робота и выполняет поездки по командам клиента"""
+    def __init__(self, socket_path=SOCKET_PATH):
+        self.socket_path = socket_path
+        self.button = get_backend().buttons()
+        self.robot = run.Robot()
+        self.follower = run.LineFollower()
+        self.display = run.DisplayUpdater()
+        self.profiler = install_profiler(self.button)
+
+        self.lock = threading.Lock()
+        self.cancel = threading.Event()
+        self.trip = None
+        self.route_name = ""
+        self.last_result = ""
+        self.last_events = []
+        self.last_recovery = None
+        self.running = False
+
+        # Объекты инициализации - в постоянное поколение сборщика (run.MANUAL_GC)
+        REALTIME.after_init(run.MANUAL_GC)
+
+    def handle(self, line):
+        """Выполнить команду и вернуть ответ (словарь)"""
+        parts = line.split()
+        if not parts:
+            return {"ok": False, "error": "empty command"}
+
+        command, args = parts[0].lower(), parts[1:]
+        if command == "start":
+            return self.start(args)
+        if command == "stop":
+            return self.stop()
+        if command == "calibrate":
+            return self.calibrate(args)
+        if command == "status":
+            return self.status()
+        if command == "profile":
+            # Переключение асинхронное: ответ - состояние, в которое профилировщик перейдёт
+            active = not self.profiler.active
+            self.profiler.toggle()
+            return {"ok": True, "profiling": active, "last_file": self.profiler.last_path}
+        if command == "quit":
+            self.stop()
+            self.running = False
+            return {"ok": True}
+        return {"ok": False, "error": "unknown command: {}".format(command)}
+
+    def is_busy(self):
+        """Выполняется ли сейчас поездка"""
+        return self.trip is not None and self.trip.is_alive()
+
+    def start(self, args):
+        """Запустить поездку в отдельном потоке"""
+        with self.lock:
+            if self.is_busy():
+                return {"ok": False, "error": "trip in progress: {}".format(self.route_name)}
+
+            # Подхватываем изменения в run.py без повторной инициализации устройств
+            try:
+                importlib.reload(run)
+                run.apply_tuning()
+            except Exception as e:
+                return {"ok": False, "error": "reload failed: {}".format(e)}
+
+            route_name = args[0][:15] if args else ""
+            route_index = None
+            if len(args) > 1:
+                try:
+                    route_index = int(args[1])
+                except ValueError:
+                    return {"ok": False, "error": "bad route index: {}".format(args[1])}
+
+            self.cancel.clear()
+            self.route_name = route_name
+            self.last_result = ""
+            self.trip = threading.Thread(target=self._trip, args=(route_name, route_index))
+            self.trip.daemon = True
+            self.trip.start()
+            return {"ok": True, "route": route_name}
+
+    def stop(self):
+        """Прервать текущую поездку"""
+        self.cancel.set()
+        trip = self.trip
+        if trip is not None:
+            trip.join(timeout=5.0)
+        self.robot.stop()
+        return {"ok": True, "stopped": trip is not None and not trip.is_alive()}
+
+    def calibrate(self, args):
+        """Автоматическая калибровка или запоминание текущих показаний как белого/чёрного"""
+        if self.is_busy():
+            return {"ok": False, "error": "trip in progress"}
+
+        mode = args[0] if args else "auto"
+        if mode == "auto":
+            try:
+                profile = calibration.sweep_calibrate(self.robot, self.follower)
+            except calibration.CalibrationError as e:
+                return {"ok": False, "error": str(e)}
+            path = calibration.save_profile(profile)
+            return {"ok": True, "profile": profile, "path": path}
+
+        if mode not in ("white", "black"):
+            return {"ok": False, "error": "usage: calibrate [auto|white|black]"}
+
+        l_raw = int(self.follower.left.value())
+        r_raw = int(self.follower.right.value())
+        f = self.follower
+        if mode == "white":
+            f.set_calibration(f.l_black, l_raw, f.r_black, r_raw)
+        else:
+            f.set_calibration(l_raw, f.l_white, r_raw, f.r_white)
+        return {"ok": True, "left": l_raw, "right": r_raw}
+
+    def status(self):
+        """Текущее состояние робота и дисплея"""
+        with self.display.lock:
+            display_status = self.display.status
+            intersections = self.display.intersections
+            total = self.display.total
+
+        return {
+            "ok": True,
+            "busy": self.is_busy(),
+            "route": self.route_name,
+            "status": display_status,
+            "intersections": intersections,
+            "total": total,
+            "last_result": self.last_result,
+            "events": [
+                {"index": e.index, "position": e.position, "confidence": round(e.confidence, 2), "width": e.width}
+                for e in self.last_events
+            ],
+            "recovery": self.last_recovery.summary() if self.last_recovery is not None else None,
+            "speed": self.robot.speed_control.summary() if self.robot.speed_control is not None else None,
+            "profiler": self.profiler.summary(),
+            "realtime": dict(REALTIME.summary(),
+                             loop_max_interval_ms=round(1000.0 * METRICS.loop_max.value, 2)),
+            "calibration": {
+                "l_white": self.follower.l_white,
+                "l_black": self.follower.l_black,
+                "r_white": self.follower.r_white,
+                "r_black": self.follower.r_black,
+            },
+        }
+
+    def _trip(self, route_name, route_index):
+        """Одна поездка: повторяет шаги основного цикла run.main()"""
+        try:
+            if not route_name:
+                routes = run.fetch_routes(run.SERVER_IP)
+                route_index, leader_route = run.get_leader(routes)
+                if not leader_route:
+                    self.last_result = "no routes"
+                    return
+                route_name = str(leader_route.get("name", "Unknown"))[:15]
+                route_index = leader_route.get("index", route_index)
+                self.route_name = route_name
+
+            if route_index is not None:
+                run.reset_route(run.SERVER_IP, route_index)
+
+            recovery = run.LineRecovery(self.robot, self.follower, run.LINE_LOST_DEGREES, run.RECOVERY_SPEED,
+                                        run.RECOVERY_SWEEP_DEGREES, run.RECOVERY_SWEEPS)
+            self.last_recovery = recovery
+            speed_control = self.robot.speed_control
+            if speed_control is not None:
+                speed_control.reset_log()
+            self.display.start()
+            try:
+                self.last_events = run.movement(self.robot, self.follower, self.display, self.button,
+                                                route_name, cancel=self.cancel, recovery=recovery) or []
+            finally:
+                self.display.stop()
+                self.robot.stop()
+                if speed_control is not None:
+                    # Журнал скорости колёс поездки - рядом с записями датчиков
+                    speed_control.save(os.path.join(TRACES_DIR, "speed_{}.csv".format(time.strftime("%Y%m%d_%H%M%S"))))
+
+            if self.cancel.is_set():
+                self.last_result = "cancelled"
+            else:
+                self.last_result = "line lost" if recovery.failed else "finished"
+            self.display.draw_status("Finished", run.SERVER_IP)
+        except Exception as e:
+            self.last_result = "error: {}".format(e)
+            self.robot.stop()
+            METRICS.error("trip")
+            if METRICS.driving.value:
+                METRICS.trip_finished("error", time.monotonic())
+            REALTIME.trip_finished()
+
+    def serve(self):
+        """Принимать команды на UNIX-сокете до команды quit"""
+        claim_socket(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(4)
+        server.settimeout(1.0)
+        self.running = True
+        metrics_server = start_server(run.METRICS_PORT) if run.METRICS_PORT else None
+        self.display.draw_status("Daemon ready", run.SERVER_IP)
+
+        try:
+            while self.running:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    conn.settimeout(2.0)
+                    try:
+                        line = conn.recv(MAX_COMMAND_LEN).decode("utf-8", "replace").strip()
+                        reply = self.handle(line)
+                    except Exception as e:
+                        reply = {"ok": False, "error": str(e)}
+                    try:
+                        conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+                    except OSError:
+                        pass
+        finally:
+            self.cancel.set()
+            self.robot.stop()
+            server.close()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def main():
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else SOCKET_PATH
+    try:
+        # До инициализации моторов: второй демон не должен их трогать
+        claim_socket(socket_path)
+        StemDaemon(socket_path).serve()
+    except DaemonRunning as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
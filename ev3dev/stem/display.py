@@ -4,13 +4,11 @@
 import time
 import threading
 
-from ev3dev2.display import Display
-
 
 class DisplayUpdater(object):
     """Обновление дисплея в отдельном потоке для неблокирующей работы"""
-    def __init__(self, display=Display()):
-        self.display = display
+    def __init__(self, display=None):
+        self._display = display
         self.lock = threading.Lock()
         self.status = ""
         self.ip = ""
@@ -20,6 +18,14 @@ class DisplayUpdater(object):
         self.running = False
         self.thread = None
 
+    @property
+    def display(self):
+        """Дисплей EV3 из бэкенда HAL (framebuffer открывается при первом обращении)"""
+        if self._display is None:
+            from hal import get_backend
+            self._display = get_backend().display()
+        return self._display
+
     def start(self):
         """Запустить поток обновления дисплея"""
         self.running = True
@@ -78,6 +84,22 @@ class DisplayUpdater(object):
 
         self.display.update()
 
+    def draw_frame(self, status, ip, intersections=0, total=0, route_name=""):
+        """Один кадр потока обновления (отдельно - для бенчмарка отрисовки)"""
+        self.display.clear()
+        self.display.text_grid("Connected: OK ({})".format(ip), x=0, y=0, clear_screen=False)
+
+        self.display.text_grid("STATUS: {}".format(status), x=0, y=2, clear_screen=False, font="charB12")
+
+        if intersections > 0 or total > 0:
+            self.display.text_grid("Intersections: {}/{}".format(intersections, total),
+                             x=0, y=4, clear_screen=False)
+
+        if route_name:
+            self.display.text_grid("Route: {}".format(route_name[:15]), x=0, y=6, clear_screen=False)
+
+        self.display.update()
+
     def _update_loop(self):
         """Цикл обновления дисплея в отдельном потоке"""
         while self.running:
@@ -89,17 +111,5 @@ class DisplayUpdater(object):
                 route_name = self.route_name
 
             # Обновление дисплея (медленная операция)
-            self.display.clear()
-            self.display.text_grid("Connected: OK ({})".format(ip), x=0, y=0, clear_screen=False)
-
-            self.display.text_grid("STATUS: {}".format(status), x=0, y=2, clear_screen=False, font="charB12")
-
-            if intersections > 0 or total > 0:
-                self.display.text_grid("Intersections: {}/{}".format(intersections, total),
-                                     x=0, y=4, clear_screen=False)
-
-            if route_name:
-                self.display.text_grid("Route: {}".format(route_name[:15]), x=0, y=6, clear_screen=False)
-
-            self.display.update()
+            self.draw_frame(status, ip, intersections, total, route_name)
             time.sleep(0.3)  # Обновляем дисплей ~3 раза в секунду
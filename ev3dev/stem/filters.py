@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Фильтры показаний датчиков для такта управления
+
+Все буферы выделяются один раз в конструкторе, update() только перезаписывает
+элементы списков, поэтому в такте не создаются новые контейнеры. Значения на
+входе и выходе - целые сырые показания (0..100), чтобы результат можно было
+сразу использовать как индекс в таблицах LineFollower.
+
+Фильтр задаётся строкой (см. make_filter):
+- "none" - без фильтра
+- "median:N" - скользящая медиана по N последним значениям (N нечётное)
+- "ema:A" - экспоненциальное сглаживание с коэффициентом A (0..1]
+"""
+
+
+class MedianFilter(object):
+    """Скользящая медиана на кольцевом буфере"""
+    def __init__(self, size=3):
+        if size < 1 or size % 2 == 0:
+            raise ValueError("median window must be odd and positive: {}".format(size))
+        self.size = size
+        self.ring = [0] * size # значения в порядке поступления
+        self.window = [0] * size # те же значения, отсортированные
+        self.pos = 0
+        self.count = 0
+
+    def reset(self):
+        self.pos = 0
+        self.count = 0
+
+    def update(self, x):
+        """Добавить значение и вернуть медиану окна"""
+        window = self.window
+        count = self.count
+
+        if count < self.size:
+            # Окно ещё не заполнено: вставка без удаления
+            i = count
+            self.count = count + 1
+        else:
+            # Удаляем самое старое значение из отсортированного окна
+            old = self.ring[self.pos]
+            i = window.index(old)
+            while i < count - 1:
+                window[i] = window[i + 1]
+                i += 1
+
+        # Вставка нового значения сдвигом (окно остаётся отсортированным)
+        while i > 0 and window[i - 1] > x:
+            window[i] = window[i - 1]
+            i -= 1
+        window[i] = x
+
+        self.ring[self.pos] = x
+        self.pos = (self.pos + 1) % self.size
+        return window[(self.count - 1) // 2]
+
+
+class EmaFilter(object):
+    """Экспоненциальное сглаживание: y += alpha * (x - y)"""
+    def __init__(self, alpha=0.5):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("ema alpha must be in (0, 1]: {}".format(alpha))
+        self.alpha = alpha
+        self.value = None
+
+    def reset(self):
+        self.value = None
+
+    def update(self, x):
+        """Добавить значение и вернуть сглаженное (округлённое до целого)"""
+        if self.value is None:
+            self.value = float(x)
+        else:
+            self.value += self.alpha * (x - self.value)
+        return int(self.value + 0.5)
+
+
+class Hysteresis(object):
+    """
+    Пороговый детектор с гистерезисом для сырых значений 0..size-1:
+    включается ниже low, выключается при значении не ниже high.
+    Пороги заранее развёрнуты в таблицы, такт - два обращения по индексу
+    """
+    def __init__(self, low, high, size=256):
+        if low > high:
+            raise ValueError("hysteresis low > high: {} > {}".format(low, high))
+        self.low = low
+        self.high = high
+        self.enter = tuple(raw < low for raw in range(size))
+        self.exit = tuple(raw >= high for raw in range(size))
+        self.state = False
+
+    def reset(self):
+        self.state = False
+
+    def update(self, x):
+        """Обновить состояние по значению x и вернуть его"""
+        if self.state:
+            if self.exit[x]:
+                self.state = False
+        elif self.enter[x]:
+            self.state = True
+        return self.state
+
+
+def make_filter(spec):
+    """Создать фильтр по строковому описанию; для "none" возвращает None"""
+    name, _, arg = str(spec or "none").strip().lower().partition(":")
+    if name == "none":
+        return None
+    if name == "median":
+        return MedianFilter(int(arg or 3))
+    if name == "ema":
+        return EmaFilter(float(arg or 0.5))
+    raise ValueError("unknown filter: {}".format(spec))
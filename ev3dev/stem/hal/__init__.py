@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+"""
+Слой абстракции оборудования (HAL)
+
+Один интерфейс привода, датчиков, кнопок и дисплея поверх разных бэкендов:
+    ev3dev2 - библиотека ev3dev2 (по умолчанию на роботе);
+    ev3dev  - старая библиотека ev3dev.ev3 (скорости в градусах/сек);
+    sysfs   - файлы драйверов /sys/class/... напрямую, без библиотеки;
+    sim     - симулятор sim.py (трасса-круг, модельное время).
+Бэкенд выбирается переменной окружения STEM_BACKEND или аргументом
+get_backend(); модуль бэкенда импортируется только при выборе.
+
+Привод (base.Tank) повторяет используемую часть ev3dev2 MoveTank и
+передаётся в run.Robot(tank=...); скорости в процентах переводятся в
+единицы мотора, а повторная команда с той же уставкой не пишется
+в устройство (write elision) - это общее для всех бэкендов.
+"""
+
+import os
+import importlib
+
+BACKENDS = {
+    "ev3dev2": "hal.ev3dev2_backend",
+    "ev3dev": "hal.ev3dev_backend",
+    "sysfs": "hal.sysfs",
+    "sim": "hal.simulated",
+}
+DEFAULT_BACKEND = os.environ.get("STEM_BACKEND", "ev3dev2") # Бэкенд по умолчанию
+
+_backend = None # Бэкенд процесса (get_backend)
+
+
+def open_backend(name=None, **kwargs):
+    """Создать новый бэкенд по имени (ValueError для неизвестного имени)"""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError("unknown backend '{}', expected one of: {}".format(name, ", ".join(sorted(BACKENDS))))
+    return importlib.import_module(BACKENDS[name]).Backend(**kwargs)
+
+
+def get_backend():
+    """Общий бэкенд процесса (создаётся при первом обращении)"""
+    global _backend
+    if _backend is None:
+        _backend = open_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Подменить общий бэкенд (симулятор, бенчмарки)"""
+    global _backend
+    _backend = backend
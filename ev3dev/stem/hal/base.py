@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""Общие части бэкендов: привод с пропуском повторных команд, заглушки кнопок и дисплея"""
+
+import time
+
+DEFAULT_MAX_SPEED = 1050 # Скорость LargeMotor при 100% (градусы/сек), если мотор её не сообщает
+
+
+def port_name(port):
+    """Короткое имя порта: 'outC', 'ev3-ports:outC', OUTPUT_C -> 'C'; 'in2' -> '2'"""
+    return str(port)[-1].upper()
+
+
+class Tank(object):
+    """
+    Привод из двух моторов с интерфейсом ev3dev2 MoveTank (on, off,
+    on_for_degrees, is_running, left_motor/right_motor.position)
+    Бэкенд реализует _run_forever, _stop, _run_degrees и is_running
+    """
+    def __init__(self, left_motor, right_motor, left_max=DEFAULT_MAX_SPEED, right_max=DEFAULT_MAX_SPEED, elide=True):
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.left_max = left_max
+        self.right_max = right_max
+        self.elide = elide # пропускать повторные уставки и команду run-forever / run-direct
+        self._speeds = None # последние записанные уставки run-forever (единицы мотора)
+        self._duties = None # последние записанные скважности run-direct (%)
+        self.writes = 0
+        self.elided = 0
+
+    def on(self, left_speed, right_speed):
+        """Непрерывное движение, скорости в % от максимальной"""
+        speeds = (int(round(left_speed * self.left_max / 100.0)), int(round(right_speed * self.right_max / 100.0)))
+        if self.elide and speeds == self._speeds:
+            self.elided += 1
+            return
+        self.writes += 1
+        # Без пропуска повторов - как MoveTank.on(): уставки и команда пишутся каждый раз
+        self._run_forever(speeds[0], speeds[1], self._speeds if self.elide else None)
+        self._speeds = speeds
+        self._duties = None
+
+    def on_duty(self, left_duty, right_duty):
+        """Скважность в % (run-direct): без регулятора скорости драйвера"""
+        duties = (int(round(max(-100.0, min(100.0, left_duty)))), int(round(max(-100.0, min(100.0, right_duty)))))
+        if self.elide and duties == self._duties:
+            self.elided += 1
+            return
+        self.writes += 1
+        self._run_direct(duties[0], duties[1], self._duties if self.elide else None)
+        self._duties = duties
+        self._speeds = None
+
+    def off(self, brake=True):
+        self._speeds = None
+        self._duties = None
+        self._stop(brake)
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        """Как в ev3dev2: быстрый мотор проходит degrees, медленный - пропорционально"""
+        self._speeds = None
+        self._duties = None
+        fastest = max(abs(left_speed), abs(right_speed))
+        if fastest == 0 or degrees == 0:
+            return
+        left_degrees = degrees * left_speed / float(fastest)
+        right_degrees = degrees * right_speed / float(fastest)
+        self._run_degrees(int(round(abs(left_speed) * self.left_max / 100.0)),
+                          int(round(abs(right_speed) * self.right_max / 100.0)),
+                          int(round(left_degrees)), int(round(right_degrees)), brake)
+        if block:
+            self.wait_idle()
+
+    def wait_idle(self, poll=0.005):
+        """Дождаться окончания движения on_for_degrees"""
+        while self.is_running:
+            time.sleep(poll)
+
+    # --- реализуются бэкендом ---
+
+    def _run_forever(self, left_sp, right_sp, previous):
+        """Записать уставки скорости; previous - прошлые уставки или None после остановки"""
+        raise NotImplementedError
+
+    def _run_direct(self, left_duty, right_duty, previous):
+        """Записать скважности; previous - прошлые скважности или None при смене режима"""
+        raise NotImplementedError
+
+    def _stop(self, brake):
+        raise NotImplementedError
+
+    def _run_degrees(self, left_sp, right_sp, left_degrees, right_degrees, brake):
+        raise NotImplementedError
+
+    @property
+    def is_running(self):
+        raise NotImplementedError
+
+
+class NullButtons(object):
+    """Кнопки без устройства: все отпущены (атрибуты можно выставлять вручную)"""
+    up = down = left = right = enter = backspace = False
+
+    @property
+    def buttons_pressed(self):
+        return [name for name in ("up", "down", "left", "right", "enter", "backspace") if getattr(self, name)]
+
+    def any(self):
+        return bool(self.buttons_pressed)
+
+
+class NullDisplay(object):
+    """Дисплей без вывода (симулятор, робот без framebuffer-библиотеки)"""
+    def clear(self):
+        pass
+
+    def text_grid(self, text, clear_screen=True, x=0, y=0, text_color="black", font=None):
+        pass
+
+    def update(self):
+        pass
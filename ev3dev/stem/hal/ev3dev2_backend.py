@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""Бэкенд ev3dev2: моторы LargeMotor, ColorSensor, кнопки по событиям, Display"""
+
+from hal.base import Tank, port_name
+
+
+class Ev3dev2Tank(Tank):
+    """
+    Привод на двух LargeMotor: уставка скорости пишется в speed_sp, а команда
+    run-forever - только при старте (для работающего run-forever новая
+    уставка действует сразу), поэтому такт с новой скоростью - две записи вместо четырёх
+    """
+    def __init__(self, left_port, right_port, elide=True):
+        from ev3dev2.motor import MoveTank
+
+        self.move_tank = MoveTank(left_port, right_port)
+        left, right = self.move_tank.left_motor, self.move_tank.right_motor
+        Tank.__init__(self, left, right, left.max_speed, right.max_speed, elide)
+
+    def _run_forever(self, left_sp, right_sp, previous):
+        for motor, sp, old in ((self.left_motor, left_sp, previous and previous[0]),
+                               (self.right_motor, right_sp, previous and previous[1])):
+            if previous is None:
+                motor.run_forever(speed_sp=sp)
+            elif sp != old:
+                motor.speed_sp = sp
+
+    def _run_direct(self, left_duty, right_duty, previous):
+        for motor, duty, old in ((self.left_motor, left_duty, previous and previous[0]),
+                                 (self.right_motor, right_duty, previous and previous[1])):
+            if previous is None:
+                motor.run_direct(duty_cycle_sp=duty)
+            elif duty != old:
+                motor.duty_cycle_sp = duty
+
+    def _stop(self, brake):
+        self.move_tank.off(brake=brake)
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        # Поведение (пропорция скоростей, ожидание) - как у библиотеки
+        self._speeds = None
+        self._duties = None
+        self.move_tank.on_for_degrees(left_speed, right_speed, degrees, brake=brake, block=block)
+
+    @property
+    def is_running(self):
+        return self.move_tank.is_running
+
+
+class Backend(object):
+    name = "ev3dev2"
+
+    def __init__(self):
+        self._power = None
+
+    def _port(self, module, prefix, port):
+        return getattr(module, prefix + port_name(port))
+
+    def tank(self, left_port="C", right_port="B", elide=True):
+        import ev3dev2.motor
+
+        return Ev3dev2Tank(self._port(ev3dev2.motor, "OUTPUT_", left_port),
+                           self._port(ev3dev2.motor, "OUTPUT_", right_port), elide)
+
+    def color_sensor(self, port):
+        import ev3dev2.sensor
+        from ev3dev2.sensor.lego import ColorSensor
+
+        return ColorSensor(self._port(ev3dev2.sensor, "INPUT_", port))
+
+    def battery_voltage(self):
+        """Напряжение батареи (В)"""
+        if self._power is None:
+            from ev3dev2.power import PowerSupply
+
+            self._power = PowerSupply()
+        return self._power.measured_volts
+
+    def buttons(self):
+        from buttons import open_buttons
+
+        return open_buttons()
+
+    def display(self):
+        from ev3dev2.display import Display
+
+        return Display()
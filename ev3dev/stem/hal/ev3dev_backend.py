@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Бэкенд старой библиотеки ev3dev.ev3 (как в check_ev3dev/)
+
+Моторы управляются в градусах/сек (speed_sp), проценты переводятся по
+max_speed мотора. Screen не умеет text_grid, поэтому дисплей обёрнут
+в ScreenDisplay с той же сеткой символов, что у ev3dev2 Display.
+"""
+
+from hal.base import Tank, NullButtons, port_name
+
+CHAR_WIDTH = 8 # Ширина ячейки сетки текста (пиксели)
+CHAR_HEIGHT = 10 # Высота ячейки сетки текста (пиксели)
+
+
+class Ev3devTank(Tank):
+    """Привод на двух ev3dev.ev3 LargeMotor"""
+    def __init__(self, left_port, right_port, elide=True):
+        from ev3dev.ev3 import LargeMotor
+
+        left, right = LargeMotor(left_port), LargeMotor(right_port)
+        if not left.connected or not right.connected:
+            raise RuntimeError("Motors must be connected to {} and {}".format(left_port, right_port))
+        Tank.__init__(self, left, right, left.max_speed, right.max_speed, elide)
+
+    def _run_forever(self, left_sp, right_sp, previous):
+        for motor, sp, old in ((self.left_motor, left_sp, previous and previous[0]),
+                               (self.right_motor, right_sp, previous and previous[1])):
+            if previous is None:
+                motor.run_forever(speed_sp=sp)
+            elif sp != old:
+                motor.speed_sp = sp
+
+    def _run_direct(self, left_duty, right_duty, previous):
+        for motor, duty, old in ((self.left_motor, left_duty, previous and previous[0]),
+                                 (self.right_motor, right_duty, previous and previous[1])):
+            if previous is None:
+                motor.run_direct(duty_cycle_sp=duty)
+            elif duty != old:
+                motor.duty_cycle_sp = duty
+
+    def _stop(self, brake):
+        action = "brake" if brake else "coast"
+        self.left_motor.stop(stop_action=action)
+        self.right_motor.stop(stop_action=action)
+
+    def _run_degrees(self, left_sp, right_sp, left_degrees, right_degrees, brake):
+        action = "brake" if brake else "coast"
+        for motor, sp, degrees in ((self.left_motor, left_sp, left_degrees), (self.right_motor, right_sp, right_degrees)):
+            if sp and degrees:
+                motor.run_to_rel_pos(position_sp=degrees, speed_sp=sp, stop_action=action)
+
+    @property
+    def is_running(self):
+        return "running" in self.left_motor.state or "running" in self.right_motor.state
+
+
+class ScreenDisplay(object):
+    """ev3dev.ev3 Screen с методами ev3dev2 Display, которые использует display.py"""
+    def __init__(self, screen):
+        self.screen = screen
+
+    def clear(self):
+        self.screen.clear()
+
+    def text_grid(self, text, clear_screen=True, x=0, y=0, text_color="black", font=None):
+        if clear_screen:
+            self.screen.clear()
+        self.screen.draw.text((x * CHAR_WIDTH, y * CHAR_HEIGHT), text, fill=text_color)
+
+    def update(self):
+        self.screen.update()
+
+
+class Backend(object):
+    name = "ev3dev"
+
+    def __init__(self):
+        self._power = None
+
+    def _port(self, prefix, port):
+        import ev3dev.ev3
+
+        return getattr(ev3dev.ev3, prefix + port_name(port))
+
+    def tank(self, left_port="C", right_port="B", elide=True):
+        return Ev3devTank(self._port("OUTPUT_", left_port), self._port("OUTPUT_", right_port), elide)
+
+    def color_sensor(self, port):
+        from ev3dev.ev3 import ColorSensor
+
+        return ColorSensor(self._port("INPUT_", port))
+
+    def battery_voltage(self):
+        """Напряжение батареи (В)"""
+        if self._power is None:
+            from ev3dev.ev3 import PowerSupply
+
+            self._power = PowerSupply()
+        return self._power.measured_volts
+
+    def buttons(self):
+        from buttons import ButtonService
+
+        try:
+            return ButtonService()
+        except (IOError, OSError):
+            return NullButtons()
+
+    def display(self):
+        from ev3dev.ev3 import Screen
+
+        return ScreenDisplay(Screen())
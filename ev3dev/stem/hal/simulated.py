@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Бэкенд симулятора: привод sim.SimWorld и датчики над кругом sim.lap_line()
+
+Каждая команда on() (в том числе пропущенная как повторная) продвигает
+модель на один такт, как SimTank(auto_step=True), поэтому movement() идёт
+в модельном времени; источник времени - backend.world.clock.
+"""
+
+from hal.base import Tank, NullButtons, NullDisplay, DEFAULT_MAX_SPEED
+
+
+class SimulatedTank(Tank):
+    """Привод поверх sim.SimTank с уставками в единицах мотора, как на роботе"""
+    def __init__(self, sim_tank, elide=True):
+        self.sim_tank = sim_tank
+        Tank.__init__(self, sim_tank.left_motor, sim_tank.right_motor, elide=elide)
+
+    def on(self, left_speed, right_speed):
+        Tank.on(self, left_speed, right_speed)
+        if self.sim_tank.auto_step:
+            self.sim_tank.world.step()
+
+    def _run_forever(self, left_sp, right_sp, previous):
+        for motor, sp in ((self.left_motor, left_sp), (self.right_motor, right_sp)):
+            motor.target = None
+            motor.duty = None
+            motor.speed = sp * 100.0 / DEFAULT_MAX_SPEED
+
+    def on_duty(self, left_duty, right_duty):
+        Tank.on_duty(self, left_duty, right_duty)
+        if self.sim_tank.auto_step:
+            self.sim_tank.world.step()
+
+    def _run_direct(self, left_duty, right_duty, previous):
+        for motor, duty in ((self.left_motor, left_duty), (self.right_motor, right_duty)):
+            motor.target = None
+            motor.speed = 0.0
+            motor.duty = float(duty)
+
+    def _stop(self, brake):
+        self.sim_tank.off(brake)
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        self._speeds = None
+        self._duties = None
+        self.sim_tank.on_for_degrees(left_speed, right_speed, degrees, brake, block)
+
+    @property
+    def is_running(self):
+        return self.sim_tank.is_running
+
+
+class Backend(object):
+    name = "sim"
+
+    def __init__(self, world=None, line=None, auto_step=True, **world_options):
+        from sim import SimWorld, SimLine, lap_line
+
+        if world is None:
+            world = SimWorld(**world_options)
+        if line is None:
+            segments, _, _ = lap_line()
+            line = SimLine(segments)
+            world.place(200.0, 0.0, 0.0) # начало нижней стороны круга
+        self.world = world
+        self.line = line
+        self.auto_step = auto_step
+        self._sensors = None
+
+    def tank(self, left_port="C", right_port="B", elide=True):
+        from sim import SimTank
+
+        return SimulatedTank(SimTank(self.world, self.auto_step), elide)
+
+    def color_sensor(self, port):
+        from sim import line_sensors
+
+        # Порт 2 - датчик левого канала, порт 3 - правого (как в run.LineFollower)
+        if self._sensors is None:
+            self._sensors = line_sensors(self.world, self.line)
+        return self._sensors[0] if str(port)[-1] == "2" else self._sensors[1]
+
+    def battery_voltage(self):
+        return self.world.battery_voltage
+
+    def buttons(self):
+        return NullButtons()
+
+    def display(self):
+        return NullDisplay()
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+Бэкенд без библиотек: файлы драйверов ev3dev в /sys/class напрямую
+
+Устройства ищутся по файлу address (ev3-ports:outC, ev3-ports:in2). Файлы
+атрибутов, которые читаются и пишутся в такте (speed_sp, duty_cycle_sp,
+command, position, state, value0), открываются один раз; чтение - один pread, запись - один
+pwrite, без open/seek/close и разбора в библиотеке.
+
+make_fake_sysfs() создаёт дерево с теми же файлами в каталоге для проверок
+вне робота (Backend(root=...)).
+"""
+
+import os
+
+from hal.base import Tank, port_name
+
+SYSFS_ROOT = "/sys/class" # Корень классов устройств
+
+
+def _find_device(root, device_class, address_suffix):
+    """Каталог устройства, у которого address заканчивается на address_suffix"""
+    class_dir = os.path.join(root, device_class)
+    for name in sorted(os.listdir(class_dir)):
+        path = os.path.join(class_dir, name)
+        try:
+            with open(os.path.join(path, "address")) as f:
+                if f.read().strip().endswith(address_suffix):
+                    return path
+        except (IOError, OSError):
+            continue
+    raise IOError("no {} device at {}".format(device_class, address_suffix))
+
+
+class Attribute(object):
+    """Открытый файл атрибута: чтение и запись с начала файла"""
+    __slots__ = ("fd",)
+
+    def __init__(self, path, writable=False):
+        self.fd = os.open(path, os.O_RDWR if writable else os.O_RDONLY)
+
+    def read(self):
+        return os.pread(self.fd, 64, 0).decode("ascii").strip()
+
+    def read_int(self):
+        return int(os.pread(self.fd, 32, 0))
+
+    def write(self, value):
+        os.pwrite(self.fd, str(value).encode("ascii"), 0)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SysfsMotor(object):
+    """tacho-motor: атрибуты, нужные приводу"""
+    def __init__(self, path):
+        self.path = path
+        self._speed_sp = Attribute(os.path.join(path, "speed_sp"), True)
+        self._duty_cycle_sp = Attribute(os.path.join(path, "duty_cycle_sp"), True)
+        self._command = Attribute(os.path.join(path, "command"), True)
+        self._position = Attribute(os.path.join(path, "position"))
+        self._state = Attribute(os.path.join(path, "state"))
+        self._position_sp = Attribute(os.path.join(path, "position_sp"), True)
+        self._stop_action = Attribute(os.path.join(path, "stop_action"), True)
+        with open(os.path.join(path, "max_speed")) as f:
+            self.max_speed = int(f.read())
+
+    @property
+    def position(self):
+        return self._position.read_int()
+
+    @property
+    def state(self):
+        return self._state.read().split()
+
+    def run_forever(self, speed_sp):
+        self._speed_sp.write(speed_sp)
+        self._command.write("run-forever")
+
+    def set_speed(self, speed_sp):
+        self._speed_sp.write(speed_sp)
+
+    def run_direct(self, duty_cycle_sp):
+        self._duty_cycle_sp.write(duty_cycle_sp)
+        self._command.write("run-direct")
+
+    def set_duty(self, duty_cycle_sp):
+        self._duty_cycle_sp.write(duty_cycle_sp)
+
+    def run_to_rel_pos(self, position_sp, speed_sp, stop_action):
+        self._stop_action.write(stop_action)
+        self._speed_sp.write(speed_sp)
+        self._position_sp.write(position_sp)
+        self._command.write("run-to-rel-pos")
+
+    def stop(self, stop_action):
+        self._stop_action.write(stop_action)
+        self._command.write("stop")
+
+
+class SysfsTank(Tank):
+    """Привод на двух SysfsMotor; run-forever пишется только при старте движения"""
+    def __init__(self, left_motor, right_motor, elide=True):
+        Tank.__init__(self, left_motor, right_motor, left_motor.max_speed, right_motor.max_speed, elide)
+
+    def _run_forever(self, left_sp, right_sp, previous):
+        if previous is None:
+            self.left_motor.run_forever(left_sp)
+            self.right_motor.run_forever(right_sp)
+            return
+        if left_sp != previous[0]:
+            self.left_motor.set_speed(left_sp)
+        if right_sp != previous[1]:
+            self.right_motor.set_speed(right_sp)
+
+    def _run_direct(self, left_duty, right_duty, previous):
+        if previous is None:
+            self.left_motor.run_direct(left_duty)
+            self.right_motor.run_direct(right_duty)
+            return
+        if left_duty != previous[0]:
+            self.left_motor.set_duty(left_duty)
+        if right_duty != previous[1]:
+            self.right_motor.set_duty(right_duty)
+
+    def _stop(self, brake):
+        action = "brake" if brake else "coast"
+        self.left_motor.stop(action)
+        self.right_motor.stop(action)
+
+    def _run_degrees(self, left_sp, right_sp, left_degrees, right_degrees, brake):
+        action = "brake" if brake else "coast"
+        for motor, sp, degrees in ((self.left_motor, left_sp, left_degrees), (self.right_motor, right_sp, right_degrees)):
+            if sp and degrees:
+                motor.run_to_rel_pos(degrees, sp, action)
+
+    @property
+    def is_running(self):
+        return "running" in self.left_motor.state or "running" in self.right_motor.state
+
+
+class SysfsSensor(object):
+    """lego-sensor: mode (пишется только при смене) и value0 одним pread"""
+    def __init__(self, path):
+        self.path = path
+        self._mode = Attribute(os.path.join(path, "mode"), True)
+        self._values = {}
+        self._current_mode = self._mode.read()
+
+    @property
+    def mode(self):
+        return self._current_mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode != self._current_mode:
+            self._mode.write(mode)
+            self._current_mode = mode
+
+    def value(self, n=0):
+        attribute = self._values.get(n)
+        if attribute is None:
+            attribute = self._values[n] = Attribute(os.path.join(self.path, "value{}".format(n)))
+        return attribute.read_int()
+
+
+class Backend(object):
+    name = "sysfs"
+
+    def __init__(self, root=SYSFS_ROOT):
+        self.root = root
+        self._voltage = None
+
+    def tank(self, left_port="C", right_port="B", elide=True):
+        left = SysfsMotor(_find_device(self.root, "tacho-motor", "out" + port_name(left_port)))
+        right = SysfsMotor(_find_device(self.root, "tacho-motor", "out" + port_name(right_port)))
+        return SysfsTank(left, right, elide)
+
+    def color_sensor(self, port):
+        return SysfsSensor(_find_device(self.root, "lego-sensor", "in" + port_name(port)))
+
+    def battery_voltage(self):
+        """Напряжение батареи (В) из power_supply/*/voltage_now (мкВ)"""
+        if self._voltage is None:
+            class_dir = os.path.join(self.root, "power_supply")
+            for name in sorted(os.listdir(class_dir)):
+                path = os.path.join(class_dir, name, "voltage_now")
+                if os.path.exists(path):
+                    self._voltage = Attribute(path)
+                    break
+            else:
+                raise IOError("no battery in {}".format(class_dir))
+        return self._voltage.read_int() / 1e6
+
+    def buttons(self):
+        from buttons import ButtonService
+        from hal.base import NullButtons
+
+        try:
+            return ButtonService()
+        except (IOError, OSError):
+            return NullButtons()
+
+    def display(self):
+        from hal.base import NullDisplay
+
+        return NullDisplay()
+
+
+def make_fake_sysfs(root, motors=("B", "C"), sensors=("2", "3"), max_speed=1050, voltage=7.8):
+    """Дерево tacho-motor/lego-sensor с файлами атрибутов как у драйверов ev3dev"""
+    def write(path, value):
+        with open(path, "w") as f:
+            f.write("{}\n".format(value))
+
+    for k, port in enumerate(motors):
+        path = os.path.join(root, "tacho-motor", "motor{}".format(k))
+        os.makedirs(path)
+        for name, value in (("address", "ev3-ports:out" + port), ("driver_name", "lego-ev3-l-motor"),
+                            ("speed_sp", 0), ("duty_cycle_sp", 0), ("command", ""), ("position", 0), ("state", ""),
+                            ("position_sp", 0), ("stop_action", "coast"), ("max_speed", max_speed)):
+            write(os.path.join(path, name), value)
+    for k, port in enumerate(sensors):
+        path = os.path.join(root, "lego-sensor", "sensor{}".format(k))
+        os.makedirs(path)
+        for name, value in (("address", "ev3-ports:in" + port), ("driver_name", "lego-ev3-color"),
+                            ("mode", "COL-REFLECT"), ("num_values", 1), ("value0", 42)):
+            write(os.path.join(path, name), value)
+    path = os.path.join(root, "power_supply", "lego-ev3-battery")
+    os.makedirs(path)
+    write(os.path.join(path, "voltage_now"), int(voltage * 1e6))
+    return root
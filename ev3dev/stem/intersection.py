@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Детектор перекрёстков с проверкой по энкодерам
+
+Вместо слепого проезда перекрёстка на PASS_INTERSECTION_DEGREES робот
+продолжает следовать по линии, а повторные срабатывания отсекаются так:
+- вход и выход с чёрного определяются гистерезисом LineFollower
+  (разные пороги входа и выхода);
+- новый перекрёсток засчитывается только по переднему фронту и только если
+  с предыдущего робот проехал не меньше min_gap градусов по энкодерам.
+
+Энкодеры читаются только на фронтах сигнала, поэтому в обычном такте
+детектор не добавляет обращений к моторам.
+"""
+
+
+class IntersectionEvent(object):
+    """Засчитанный перекрёсток"""
+    __slots__ = ("index", "position", "confidence", "width")
+
+    def __init__(self, index, position, confidence):
+        self.index = index # номер перекрёстка с начала поездки (с 1)
+        self.position = position # пробег по энкодерам на входе (градусы)
+        self.confidence = confidence # уверенность 0..1 (глубина чёрного на обоих датчиках)
+        self.width = None # ширина чёрного по энкодерам (градусы), известна после выхода
+
+    def __repr__(self):
+        return "IntersectionEvent(#{}, pos={:.0f}, conf={:.2f}, width={})".format(
+            self.index, self.position, self.confidence, self.width)
+
+
+class IntersectionDetector(object):
+    """Счётчик перекрёстков: гистерезис датчиков + минимальный пробег между событиями"""
+    def __init__(self, robot, follower, min_gap=60):
+        self.robot = robot
+        self.follower = follower
+        self.min_gap = min_gap
+        self.reset()
+
+    def reset(self):
+        """Начать новую поездку"""
+        self.follower.reset_filters()
+        self.on_black = False
+        self.count = 0
+        self.suppressed = 0
+        self.events = []
+        self.last_position = None
+
+    def rearm(self):
+        """
+        Продолжить после манёвра (поворот, разворот, остановка): текущий
+        пробег становится точкой отсчёта, а чёрное под датчиками в этот момент
+        не считается новым перекрёстком
+        """
+        self.last_position = self.robot.position()
+        self.on_black = self.follower.detect_intersection()
+
+    def confidence(self):
+        """Уверенность по глубине последних показаний ниже порога чёрного"""
+        f = self.follower
+        return min(self._depth(f.l_cross_raw, f.l_black, f.l_white),
+                   self._depth(f.r_cross_raw, f.r_black, f.r_white))
+
+    @staticmethod
+    def _depth(raw, black, white):
+        threshold = (black + white) / 2.0
+        if threshold <= black:
+            return 0.0
+        v = (threshold - raw) / (threshold - black)
+        return 0.0 if v < 0.0 else 1.0 if v > 1.0 else v
+
+    def update(self):
+        """Вызывается каждый такт; возвращает IntersectionEvent или None"""
+        on_black = self.follower.detect_intersection()
+        if on_black == self.on_black:
+            return None
+        self.on_black = on_black
+
+        position = self.robot.position()
+        if not on_black:
+            # Выход с чёрного: запоминаем ширину последнего события
+            if self.events and self.events[-1].width is None:
+                self.events[-1].width = position - self.events[-1].position
+            return None
+
+        if self.last_position is not None and position - self.last_position < self.min_gap:
+            # Слишком близко к предыдущему перекрёстку - дребезг на том же перекрёстке
+            self.suppressed += 1
+            return None
+
+        self.count += 1
+        self.last_position = position
+        event = IntersectionEvent(self.count, position, self.confidence())
+        self.events.append(event)
+        return event
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Метрики программы робота для Prometheus
+
+Снаружи видно только то, что на экране (DisplayUpdater). Этот модуль
+отдаёт по HTTP (GET /metrics, текстовый формат Prometheus) состояние
+робота и статистику цикла управления и поездок:
+    stem_driving                  - 1, пока идёт поездка;
+    stem_loop_ticks_total         - тактов цикла movement();
+    stem_loop_rate_hz             - частота цикла с прошлого опроса метрик;
+    stem_loop_interval_seconds    - гистограмма интервалов между тактами (дрожание);
+    stem_loop_max_interval_seconds - самый долгий интервал такта за текущую поездку;
+    stem_intersections_total      - засчитанных перекрёстков;
+    stem_trips_total{result}      - поездок по итогу (finished, cancelled, line_lost, error);
+    stem_trip_duration_seconds    - гистограмма длительности поездок;
+    stem_line_losses_total        - сходов с линии;
+    stem_poll_latency_seconds     - гистограмма времени запроса /data к серверу маршрутов;
+    stem_errors_total{kind}       - ошибки (fetch, reset, trip);
+    stem_gc_pause_seconds         - гистограмма пауз сборщика мусора (realtime.py);
+    stem_gc_pause_max_seconds     - самая долгая пауза сборщика.
+
+Без блокировок: у каждой метрики один пишущий поток (цикл управления или
+поток опроса сервера), запись - присваивание числа атрибуту или элементу
+списка под GIL. Поток HTTP только читает; опрос может увидеть гистограмму
+между двумя присваиваниями одного observe() - на следующем опросе
+расхождения нет. Цикл управления никогда не ждёт опроса метрик.
+
+Сервер запускается из run.main() и демона (порт run.METRICS_PORT):
+    curl http://<робот>:9110/metrics
+"""
+
+import time
+import threading
+from bisect import bisect_left
+
+LOOP_BUCKETS = (0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.1, 0.25) # Интервалы такта (секунды)
+TRIP_BUCKETS = (10, 20, 30, 45, 60, 90, 120, 180, 300) # Длительность поездки (секунды)
+POLL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0) # Запрос к серверу маршрутов (секунды)
+GC_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1) # Паузы сборщика мусора (секунды)
+TRIP_RESULTS = ("finished", "cancelled", "line_lost", "error")
+ERROR_KINDS = ("fetch", "reset", "trip")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, v) for k, v in sorted(labels.items())) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Counter(object):
+    """Монотонный счётчик; пишет один поток"""
+    kind = "counter"
+
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge(Counter):
+    """Текущее значение; пишет один поток"""
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram(object):
+    """Гистограмма с заданными верхними границами корзин (+Inf добавляется сама)"""
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.bounds = tuple(float(b) for b in buckets)
+        self.counts = [0] * (len(self.bounds) + 1) # по корзинам, не накопительно
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        counts = list(self.counts)
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            total += count
+            labels = dict(self.labels)
+            labels["le"] = _number(bound)
+            yield self.name + "_bucket", labels, total
+        yield self.name + "_sum", self.labels, self.sum
+        yield self.name + "_count", self.labels, total
+
+
+class Registry(object):
+    """Набор метрик; render() - текст для /metrics"""
+    def __init__(self):
+        self.metrics = []
+        self.collectors = [] # функции, обновляющие метрики перед опросом (поток HTTP)
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        for collect in self.collectors:
+            collect()
+        lines = []
+        described = set()
+        for metric in self.metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append("# HELP {} {}".format(metric.name, metric.help))
+                lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append("{}{} {}".format(name, _labels(labels), _number(value)))
+        return "\n".join(lines) + "\n"
+
+
+class RobotMetrics(object):
+    """Метрики программы робота и точки их обновления из run.py и daemon.py"""
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        add = self.registry.add
+        self.driving = add(Gauge("stem_driving", "1 while a trip is in progress"))
+        self.ticks = add(Counter("stem_loop_ticks_total", "Control loop iterations"))
+        self.loop_rate = add(Gauge("stem_loop_rate_hz", "Control loop rate since the previous scrape"))
+        self.interval = add(Histogram("stem_loop_interval_seconds", "Time between control loop iterations",
+                                      LOOP_BUCKETS))
+        self.loop_max = add(Gauge("stem_loop_max_interval_seconds",
+                                  "Longest time between control loop iterations in the current trip"))
+        self.intersections = add(Counter("stem_intersections_total", "Intersections counted"))
+        self.trips = dict((result, add(Counter("stem_trips_total", "Trips by result", {"result": result})))
+                          for result in TRIP_RESULTS)
+        self.trip_duration = add(Histogram("stem_trip_duration_seconds", "Trip duration", TRIP_BUCKETS))
+        self.line_losses = add(Counter("stem_line_losses_total", "Times the line was lost during a trip"))
+        self.poll_latency = add(Histogram("stem_poll_latency_seconds", "Route server /data request time",
+                                          POLL_BUCKETS))
+        self.errors = dict((kind, add(Counter("stem_errors_total", "Errors by kind", {"kind": kind})))
+                           for kind in ERROR_KINDS)
+        self.gc_pause = add(Histogram("stem_gc_pause_seconds", "Garbage collector pause", GC_BUCKETS))
+        self.gc_pause_max = add(Gauge("stem_gc_pause_max_seconds", "Longest garbage collector pause"))
+        self.registry.collectors.append(self._collect_rate)
+
+        self.last_tick = None
+        self.trip_started_at = None
+        self._rate_ticks = 0
+        self._rate_time = time.monotonic()
+
+    def _collect_rate(self):
+        now = time.monotonic()
+        ticks = self.ticks.value
+        if now > self._rate_time:
+            self.loop_rate.set(round((ticks - self._rate_ticks) / (now - self._rate_time), 1))
+        self._rate_ticks = ticks
+        self._rate_time = now
+
+    # --- цикл управления (один поток) ---
+
+    def trip_started(self, now):
+        self.driving.set(1)
+        self.trip_started_at = now
+        self.last_tick = None
+        self.loop_max.set(0)
+
+    def tick(self, now):
+        """Такт цикла движения"""
+        self.ticks.value += 1
+        last = self.last_tick
+        self.last_tick = now
+        if last is not None:
+            interval = now - last
+            self.interval.observe(interval)
+            if interval > self.loop_max.value:
+                self.loop_max.value = interval
+
+    def intersection(self):
+        """Перекрёсток: за ним манёвр, поэтому следующий интервал такта не считается"""
+        self.intersections.value += 1
+        self.last_tick = None
+
+    def trip_finished(self, result, now, line_losses=0):
+        self.trips[result].inc()
+        if self.trip_started_at is not None:
+            self.trip_duration.observe(now - self.trip_started_at)
+        self.trip_started_at = None
+        self.line_losses.inc(line_losses)
+        self.driving.set(0)
+        self.last_tick = None
+
+    # --- сборщик мусора (обратный вызов gc; сборки не идут одновременно) ---
+
+    def gc(self, seconds):
+        self.gc_pause.observe(seconds)
+        if seconds > self.gc_pause_max.value:
+            self.gc_pause_max.value = seconds
+
+    # --- сеть ---
+
+    def poll(self, seconds):
+        self.poll_latency.observe(seconds)
+
+    def error(self, kind):
+        self.errors[kind].inc()
+
+
+METRICS = RobotMetrics() # Метрики процесса (общие для run.main и демона)
+
+
+def start_server(port, registry=None, host=""):
+    """HTTP-сервер метрик в фоновом потоке; возвращает сервер (shutdown() - остановка)"""
+    # http.server импортируется здесь: import run остаётся быстрым
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    registry = registry or METRICS.registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics")
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Профиль скорости для следования по линии
+
+- разгон и торможение с ограниченным ускорением (%/с) вместо мгновенных
+  скачков скорости, из-за которых колёса проскальзывают и робот теряет линию;
+- снижение базовой скорости на поворотах: чем больше сглаженная ошибка
+  следования |l - r|, тем ниже скорость (но не ниже min_speed);
+- подъезд к перекрёстку: по оставшемуся расстоянию (одометрия + карта)
+  скорость ограничивается так, чтобы успеть затормозить до нужной.
+"""
+
+import math
+import time
+
+# Линейная скорость робота при 1% мощности (мм/с): 1050 град/с * pi * 56 мм / 360 / 100
+MM_PER_S_PER_PERCENT = 1050.0 * math.pi * 56.0 / 360.0 / 100.0
+
+
+class SpeedProfile(object):
+    """Текущая базовая скорость с ограничением ускорения"""
+    def __init__(self, acceleration=120.0, deceleration=200.0, curve_slowdown=1.0,
+                 min_speed=30.0, curve_start=5.0, error_alpha=0.2, clock=time.monotonic):
+        self.acceleration = float(acceleration) # %/с при разгоне
+        self.deceleration = float(deceleration) # %/с при торможении
+        self.curve_slowdown = float(curve_slowdown) # доля снижения скорости на ошибку 100
+        self.min_speed = float(min_speed) # нижняя граница снижения на поворотах (%)
+        self.curve_start = float(curve_start) # ошибка, до которой линия считается прямой
+        self.error_alpha = float(error_alpha) # сглаживание |ошибки|
+        self.clock = clock
+        self.reset()
+
+    def reset(self, speed=0.0):
+        """Начать профиль с известной скорости (после остановки - с нуля)"""
+        self.speed = float(speed)
+        self.error = 0.0
+        self.last_time = self.clock()
+
+    def curve_limit(self, target, error):
+        """Целевая скорость с учётом поворота (по сглаженной величине ошибки выше curve_start)"""
+        self.error += self.error_alpha * (abs(error) - self.error)
+        if self.error <= self.curve_start:
+            return target
+        limited = target * (1.0 - self.curve_slowdown * (self.error - self.curve_start) / 100.0)
+        floor = self.min_speed if self.min_speed < target else target
+        return limited if limited > floor else floor
+
+    def approach_limit(self, remaining_mm, end_speed):
+        """Максимальная скорость, с которой можно затормозить до end_speed за remaining_mm"""
+        if remaining_mm <= 0.0:
+            return end_speed
+        # v^2 = v_end^2 + 2 * a * s, скорости в %, путь переводим в "%-секунды"
+        return math.sqrt(end_speed * end_speed + 2.0 * self.deceleration * remaining_mm / MM_PER_S_PER_PERCENT)
+
+    def update(self, target):
+        """Сдвинуть текущую скорость к target не быстрее допустимого ускорения"""
+        now = self.clock()
+        dt = now - self.last_time
+        self.last_time = now
+
+        if target > self.speed:
+            step = self.acceleration * dt
+            self.speed = target if self.speed + step > target else self.speed + step
+        elif target < self.speed:
+            step = self.deceleration * dt
+            self.speed = target if self.speed - step < target else self.speed - step
+        return self.speed
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Характеристика моторов робота: запаздывание, инерция, скорость, перебег
+
+check_ev3dev2/check_motor_deg.py и check_motor_tank.py только крутят моторы
+и показывают разницу энкодеров. Здесь каждый мотор по очереди проходит
+испытания, положение энкодера пишется с максимальной частотой в заранее
+выделенные массивы, а по записям подбираются параметры модели:
+
+- скачок скважности (run-direct) STEP_DUTIES: запаздывание dead_time_s и
+  постоянная времени tau_s. На установившемся участке положение растёт как
+  v * (t - L - tau): пересечение прямой с нулём даёт L + tau, а положение в
+  этот момент равно v * tau / e;
+- плавный рост скважности от 0 до 100%: скорость линейна по скважности
+  (с поправкой на запаздывание), наклон даёт max_dps - скорость при 100% и
+  номинальном напряжении, пересечение - drag_duty, скважность на трение;
+- on_for_degrees на скоростях OVERSHOOT_SPEEDS: перебег после остановки,
+  overshoot_deg - перебег на 100% (перебег пропорционален скорости).
+
+Модель сохраняется в motors/<робот>.json. Её используют регулятор скорости
+колёс (speed_control.py, прямая связь по скважности) и симулятор
+(SimWorld.apply_motor_model).
+
+Запуск (робот на подставке, колёса не касаются пола):
+    ./motor_model.py
+Проверка подбора на симуляторе с известными параметрами:
+    ./motor_model.py --sim
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+from array import array
+
+from calibration import robot_name
+from speed_control import NOMINAL_VOLTAGE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MOTOR_MODEL_DIR = os.path.join(HERE, "motors") # Каталог моделей моторов
+
+MAX_SAMPLES = 10000 # Размер массивов записи (на испытание, ~2 кГц на EV3)
+STEP_DUTIES = (50, 100) # Скважности скачков (%)
+STEP_SECONDS = 1.0 # Длительность скачка
+RAMP_SECONDS = 4.0 # Рост скважности от 0 до 100%
+RAMP_WINDOW_S = 0.05 # Полуширина окна оценки скорости на росте (секунды)
+OVERSHOOT_SPEEDS = (30, 60, 90) # Скорости on_for_degrees для перебега (%)
+OVERSHOOT_DEGREES = 360 # Поворот on_for_degrees
+SETTLE_SECONDS = 0.3 # Запись после остановки мотора
+REST_SECONDS = 0.5 # Пауза между испытаниями (мотор останавливается)
+MODEL_FIELDS = ("dead_time_s", "tau_s", "max_dps", "drag_duty", "overshoot_deg")
+
+
+class Recording(object):
+    """Заранее выделенные массивы времени, положения и скважности одного испытания"""
+    def __init__(self, size=MAX_SAMPLES):
+        self.t = array("d", [0.0]) * size
+        self.position = array("d", [0.0]) * size
+        self.duty = array("d", [0.0]) * size
+        self.count = 0
+
+    def clear(self):
+        self.count = 0
+
+    def add(self, t, position, duty=0.0):
+        i = self.count
+        if i >= len(self.t):
+            return False
+        self.t[i] = t
+        self.position[i] = position
+        self.duty[i] = duty
+        self.count = i + 1
+        return True
+
+
+class MotorBench(object):
+    """
+    Испытания одного мотора привода (side - "left"/"right"), второй стоит
+    tick() вызывается после каждого отсчёта: на роботе - ничего (опрос без
+    пауз), на симуляторе - шаг модели
+    """
+    def __init__(self, tank, side, clock=time.monotonic, tick=None):
+        self.tank = tank
+        self.side = side
+        self.motor = tank.left_motor if side == "left" else tank.right_motor
+        self.clock = clock
+        self.tick = tick or (lambda: None)
+        self.recording = Recording()
+
+    def _duty(self, duty):
+        if self.side == "left":
+            self.tank.on_duty(duty, 0)
+        else:
+            self.tank.on_duty(0, duty)
+
+    def rest(self):
+        self.tank.off(brake=True)
+        end = self.clock() + REST_SECONDS
+        while self.clock() < end:
+            self.tick()
+
+    def step(self, duty, seconds=STEP_SECONDS):
+        """Скачок скважности с нуля; положение от момента команды"""
+        rec = self.recording
+        rec.clear()
+        origin = self.motor.position
+        start = self.clock()
+        self._duty(duty)
+        while True:
+            now = self.clock() - start
+            if now > seconds or not rec.add(now, self.motor.position - origin, duty):
+                break
+            self.tick()
+        self.rest()
+        return rec
+
+    def ramp(self, seconds=RAMP_SECONDS):
+        """Скважность растёт от 0 до 100% за seconds"""
+        rec = self.recording
+        rec.clear()
+        origin = self.motor.position
+        start = self.clock()
+        while True:
+            now = self.clock() - start
+            duty = 100.0 * now / seconds
+            if now > seconds:
+                break
+            self._duty(duty)
+            if not rec.add(now, self.motor.position - origin, duty):
+                break
+            self.tick()
+        self.rest()
+        return rec
+
+    def move_degrees(self, speed, degrees=OVERSHOOT_DEGREES):
+        """on_for_degrees без ожидания; запись до остановки и SETTLE_SECONDS после"""
+        rec = self.recording
+        rec.clear()
+        origin = self.motor.position
+        start = self.clock()
+        if self.side == "left":
+            self.tank.on_for_degrees(speed, 0, degrees, brake=True, block=False)
+        else:
+            self.tank.on_for_degrees(0, speed, degrees, brake=True, block=False)
+        stopped = None
+        while True:
+            now = self.clock() - start
+            if not rec.add(now, self.motor.position - origin, speed):
+                break
+            if stopped is None and now > 0.05 and not self.tank.is_running:
+                stopped = now
+            if stopped is not None and now - stopped > SETTLE_SECONDS:
+                break
+            self.tick()
+        self.rest()
+        return rec
+
+
+def _line_fit(xs, ys):
+    """Прямая y = a * x + b по методу наименьших квадратов"""
+    n = float(len(xs))
+    mx = sum(xs) / n
+    my = sum(ys) / n
+    sxx = sum((x - mx) * (x - mx) for x in xs)
+    sxy = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    a = sxy / sxx
+    return a, my - a * mx
+
+
+def _position_at(rec, t):
+    """Положение в момент t (линейная интерполяция между отсчётами)"""
+    for i in range(1, rec.count):
+        if rec.t[i] >= t:
+            t0, t1 = rec.t[i - 1], rec.t[i]
+            p0, p1 = rec.position[i - 1], rec.position[i]
+            return p0 if t1 == t0 else p0 + (p1 - p0) * (t - t0) / (t1 - t0)
+    return rec.position[rec.count - 1]
+
+
+def fit_step(rec):
+    """Запаздывание, постоянная времени и установившаяся скорость по скачку"""
+    n = rec.count
+    if n < 20:
+        raise ValueError("step: not enough samples ({})".format(n))
+    tail = range(int(n * 0.6), n)
+    v, b = _line_fit([rec.t[i] for i in tail], [rec.position[i] for i in tail])
+    if abs(v) < 1.0:
+        raise ValueError("step: motor did not move")
+    crossing = -b / v # L + tau
+    tau = math.e * _position_at(rec, crossing) / v
+    dead_time = crossing - tau
+    return {"dead_time_s": max(0.0, dead_time), "tau_s": max(0.0, tau), "speed_dps": v}
+
+
+def fit_ramp(rec, delay):
+    """
+    Скорость от скважности на росте: speed = a * duty + b
+    delay - запаздывание плюс постоянная времени (скорость отстаёт от скважности)
+    """
+    n = rec.count
+    if n < 20:
+        raise ValueError("ramp: not enough samples ({})".format(n))
+    rate = rec.duty[n - 1] / rec.t[n - 1] # %/с
+    duties, speeds = [], []
+    j = 0
+    for i in range(n):
+        t = rec.t[i]
+        # Окно [t - w, t + w] для оценки скорости по энкодеру
+        while rec.t[j] < t - RAMP_WINDOW_S:
+            j += 1
+        k = i
+        while k + 1 < n and rec.t[k + 1] <= t + RAMP_WINDOW_S:
+            k += 1
+        if t - RAMP_WINDOW_S < 0.0 or k == i or rec.t[k] - rec.t[j] <= 0.0:
+            continue
+        speed = (rec.position[k] - rec.position[j]) / (rec.t[k] - rec.t[j])
+        duties.append(rate * (t - delay))
+        speeds.append(speed)
+    top = max(speeds) if speeds else 0.0
+    # Только участок, где мотор уже едет (трение преодолено)
+    moving = [(d, s) for d, s in zip(duties, speeds) if s > 0.1 * top and d < 100.0]
+    if len(moving) < 10:
+        raise ValueError("ramp: motor did not move")
+    return _line_fit([d for d, _ in moving], [s for _, s in moving])
+
+
+def fit_overshoot(results):
+    """Перебег на 100% по парам (скорость %, перебег градусы): прямая через ноль"""
+    num = sum(s * o for s, o in results)
+    den = sum(s * s for s, _ in results)
+    return 100.0 * num / den if den else 0.0
+
+
+def characterize_motor(bench, volts, log=print):
+    """Все испытания одного мотора; возвращает параметры модели"""
+    steps = []
+    for duty in STEP_DUTIES:
+        steps.append(fit_step(bench.step(duty)))
+        log("{} step {}%: L={:.3f}s tau={:.3f}s v={:.0f}deg/s".format(
+            bench.side, duty, steps[-1]["dead_time_s"], steps[-1]["tau_s"], steps[-1]["speed_dps"]))
+    dead_time = sum(s["dead_time_s"] for s in steps) / len(steps)
+    tau = sum(s["tau_s"] for s in steps) / len(steps)
+
+    a, b = fit_ramp(bench.ramp(), dead_time + tau)
+    supply = volts / NOMINAL_VOLTAGE
+    # speed = k * (duty * supply - drag): k = a / supply, drag = -b / k
+    max_dps = 100.0 * a / supply
+    drag = -b / a * supply
+    log("{} ramp: {:.2f} deg/s per %, drag {:.1f}%".format(bench.side, a, drag))
+
+    overshoots = []
+    for speed in OVERSHOOT_SPEEDS:
+        rec = bench.move_degrees(speed)
+        overshoot = rec.position[rec.count - 1] - OVERSHOOT_DEGREES
+        overshoots.append((speed, overshoot))
+        log("{} on_for_degrees {}%: overshoot {:.1f} deg".format(bench.side, speed, overshoot))
+
+    return {
+        "dead_time_s": round(dead_time, 4),
+        "tau_s": round(tau, 4),
+        "max_dps": round(max_dps, 1),
+        "drag_duty": round(max(0.0, drag), 2),
+        "overshoot_deg": round(fit_overshoot(overshoots), 2),
+        "top_dps": round(steps[-1]["speed_dps"], 1),
+    }
+
+
+def characterize(tank, volts, clock=time.monotonic, tick=None, log=print):
+    """Модель обоих моторов привода"""
+    model = {"voltage": round(volts, 2)}
+    for side in ("left", "right"):
+        model[side] = characterize_motor(MotorBench(tank, side, clock, tick), volts, log)
+    return model
+
+
+def model_path(robot=None):
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", robot or robot_name())
+    return os.path.join(MOTOR_MODEL_DIR, name + ".json")
+
+
+def save_model(model, robot=None):
+    """Сохранить модель моторов, вернуть путь к файлу"""
+    path = model_path(robot)
+    if not os.path.isdir(MOTOR_MODEL_DIR):
+        os.makedirs(MOTOR_MODEL_DIR)
+
+    data = dict(model)
+    data["robot"] = robot or robot_name()
+    data["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+def load_model(robot=None, path=None):
+    """Загрузить модель моторов или вернуть None, если её нет"""
+    try:
+        with open(path or model_path(robot)) as f:
+            data = json.load(f)
+        for side in ("left", "right"):
+            data[side] = dict((key, float(data[side][key])) for key in MODEL_FIELDS)
+        return data
+    except (OSError, IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+def simulated_bench(volts=7.6):
+    """Симулятор с известными параметрами моторов (для проверки подбора)"""
+    from sim import SimWorld, SimTank
+
+    world = SimWorld(dt=0.002, battery_voltage=volts)
+    truth = {"voltage": volts}
+    for side, max_dps, drag in (("left", 1000.0, 4.0), ("right", 960.0, 6.0)):
+        truth[side] = {"dead_time_s": 0.01, "tau_s": 0.08, "max_dps": max_dps,
+                       "drag_duty": drag, "overshoot_deg": 8.0}
+    world.apply_motor_model(truth)
+    return world, SimTank(world), truth
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Motor characterization")
+    parser.add_argument("--sim", action="store_true", help="на симуляторе: сравнить подбор с заданными параметрами")
+    args = parser.parse_args()
+
+    if args.sim:
+        world, tank, truth = simulated_bench()
+        model = characterize(tank, world.battery_voltage, clock=world.clock, tick=world.step)
+        print("{:<6} {:<14} {:>9} {:>9}".format("motor", "parameter", "true", "fitted"))
+        for side in ("left", "right"):
+            for key in MODEL_FIELDS:
+                print("{:<6} {:<14} {:>9.3f} {:>9.3f}".format(side, key, truth[side][key], model[side][key]))
+        return 0
+
+    from hal import get_backend
+
+    backend = get_backend()
+    tank = backend.tank()
+    volts = backend.battery_voltage()
+    print("Battery: {:.2f} V".format(volts))
+    try:
+        model = characterize(tank, volts)
+    finally:
+        tank.off(brake=False)
+    print("Saved: {}".format(save_model(model)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
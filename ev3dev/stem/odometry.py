@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Одометрия по энкодерам колёс (дифференциальный привод)
+
+Положения левого и правого моторов MoveTank (градусы) интегрируются в
+координаты (x, y) в миллиметрах и курс heading в радианах (0 - вдоль оси x,
+положительный - против часовой стрелки). Дополнительно считается пройденный
+путь distance - по нему movement() оценивает расстояние до следующего
+перекрёстка по карте трассы (track.py).
+"""
+
+import math
+
+
+class Odometry(object):
+    """Интегрирование положения робота по энкодерам"""
+    def __init__(self, tank, wheel_diameter, axle_track):
+        self.tank = tank
+        self.mm_per_degree = math.pi * wheel_diameter / 360.0
+        self.axle_track = float(axle_track)
+        self.reset()
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        """Задать текущее положение; отсчёт энкодеров начинается с текущих значений"""
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.distance = 0.0
+        self.left_pos = self.tank.left_motor.position
+        self.right_pos = self.tank.right_motor.position
+
+    def set_pose(self, x, y, heading=None):
+        """Привязать положение к известной точке (узлу карты), не сбрасывая путь"""
+        self.x = x
+        self.y = y
+        if heading is not None:
+            self.heading = heading
+
+    def update(self):
+        """Прочитать энкодеры и обновить положение; возвращает пройденный путь (мм)"""
+        left_pos = self.tank.left_motor.position
+        right_pos = self.tank.right_motor.position
+
+        dl = (left_pos - self.left_pos) * self.mm_per_degree
+        dr = (right_pos - self.right_pos) * self.mm_per_degree
+        self.left_pos = left_pos
+        self.right_pos = right_pos
+
+        ds = (dl + dr) / 2.0
+        dtheta = (dr - dl) / self.axle_track
+
+        # Интегрирование по средней точке дуги
+        mid = self.heading + dtheta / 2.0
+        self.x += ds * math.cos(mid)
+        self.y += ds * math.sin(mid)
+        self.heading = (self.heading + dtheta + math.pi) % (2.0 * math.pi) - math.pi
+        self.distance += ds
+        return self.distance
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Планировщик маршрутов по графу трассы
+
+Поиск кратчайшего по времени пути (A*, эвристика - прямое расстояние) по
+состояниям (узел, откуда приехали), поэтому в стоимость входят не только
+длины участков, но и повороты на перекрёстках. Найденный путь переводится
+в действия для movement(): left / straight / right / u_turn на каждом
+перекрёстке, pickup на остановке посадки и stop на остановке высадки.
+
+Параметры берутся из карты трассы (track.py), дополнительные ключи:
+    "start": ["S", "A"],                  # зона старта и первый узел по ходу
+    "requests": {"green": ["B", "E"]},    # посадка и высадка для маршрута
+    "speed_mm_s": 150,                    # средняя скорость на участках
+    "turn_costs": {"left": 1.5, ...}      # время на манёвр (секунды)
+Результаты поиска запоминаются для каждой пары (начало, цель).
+"""
+
+import math
+import heapq
+
+DEFAULT_SPEED_MM_S = 150.0 # Средняя скорость по линии для оценки времени участка
+DEFAULT_TURN_COSTS = {
+    "straight": 0.0,
+    "left": 1.5,
+    "right": 1.5,
+    "u_turn": 3.0,
+}
+STRAIGHT_ANGLE = 45.0 # Отклонение направления (градусы), до которого считаем проезд прямо
+U_TURN_ANGLE = 150.0 # Отклонение, начиная с которого манёвр считается разворотом
+
+
+class TripPlan(object):
+    """Спланированная поездка: узлы пути, действия на перекрёстках и оценка времени"""
+    __slots__ = ("nodes", "actions", "cost")
+
+    def __init__(self, nodes, actions, cost):
+        self.nodes = nodes # узлы от зоны старта до высадки; nodes[k] - перекрёсток номер k
+        self.actions = actions # actions[k - 1] - кортеж действий на перекрёстке k
+        self.cost = cost
+
+    def __repr__(self):
+        return "TripPlan({}, cost={:.1f}s)".format("-".join(self.nodes), self.cost)
+
+
+class RoutePlanner(object):
+    """Поиск путей по TrackMap с кэшем результатов"""
+    def __init__(self, track, options=None):
+        options = options or {}
+        self.track = track
+        self.speed = float(options.get("speed_mm_s", DEFAULT_SPEED_MM_S))
+        self.turn_costs = dict(DEFAULT_TURN_COSTS)
+        self.turn_costs.update(options.get("turn_costs", {}))
+        self.start = tuple(options.get("start") or ())
+        self.requests = dict((name.lower(), tuple(stops)) for name, stops in options.get("requests", {}).items())
+
+        self.neighbors = {}
+        for a, b in track.edges:
+            self.neighbors.setdefault(a, []).append(b)
+        self._paths = {}
+        self._trips = {}
+
+    def turn(self, prev, node, nxt):
+        """Манёвр на перекрёстке node при проезде prev -> node -> nxt"""
+        if prev is None:
+            return "straight"
+        if nxt == prev:
+            return "u_turn"
+
+        (px, py), (nx, ny), (qx, qy) = self.track.nodes[prev], self.track.nodes[node], self.track.nodes[nxt]
+        heading_in = math.atan2(ny - py, nx - px)
+        heading_out = math.atan2(qy - ny, qx - nx)
+        angle = math.degrees((heading_out - heading_in + math.pi) % (2.0 * math.pi) - math.pi)
+
+        if abs(angle) <= STRAIGHT_ANGLE:
+            return "straight"
+        if abs(angle) >= U_TURN_ANGLE:
+            return "u_turn"
+        # Ось y направлена вверх: положительный угол - поворот против часовой, то есть налево
+        return "left" if angle > 0 else "right"
+
+    def path(self, prev, node, goal):
+        """
+        Кратчайший путь из node (приехали из prev) в goal
+        Возвращает (стоимость, [node, ..., goal]) или None, если пути нет
+        """
+        key = (prev, node, goal)
+        if key not in self._paths:
+            self._paths[key] = self._search(prev, node, goal)
+        return self._paths[key]
+
+    def _heuristic(self, node, goal):
+        return self.track.straight_distance(node, goal) / self.speed
+
+    def _search(self, prev, node, goal):
+        start = (prev, node)
+        best = {start: 0.0}
+        parents = {start: None}
+        queue = [(self._heuristic(node, goal), 0.0, start)]
+
+        while queue:
+            _, cost, state = heapq.heappop(queue)
+            if cost > best.get(state, float("inf")):
+                continue
+            came_from, current = state
+            if current == goal:
+                nodes = []
+                while state is not None:
+                    nodes.append(state[1])
+                    state = parents[state]
+                return cost, nodes[::-1]
+
+            for nxt in self.neighbors.get(current, ()):
+                step = self.track.edge_length(current, nxt) / self.speed
+                step += self.turn_costs[self.turn(came_from, current, nxt)]
+                new_state = (current, nxt)
+                new_cost = cost + step
+                if new_cost < best.get(new_state, float("inf")):
+                    best[new_state] = new_cost
+                    parents[new_state] = state
+                    heapq.heappush(queue, (new_cost + self._heuristic(nxt, goal), new_cost, new_state))
+        return None
+
+    def plan_trip(self, pickup, dropoff):
+        """Поездка от зоны старта через посадку до высадки (TripPlan) или None"""
+        key = (pickup, dropoff)
+        if key in self._trips:
+            return self._trips[key]
+
+        trip = None
+        if len(self.start) == 2:
+            start, first = self.start
+            to_pickup = self.path(start, first, pickup)
+            if to_pickup is not None:
+                cost1, nodes1 = to_pickup
+                before_pickup = nodes1[-2] if len(nodes1) > 1 else start
+                to_dropoff = self.path(before_pickup, pickup, dropoff)
+                if to_dropoff is not None:
+                    cost2, nodes2 = to_dropoff
+                    nodes = [start] + nodes1 + nodes2[1:]
+                    cost = self.track.edge_length(start, first) / self.speed + cost1 + cost2
+                    trip = TripPlan(nodes, self._compile(nodes, len(nodes1)), cost)
+
+        self._trips[key] = trip
+        return trip
+
+    def _compile(self, nodes, pickup_index):
+        """Действия на перекрёстках 1..N пути; pickup_index - номер перекрёстка посадки"""
+        actions = []
+        for k in range(1, len(nodes)):
+            if k == len(nodes) - 1:
+                actions.append(("stop",))
+                continue
+            turn = self.turn(nodes[k - 1], nodes[k], nodes[k + 1])
+            if k == pickup_index:
+                actions.append(("pickup",) if turn == "straight" else ("pickup", turn))
+            else:
+                actions.append((turn,))
+        return actions
+
+    def plan_route(self, route_name):
+        """План для маршрута по заявке из карты (поиск по подстроке) или None"""
+        normalized = str(route_name or "").strip().lower()
+        for name, stops in self.requests.items():
+            if name in normalized and len(stops) == 2:
+                return self.plan_trip(stops[0], stops[1])
+        return None
+
+
+def get_planner(track):
+    """Планировщик, привязанный к карте (кэш путей живёт столько же, сколько карта)"""
+    if track.planner is None:
+        track.planner = RoutePlanner(track, track.options)
+    return track.planner
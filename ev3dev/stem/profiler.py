@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Статистический профилировщик программы робота
+
+Когда робот в поле «тормозит», непонятно, куда уходит время: чтение sysfs,
+отрисовка экрана PIL в display.py или HTTP в fetch_routes(). Профилировщик
+раз в SAMPLE_INTERVAL снимает стеки всех потоков (sys._current_frames()) и
+считает одинаковые стеки. Время - настенное: поток, ждущий в select() или
+sleep(), виден в своей функции ожидания.
+
+Включение и выключение во время работы:
+- сигнал SIGUSR1:           kill -USR1 <pid>
+- кнопки ВЛЕВО + ВПРАВО, удержание COMBO_HOLD секунд;
+- команда демона:           ./stemctl.py profile
+- переменная STEM_PROFILE=1 - включить сразу при запуске.
+При выключении (и при выходе из программы, если профилировщик работал)
+в traces/ пишется profile_<дата>_<время>.folded - свёрнутые стеки
+"поток;функция (файл:строка);... число", вход для flamegraph.pl или
+speedscope.app.
+
+Выключенный профилировщик ничего не делает: его поток спит в Event.wait()
+(или раз в BUTTON_POLL проверяет два атрибута кнопок), обработчик сигнала
+только будит этот поток.
+"""
+
+import os
+import sys
+import time
+import atexit
+import signal
+import threading
+
+from traces import TRACES_DIR
+
+SAMPLE_INTERVAL = 0.02 # Период снятия стеков (секунды); стек снимается под GIL и ненадолго задерживает цикл
+BUTTON_POLL = 0.1 # Период проверки сочетания кнопок (секунды)
+COMBO_HOLD = 1.0 # Сколько держать ВЛЕВО + ВПРАВО для переключения (секунды)
+MAX_DEPTH = 64 # Глубже стек обрезается
+
+
+class SamplingProfiler(object):
+    """Снятие стеков всех потоков в фоновом потоке; toggle() - из любого потока и из обработчика сигнала"""
+    def __init__(self, interval=SAMPLE_INTERVAL, directory=TRACES_DIR, buttons=None):
+        self.interval = interval
+        self.directory = directory
+        self.buttons = buttons # объект с атрибутами left/right (ButtonService, ev3dev2 Button) или None
+        self.active = False
+        self.stacks = {} # свёрнутый стек -> число выборок
+        self.samples = 0
+        self.sample_time = 0.0 # сколько времени ушло на снятие стеков (секунды)
+        self.started_at = None
+        self.last_path = None
+        self._labels = {} # объект кода -> "функция (файл:строка)"
+        self._wake = threading.Event()
+        self._closed = False
+        self._combo_since = None
+        self._combo_armed = True # после переключения ждём отпускания кнопок
+        self.thread = threading.Thread(target=self._loop, name="profiler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def toggle(self):
+        """Переключить (само переключение и запись файла - в потоке профилировщика)"""
+        self._wake.set()
+
+    def _loop(self):
+        next_poll = 0.0
+        while not self._closed:
+            if self.active:
+                timeout = self.interval
+            else:
+                timeout = BUTTON_POLL if self.buttons is not None else None
+            if self._wake.wait(timeout):
+                self._wake.clear()
+                if self._closed:
+                    break
+                self._switch()
+            now = time.monotonic()
+            if self.buttons is not None and now >= next_poll:
+                next_poll = now + BUTTON_POLL
+                if self._combo(now):
+                    self._switch()
+            if self.active:
+                self._sample()
+        if self.active:
+            self._switch()
+
+    def _combo(self, now):
+        """ВЛЕВО + ВПРАВО удерживаются COMBO_HOLD секунд (один раз до отпускания)"""
+        held = self.buttons.left and self.buttons.right
+        if not held:
+            self._combo_since = None
+            self._combo_armed = True
+            return False
+        if self._combo_since is None:
+            self._combo_since = now
+        if self._combo_armed and now - self._combo_since >= COMBO_HOLD:
+            self._combo_armed = False
+            return True
+        return False
+
+    def _switch(self):
+        if self.active:
+            self.active = False
+            self.last_path = self.save()
+        else:
+            self.stacks = {}
+            self.samples = 0
+            self.sample_time = 0.0
+            self.started_at = time.time()
+            self.active = True
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+            self._labels[code] = label
+        return label
+
+    def _sample(self):
+        start = time.perf_counter()
+        own = threading.get_ident()
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+        stacks = self.stacks
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, "thread-{}".format(ident)))
+            labels.reverse()
+            key = ";".join(labels)
+            stacks[key] = stacks.get(key, 0) + 1
+        self.samples += 1
+        self.sample_time += time.perf_counter() - start
+
+    def save(self):
+        """Записать свёрнутые стеки в traces/profile_<время начала>.folded"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        name = "profile_{}.folded".format(time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started_at)))
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            for key, count in sorted(self.stacks.items()):
+                f.write("{} {}\n".format(key, count))
+        return path
+
+    def summary(self):
+        return {
+            "active": self.active,
+            "samples": self.samples,
+            "overhead_pct": round(100.0 * self.sample_time / (self.samples * self.interval), 1) if self.samples else None,
+            "last_file": self.last_path,
+        }
+
+    def close(self):
+        """Остановить поток; если профилировщик работал - записать файл"""
+        self._closed = True
+        self._wake.set()
+        self.thread.join(2.0)
+
+
+def install(buttons=None, signum=signal.SIGUSR1):
+    """
+    Профилировщик процесса: SIGUSR1 (только из главного потока), сочетание
+    кнопок, STEM_PROFILE=1 и запись файла при выходе
+    """
+    profiler = SamplingProfiler(buttons=buttons)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signum, lambda signum, frame: profiler.toggle())
+    atexit.register(profiler.close)
+    if os.environ.get("STEM_PROFILE", "") not in ("", "0"):
+        profiler.toggle()
+    return profiler
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сборка мусора и приоритет потока на время поездки
+
+Циклический сборщик мусора CPython запускается, когда число выделенных
+объектов превысит порог, - в любом месте цикла movement(), а полная сборка
+обходит все живые объекты программы (ev3dev2, PIL, карты трасс). Планировщик
+Linux тоже может отдать процессор другому процессу посреди такта.
+
+С MANUAL_GC в run.py (режим ручной сборки):
+- после инициализации устройств - gc.collect() и gc.freeze(): объекты
+  инициализации уходят в постоянное поколение и больше не обходятся
+  (gc.freeze есть с Python 3.7; на 3.5 - только сборка). Замораживается
+  один раз: замороженный циклический мусор не освобождается никогда, а
+  демон перед каждой поездкой перезагружает run.py;
+- в начале поездки (робот стоит) - полная сборка;
+- на время поездки автоматическая сборка выключена (gc.disable()); такт
+  создаёт float и кортежи без циклов - они освобождаются счётчиком ссылок;
+- сборка идёт в безопасных точках: остановки pickup и pause (её время
+  вычитается из STOP_DELAY / PAUSE_DELAY); после поездки сборщик включается.
+SCHED_PRIORITY > 0 - поток поездки на время движения получает SCHED_FIFO с
+этим приоритетом, иначе NICE < 0 - повышение приоритета через nice (нужны
+права root или CAP_SYS_NICE; отказ только отмечается в summary()). Цикл
+движения не спит, поэтому под SCHED_FIFO остальные потоки (дисплей, сеть)
+получают процессор лишь в 5% времени, оставляемых ядром (sched_rt_runtime_us).
+
+Паузы сборщика меряются всегда (gc.callbacks): число сборок и самая долгая
+пауза за поездку и за всё время - в summary() (status демона) и в метриках
+stem_gc_pause_seconds; самый долгий интервал такта - stem_loop_max_interval_seconds.
+"""
+
+import os
+import gc
+import time
+
+from metrics import METRICS
+
+
+class RealtimeControl(object):
+    """Сборщик мусора и приоритет потока поездки; вызывается из потока поездки"""
+    def __init__(self, metrics=None):
+        self.metrics = metrics or METRICS
+        self.manual = False # автоматическая сборка выключена на время текущей поездки
+        self.trip_manual = False # режим ручной сборки последней поездки (для summary)
+        self.in_trip = False
+        self.priority = None # что удалось установить: "fifo:N", "nice:N", "denied: ..." или None
+        self._restore = None # функция возврата приоритета после поездки
+        self._installed = False
+        self._gc_started = None
+        # Статистика сборок (пишет только обратный вызов gc: сборки не идут одновременно)
+        self.collections = 0
+        self.max_pause = 0.0
+        self.trip_collections = 0
+        self.trip_max_pause = 0.0
+        self.safe_points = 0
+
+    def install(self):
+        """Подключить замер пауз сборщика (один раз)"""
+        if not self._installed:
+            gc.callbacks.append(self._on_gc)
+            self._installed = True
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+            return
+        if self._gc_started is None:
+            return
+        pause = time.perf_counter() - self._gc_started
+        self._gc_started = None
+        self.collections += 1
+        self.max_pause = max(self.max_pause, pause)
+        if self.in_trip:
+            self.trip_collections += 1
+            self.trip_max_pause = max(self.trip_max_pause, pause)
+        self.metrics.gc(pause)
+
+    @staticmethod
+    def freeze():
+        """Полная сборка и перенос оставшихся объектов в постоянное поколение (Python 3.7+)"""
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+
+    def after_init(self, manual_gc):
+        """После инициализации устройств: замер пауз, в режиме ручной сборки - freeze()"""
+        self.install()
+        if manual_gc:
+            self.freeze()
+
+    def trip_started(self, manual_gc=False, sched_priority=0, nice=0):
+        """Начало поездки (робот стоит): сборка (без freeze), выключение сборщика, приоритет потока"""
+        if self.in_trip:
+            # Прошлая поездка оборвалась исключением
+            self.trip_finished()
+        self.install()
+        self.trip_collections = 0
+        self.trip_max_pause = 0.0
+        self.safe_points = 0
+        if manual_gc:
+            gc.collect()
+            gc.disable()
+        self.manual = self.trip_manual = manual_gc
+        self.in_trip = True
+        self._raise_priority(sched_priority, nice)
+
+    def safe_point(self):
+        """Остановка робота: сборка мусора в режиме ручной сборки; возвращает её время (секунды)"""
+        if not (self.manual and self.in_trip):
+            return 0.0
+        start = time.perf_counter()
+        gc.collect()
+        self.safe_points += 1
+        return time.perf_counter() - start
+
+    def trip_finished(self):
+        """Конец поездки: прежний приоритет и автоматическая сборка"""
+        if self._restore is not None:
+            self._restore()
+            self._restore = None
+        if self.manual:
+            gc.enable()
+            self.manual = False
+        self.in_trip = False
+
+    def _raise_priority(self, sched_priority, nice):
+        """SCHED_FIFO или nice для текущего потока (в Linux оба действуют на поток, а не процесс)"""
+        self.priority = None
+        try:
+            if sched_priority > 0 and hasattr(os, "sched_setscheduler"):
+                policy = os.sched_getscheduler(0)
+                param = os.sched_getparam(0)
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(sched_priority))
+                self._restore = lambda: os.sched_setscheduler(0, policy, param)
+                self.priority = "fifo:{}".format(sched_priority)
+            elif nice < 0:
+                old = os.getpriority(os.PRIO_PROCESS, 0)
+                os.setpriority(os.PRIO_PROCESS, 0, old + nice)
+                self._restore = lambda: self._set_nice(old)
+                self.priority = "nice:{}".format(old + nice)
+        except (OSError, AttributeError) as e:
+            self.priority = "denied: {}".format(e)
+
+    @staticmethod
+    def _set_nice(value):
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, value)
+        except OSError:
+            # Возврат к большему nice прав не требует; ошибка не должна прервать конец поездки
+            pass
+
+    def summary(self):
+        return {
+            "manual_gc": self.trip_manual,
+            "in_trip": self.in_trip,
+            "frozen": gc.get_freeze_count() if hasattr(gc, "get_freeze_count") else None,
+            "priority": self.priority,
+            "collections": self.collections,
+            "max_pause_ms": round(1000.0 * self.max_pause, 2),
+            "trip_collections": self.trip_collections,
+            "trip_max_pause_ms": round(1000.0 * self.trip_max_pause, 2),
+            "safe_points": self.safe_points,
+        }
+
+
+REALTIME = RealtimeControl() # Управление сборщиком и приоритетом процесса (общее для run.main и демона)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Запись показаний датчиков линии во время движения по трассе
+
+Робот едет по линии П-регулятором (параметры из run.py) и в каждом такте
+запоминает сырые показания обоих датчиков. Запись останавливается кнопкой
+DOWN или по таймауту и сохраняется в traces/. Фильтры при записи отключены.
+
+Запуск:
+    ./record_trace.py SECONDS [INTERSECTIONS]
+INTERSECTIONS - сколько перекрёстков робот реально проехал (для оценки
+ложных срабатываний в replay_filters.py)
+"""
+
+import os
+import sys
+import time
+
+import run
+from hal import get_backend
+from traces import TRACES_DIR, save_trace
+
+MAX_SAMPLES = 60000 # Максимум тактов в одной записи
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+    intersections = sys.argv[2] if len(sys.argv) > 2 else ""
+
+    button = get_backend().buttons()
+    robot = run.Robot()
+    follower = run.LineFollower(error_filter="none", intersection_filter="none", hysteresis=0)
+
+    # Буферы выделяются заранее, чтобы не тратить время такта на рост списков
+    t = [0.0] * MAX_SAMPLES
+    left = [0] * MAX_SAMPLES
+    right = [0] * MAX_SAMPLES
+    n = 0
+
+    start = time.time()
+    try:
+        while n < MAX_SAMPLES and time.time() - start < seconds and not button.down:
+            l_raw = int(follower.left.value())
+            r_raw = int(follower.right.value())
+            t[n] = time.time() - start
+            left[n] = l_raw
+            right[n] = r_raw
+            n += 1
+
+            turn = run.KP * (follower.l_norm[l_raw] - follower.r_norm[r_raw])
+            left_speed = follower.clamp(run.BASE_SPEED - turn, -run.MAX_SPEED, run.MAX_SPEED)
+            right_speed = follower.clamp(run.BASE_SPEED + turn, -run.MAX_SPEED, run.MAX_SPEED)
+            robot.drive(left_speed, right_speed)
+    finally:
+        robot.stop()
+
+    header = {
+        "l_black": follower.l_black, "l_white": follower.l_white,
+        "r_black": follower.r_black, "r_white": follower.r_white,
+        "base_speed": run.BASE_SPEED, "kp": run.KP,
+    }
+    if intersections:
+        header["intersections"] = intersections
+
+    path = os.path.join(TRACES_DIR, "trace_{}.csv".format(time.strftime("%Y%m%d_%H%M%S")))
+    save_trace(path, t[:n], left[:n], right[:n], header=header)
+    print("{} samples, {:.1f} Hz -> {}".format(n, n / max(t[n - 1], 1e-6) if n else 0.0, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Обнаружение схода с линии и поиск линии
+
+Когда оба датчика видят белое, ошибка регулятора равна нулю и робот уезжает
+с трассы по прямой. Но оба белых бывает и когда линия ровно между датчиками,
+поэтому сход засчитывается только так:
+- последний датчик, видевший линию, прошёл её середину (отражение ниже
+  deep_level), то есть линия ушла за него наружу; если на этом участке оба
+  датчика были на чёрном, это перекрёсток, а не линия сбоку;
+- после этого оба датчика белые на протяжении lost_degrees пробега по энкодерам.
+
+Сторона, где линию видели последней, запоминается как знак ошибки l - r;
+поиск - разворот на месте в эту сторону, затем в другую с растущей
+амплитудой (sweeps качаний), пока один из датчиков не увидит линию.
+Энкодеры читаются только пока оба датчика белые и во время поиска.
+"""
+
+import time
+
+
+class RecoveryEvent(object):
+    """Один сход с линии и его поиск"""
+    __slots__ = ("index", "side", "position", "duration", "sweeps", "found")
+
+    def __init__(self, index, side, position):
+        self.index = index # номер схода с начала поездки (с 1)
+        self.side = side # знак ошибки, когда линию видели последний раз (-1 / 1)
+        self.position = position # пробег по энкодерам в момент обнаружения (градусы)
+        self.duration = None # время поиска (секунды)
+        self.sweeps = 0 # сколько качаний понадобилось
+        self.found = False
+
+    def __repr__(self):
+        return "RecoveryEvent(#{}, side={}, found={}, {:.2f}s, sweeps={})".format(
+            self.index, self.side, self.found, self.duration or 0.0, self.sweeps)
+
+
+class LineRecovery(object):
+    """Детектор схода с линии и ограниченный поиск линии качаниями на месте"""
+    def __init__(self, robot, follower, lost_degrees=60, speed=20, sweep_degrees=120, sweeps=4,
+                 white_level=90.0, deep_level=15.0, found_level=50.0, clock=time.monotonic):
+        self.robot = robot
+        self.follower = follower
+        self.lost_degrees = lost_degrees # пробег на белом до признания схода (0 - выключено)
+        self.speed = speed # скорость колёс при поиске (%)
+        self.sweep_degrees = sweep_degrees # амплитуда первого качания (градусы колеса)
+        self.sweeps = sweeps # максимальное число качаний
+        self.white_level = white_level # нормализованное отражение, выше которого датчик на белом
+        self.deep_level = deep_level # ниже - датчик над серединой линии
+        self.found_level = found_level # ниже - линия найдена
+        self.clock = clock
+        self.events = []
+        self.reset()
+
+    def reset(self):
+        """Начать новую поездку (события прошлых поездок сохраняются до reset_events)"""
+        self.side = 0
+        self.dark = False
+        self.deep = False
+        self.crossing = False
+        self.white_since = None
+        self.searching = False
+        self.failed = False
+
+    def reset_events(self):
+        self.events = []
+
+    def watch(self, error):
+        """
+        Вызывается каждый такт после read_error(); возвращает True, если робот
+        сошёл с линии и начат поиск
+        """
+        if not self.lost_degrees:
+            return False
+        l = self.follower.l_value
+        r = self.follower.r_value
+
+        if l < self.white_level or r < self.white_level:
+            # Линия под одним из датчиков: запоминаем сторону и прошёл ли датчик её середину
+            # (признак прохода середины держится до конца участка, где линию видно)
+            if not self.dark:
+                self.dark = True
+                self.deep = False
+                self.crossing = False
+            self.white_since = None
+            if error:
+                self.side = -1 if error < 0 else 1
+            if l < self.found_level and r < self.found_level:
+                self.crossing = True
+                self.deep = False
+            elif not self.crossing and (l < self.deep_level or r < self.deep_level):
+                self.deep = True
+            return False
+
+        self.dark = False
+        if not self.deep:
+            return False
+        position = self.robot.position()
+        if self.white_since is None:
+            self.white_since = position
+            return False
+        if abs(position - self.white_since) < self.lost_degrees:
+            return False
+
+        self._start(position)
+        return True
+
+    def _start(self, position):
+        self.searching = True
+        self.failed = False
+        self.dark = False
+        self.deep = False
+        self.white_since = None
+        self.event = RecoveryEvent(len(self.events) + 1, self.side or 1, position)
+        self.events.append(self.event)
+        self.started = self.clock()
+        self.origin = self.robot.turn_position()
+        self.sweep = 0
+        self._drive_sweep()
+
+    def _direction(self):
+        """Направление текущего качания: первое - в сторону, где видели линию"""
+        return self.event.side if self.sweep % 2 == 0 else -self.event.side
+
+    def _drive_sweep(self):
+        # Знак как у регулятора movement(): при ошибке e левое колесо едет с -e, правое с +e
+        d = self._direction()
+        self.robot.drive(-d * self.speed, d * self.speed)
+
+    def _finish(self, found):
+        # Участок, на котором линия найдена, не может стать признаком нового схода
+        self.dark = True
+        self.crossing = True
+        self.searching = False
+        self.failed = not found
+        self.event.found = found
+        self.event.duration = self.clock() - self.started
+        self.event.sweeps = self.sweep + 1
+        if not found:
+            self.robot.stop()
+
+    def update(self):
+        """Такт поиска; возвращает True, пока поиск продолжается"""
+        self.follower.read_error()
+        if self.follower.l_value < self.found_level or self.follower.r_value < self.found_level:
+            self._finish(True)
+            return False
+
+        # Отклонение от курса в момент схода в сторону текущего качания (градусы колеса)
+        d = self._direction()
+        offset = (self.origin - self.robot.turn_position()) * d
+        if offset < self.sweep_degrees * (self.sweep + 1):
+            self.robot.drive(-d * self.speed, d * self.speed)
+            return True
+
+        self.sweep += 1
+        if self.sweep >= self.sweeps:
+            self._finish(False)
+            return False
+        self._drive_sweep()
+        return True
+
+    def summary(self):
+        """Метрики поисков: количество, найдено, среднее и максимальное время"""
+        durations = [e.duration for e in self.events if e.duration is not None]
+        return {
+            "losses": len(self.events),
+            "found": sum(1 for e in self.events if e.found),
+            "mean_s": round(sum(durations) / len(durations), 3) if durations else None,
+            "max_s": round(max(durations), 3) if durations else None,
+        }
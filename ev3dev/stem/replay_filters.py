@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Воспроизведение записей датчиков через фильтры детектора перекрёстков
+
+Для каждой записи и каждого варианта фильтра показания прогоняются через
+LineFollower.detect_intersection() так же, как в movement(), и считаются:
+- events - число обнаруженных перекрёстков (передних фронтов)
+- fp - ложные срабатывания: по разметке label, а если её нет - сверх числа
+  перекрёстков из заголовка записи
+- fp/min - ложные срабатывания в минуту
+- lag ms - средняя и максимальная задержка фронта относительно разметки
+  (без разметки - относительно детектора без фильтра)
+
+Запуск:
+    ./replay_filters.py traces/*.csv
+    ./replay_filters.py --synthetic       # синтетическая размеченная запись
+"""
+
+import argparse
+
+from run import LineFollower, INTERSECTION_HYSTERESIS
+from traces import ReplaySensor, load_trace, synthetic_trace
+
+# Варианты: (фильтр показаний, полуширина гистерезиса)
+DEFAULT_VARIANTS = (
+    ("none", 0),
+    ("none", INTERSECTION_HYSTERESIS),
+    ("median:3", 0),
+    ("median:3", INTERSECTION_HYSTERESIS),
+    ("median:5", INTERSECTION_HYSTERESIS),
+    ("ema:0.5", INTERSECTION_HYSTERESIS),
+    ("ema:0.3", INTERSECTION_HYSTERESIS),
+)
+
+
+def rising_edges(flags):
+    """Индексы тактов, где флаг переходит из False в True"""
+    edges = []
+    prev = False
+    for i, flag in enumerate(flags):
+        if flag and not prev:
+            edges.append(i)
+        prev = flag
+    return edges
+
+
+def detect(trace, intersection_filter, hysteresis):
+    """Прогнать запись через детектор перекрёстков, вернуть флаги по тактам"""
+    header = trace["header"]
+    follower = LineFollower(
+        sensors=(ReplaySensor(trace["left"]), ReplaySensor(trace["right"])),
+        error_filter="none", intersection_filter=intersection_filter, hysteresis=hysteresis,
+    )
+    follower.set_calibration(int(header.get("l_black", follower.l_black)),
+                             int(header.get("l_white", follower.l_white)),
+                             int(header.get("r_black", follower.r_black)),
+                             int(header.get("r_white", follower.r_white)))
+    follower.reset_filters()
+    return [follower.detect_intersection() for _ in trace["t"]]
+
+
+def onset_lags(edges, reference_edges, t):
+    """Задержка каждого фронта относительно ближайшего предшествующего опорного фронта"""
+    lags = []
+    j = 0
+    for i in edges:
+        while j + 1 < len(reference_edges) and reference_edges[j + 1] <= i:
+            j += 1
+        if reference_edges and reference_edges[j] <= i:
+            lags.append(t[i] - t[reference_edges[j]])
+    return lags
+
+
+def evaluate(trace, flags, reference_edges):
+    """Метрики варианта: события, ложные срабатывания, задержка"""
+    t = trace["t"]
+    edges = rising_edges(flags)
+    label = trace["label"]
+    duration_min = max(t[-1] - t[0], 1e-6) / 60.0 if t else 1.0
+
+    if label is not None:
+        # Событие истинное, если началось внутри размеченного перекрёстка
+        true_edges = [i for i in edges if label[i]]
+        fp = len(edges) - len(true_edges)
+    else:
+        expected = trace["header"].get("intersections")
+        fp = max(0, len(edges) - int(expected)) if expected else 0
+        true_edges = edges
+
+    lags = onset_lags(true_edges, reference_edges, t)
+    return {
+        "events": len(edges),
+        "fp": fp,
+        "fp_per_min": fp / duration_min,
+        "lag_mean_ms": 1000.0 * sum(lags) / len(lags) if lags else 0.0,
+        "lag_max_ms": 1000.0 * max(lags) if lags else 0.0,
+    }
+
+
+def report(name, trace, variants):
+    print("\n{} ({} samples, expected intersections: {})".format(
+        name, len(trace["t"]), trace["header"].get("intersections", "?")))
+    print("{:<10} {:>4} {:>7} {:>5} {:>7} {:>9} {:>8}".format(
+        "filter", "hyst", "events", "fp", "fp/min", "lag ms", "max ms"))
+
+    if trace["label"] is not None:
+        reference_edges = rising_edges(trace["label"])
+    else:
+        reference_edges = rising_edges(detect(trace, "none", 0))
+
+    for intersection_filter, hysteresis in variants:
+        m = evaluate(trace, detect(trace, intersection_filter, hysteresis), reference_edges)
+        print("{:<10} {:>4} {:>7} {:>5} {:>7.2f} {:>9.1f} {:>8.1f}".format(
+            intersection_filter, hysteresis, m["events"], m["fp"], m["fp_per_min"],
+            m["lag_mean_ms"], m["lag_max_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay sensor traces through intersection filters")
+    parser.add_argument("traces", nargs="*", help="CSV-записи из traces/")
+    parser.add_argument("--synthetic", action="store_true", help="добавить синтетическую размеченную запись")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if not args.traces and not args.synthetic:
+        parser.error("no traces given (use --synthetic for a generated one)")
+
+    if args.synthetic:
+        report("synthetic (seed={})".format(args.seed), synthetic_trace(seed=args.seed), DEFAULT_VARIANTS)
+    for path in args.traces:
+        report(path, load_trace(path), DEFAULT_VARIANTS)
+
+
+if __name__ == "__main__":
+    main()
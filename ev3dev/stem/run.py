@@ -4,19 +4,33 @@
 import time
 import json
 
-from urllib.request import urlopen
-from urllib.error import URLError, HTTPError
-from ev3dev2.motor import MoveTank, OUTPUT_B, OUTPUT_C
-from ev3dev2.sensor.lego import ColorSensor
-from ev3dev2.sensor import INPUT_2, INPUT_3
-from ev3dev2.button import Button
-
 from display import DisplayUpdater
+from calibration import load_profile
+from autotune import load_tuning
+from filters import Hysteresis, make_filter
+from intersection import IntersectionDetector
+from odometry import Odometry
+from track import load_track
+from planner import get_planner
+from motion import SpeedProfile
+from recovery import LineRecovery
+from speed_control import WheelSpeedController
+from motor_model import load_model
+from metrics import METRICS, start_server
+from profiler import install as install_profiler
+from realtime import REALTIME
+from hal import get_backend
+
+# Оборудование открывается через HAL (hal/, бэкенд - переменная STEM_BACKEND),
+# модули ev3dev2 и urllib импортируются при первом использовании, чтобы
+# import run был мгновенным и работал вне робота (симулятор, анализ, тесты)
 
 # --- Настройки ---
 SERVER_IP = "192.168.1.104" # IP адрес сервера, с которого получать данные о маршрутах
 REFRESH_SEC = 1.0 # Частота обновления данных (секунды)
 HTTP_TIMEOUT = 2.0 # Таймаут HTTP запросов (секунды)
+ROUTES_TYPE = "application/x-stem-routes" # Двоичный ответ /data (server/protocol.py)
+METRICS_PORT = 9110 # Порт HTTP метрик Prometheus (metrics.py), 0 - не запускать
 
 # --- Настройки робота ---
 THRESHOLD_COUNT = 3 # Количество заявок для старта
@@ -31,17 +45,57 @@ MAX_SPEED = 90 # Максимальная скорость (% от максим
 TURN_SPEED = 25 # Скорость поворота на перекрёстке
 TURN_DEGREES = 180 # Градусы поворота (подбирается под геометрию трассы)
 UTURN_DEGREES = 360 # Градусы разворота (обычно около 2 * TURN_DEGREES)
-PASS_INTERSECTION_DEGREES = 100 # Проезд перекрёстка прямо
+PASS_INTERSECTION_DEGREES = 100 # Проезд перекрёстка прямо (после паузы и в конце маршрута)
+MIN_INTERSECTION_GAP_DEGREES = 60 # Минимальный пробег между перекрёстками по энкодерам
+
+# Геометрия робота и карта трассы (tracks/<трасса>.json, см. track.py)
+WHEEL_DIAMETER = 56 # Диаметр колеса (мм)
+AXLE_TRACK = 120 # Расстояние между колёсами (мм)
+LONG_EDGE_SPEED = 45 # Скорость на длинных участках вдали от перекрёстков (%)
+SLOW_ZONE_MM = 150 # За сколько мм до ожидаемого перекрёстка уже ехать со скоростью подъезда
+ODOMETRY_EVERY = 5 # Обновлять одометрию раз в N тактов
 BEFORE_TURN_DEGREES = 100 # Движение вперёд после поворота для захвата линии
 PAUSE_DELAY = 2.0 # Пауза на перекрёстке для действия "pause" (секунды)
 
-# Калибровка датчиков
+# Профиль скорости (см. motion.py)
+ACCELERATION = 120 # Разгон (% скорости в секунду)
+DECELERATION = 200 # Торможение (% скорости в секунду)
+CURVE_SLOWDOWN = 1.0 # Снижение скорости на изгибах линии (доля на ошибку 100, 0 - выключено)
+CURVE_MIN_SPEED = 30 # На изгибах не медленнее этой скорости (%)
+APPROACH_STOP_SPEED = 15 # Скорость подъезда к перекрёстку с остановкой (%)
+STOP_ACTIONS = ("pickup", "pause", "stop") # Действия, перед которыми робот останавливается
+
+# Сход с линии и поиск (см. recovery.py)
+LINE_LOST_DEGREES = 60 # Пробег на белом после прохода линии под датчиком до признания схода (0 - выключено)
+RECOVERY_SPEED = 30 # Скорость колёс при поиске линии (%)
+RECOVERY_SWEEP_DEGREES = 120 # Амплитуда первого качания при поиске (градусы колеса)
+RECOVERY_SWEEPS = 4 # Сколько качаний (с растущей амплитудой) до остановки
+
+# Управление скоростью колёс
+DRIVE_MODE = "percent" # "percent" - % и регулятор драйвера, "dps" - свой регулятор град/с с учётом батареи
+SPEED_KP = 0.02 # П-часть регулятора скорости (% скважности на 1 град/с)
+SPEED_KI = 0.4 # И-часть регулятора скорости (% скважности на 1 град)
+SPEED_DRAG_DUTY = 0.0 # Скважность на трение (%), если нет модели моторов motor_model.py
+
+# Калибровка датчиков (используется, если нет сохранённого профиля calibration.py)
 L_WHITE = 70 # Отражение белого для левого датчика
 L_BLACK = 8 # Отражение чёрного для левого датчика
 R_WHITE = 70 # Отражение белого для правого датчика
 R_BLACK = 8 # Отражение чёрного для правого датчика
+RAW_LUT_SIZE = 256 # Размер таблиц нормализации (сырые значения COL-REFLECT 0..100 с запасом)
+
+# Фильтрация датчиков (см. filters.py): "none", "median:N", "ema:A"
+ERROR_FILTER = "none" # Фильтр показаний для расчёта ошибки следования
+INTERSECTION_FILTER = "median:3" # Фильтр показаний для детектора перекрёстков
+INTERSECTION_HYSTERESIS = 5 # Полуширина гистерезиса вокруг порога чёрного (сырые единицы)
+
+# Сборка мусора и приоритет потока на время поездки (см. realtime.py)
+MANUAL_GC = False # Без автоматической сборки в поездке: freeze после инициализации, сборка на остановках
+SCHED_PRIORITY = 0 # Приоритет SCHED_FIFO потока поездки (1..99, 0 - не менять; нужен root)
+NICE = 0 # Повышение приоритета через nice, если SCHED_PRIORITY = 0 (например -10; нужен root)
 
 # Сценарии движения по перекрёсткам после остановки "Picking up passengers"
+# (используются, если в карте трассы нет заявки для маршрута, см. planner.py)
 # Для green:
 # 1 - left, 2 - straight, 3 - right, 4 - stop, 5 - u_turn, 6 - pause
 # Доступные действия: left, straight, right, stop, u_turn, pause
@@ -52,21 +106,89 @@ ROUTE_POST_STOP_ACTIONS = {
 }
 
 
+def apply_tuning(robot=None):
+    """
+    Подставить KP, BASE_SPEED, MAX_SPEED, TURN_SPEED и TURN_DEGREES из профиля
+    автоподбора (autotune.py, tuning/<робот>.json) вместо констант выше, а с
+    ними пересчитанные UTURN_DEGREES и LONG_EDGE_SPEED (autotune.derived)
+    Возвращает подставленные значения или None, если профиля нет
+    """
+    tuning = load_tuning(robot)
+    if tuning:
+        globals().update(tuning)
+    return tuning
+
+
+_routes_cache = {} # IP сервера -> (ETag, маршруты)
+
+
+def _unpack_routes(body):
+    """Маршруты из двоичного ответа /data (формат server/protocol.py: pack_data)"""
+    import struct
+
+    magic, form, count, _, _ = struct.unpack_from("!2sBBII", body)
+    if magic != b"SR" or form != 1:
+        raise ValueError("bad routes payload")
+    offset = struct.calcsize("!2sBBII")
+    routes = []
+    for index in range(count):
+        routes_count, length = struct.unpack_from("!IB", body, offset)
+        offset += 5
+        routes.append({"index": index, "name": body[offset:offset + length].decode("ascii"), "count": routes_count})
+        offset += length
+    return routes
+
+
 def fetch_routes(ip):
-    """Получить данные о маршрутах с сервера"""
+    """
+    Получить данные о маршрутах с сервера
+    Прошлый ответ хранится вместе с ETag: пока заявки не менялись, сервер
+    отвечает 304 без тела и разбирать нечего. route_server.py по Accept
+    отдаёт двоичный ответ вместо JSON; ESP отвечает JSON
+    """
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+
+    cached = _routes_cache.get(ip)
+    headers = {"Accept": ROUTES_TYPE + ", application/json"}
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
     url = "http://{}/data".format(ip)
-    result = urlopen(url, timeout=HTTP_TIMEOUT)
-    data = json.loads(result.read().decode("utf-8", "replace"))
-    return data.get("routes", [])
+    start = time.monotonic()
+    try:
+        result = urlopen(Request(url, headers=headers), timeout=HTTP_TIMEOUT)
+        body = result.read()
+    except HTTPError as e:
+        if e.code == 304 and cached is not None:
+            METRICS.poll(time.monotonic() - start)
+            return cached[1]
+        METRICS.error("fetch")
+        raise
+    except Exception:
+        METRICS.error("fetch")
+        raise
+    METRICS.poll(time.monotonic() - start)
+    if result.headers.get("Content-Type", "").startswith(ROUTES_TYPE):
+        routes = _unpack_routes(body)
+    else:
+        routes = json.loads(body.decode("utf-8", "replace")).get("routes", [])
+    etag = result.headers.get("ETag")
+    if etag:
+        _routes_cache[ip] = (etag, routes)
+    return routes
 
 
 def reset_route(ip, route_index):
     """Сбросить заявки на конкретном маршруте"""
+    from urllib.request import urlopen
+    from urllib.error import URLError, HTTPError
+
     try:
         url = "http://{}/reset?route={}".format(ip, route_index)
         urlopen(url, timeout=HTTP_TIMEOUT)
         return True
     except (HTTPError, URLError, Exception):
+        METRICS.error("reset")
         return False
 
 
@@ -98,35 +220,114 @@ def get_post_stop_actions(route_name):
 
 class Robot(object):
     """Управление роботом через MoveTank"""
-    def __init__(self, left_port=OUTPUT_C, right_port=OUTPUT_B):
-        self.tank = MoveTank(left_port, right_port)
+    def __init__(self, left_port=None, right_port=None, tank=None, drive_mode=None, voltage=None,
+                 clock=None, motor_model=None):
+        if tank is not None:
+            # Готовый привод (например, sim.SimTank)
+            self.tank = tank
+        else:
+            backend = get_backend()
+            self.tank = backend.tank(left_port or "C", right_port or "B")
+            voltage = voltage or backend.battery_voltage
+            motor_model = motor_model or load_model()
+
+        # В режиме "dps" скорость в % переводится в град/с (100% = max_speed мотора)
+        # и поддерживается WheelSpeedController с учётом напряжения батареи
+        self.speed_control = None
+        if (drive_mode or DRIVE_MODE) == "dps":
+            self.speed_control = WheelSpeedController(
+                self.tank, voltage, getattr(self.tank, "left_max", 1050), SPEED_KP, SPEED_KI, SPEED_DRAG_DUTY,
+                clock=clock or time.monotonic)
+            if motor_model is not None:
+                self.speed_control.apply_model(motor_model)
 
     def stop(self):
         """Остановить робота"""
         self.tank.off(brake=True)
+        if self.speed_control is not None:
+            self.speed_control.reset()
 
     def drive(self, left_speed, right_speed):
         """Движение с заданными скоростями для левого и правого моторов"""
-        self.tank.on(left_speed, right_speed)
+        if self.speed_control is not None:
+            dps = self.speed_control.max_dps / 100.0
+            self.speed_control.drive(left_speed * dps, right_speed * dps)
+        else:
+            self.tank.on(left_speed, right_speed)
 
-    def drive_degrees(self, left_speed, right_speed, degrees):
+    def drive_degrees(self, left_speed, right_speed, degrees, block=True):
         """Движение на определённое количество градусов (используется для съезда с перекрёстка при старте) """
-        self.tank.on_for_degrees(left_speed, right_speed, degrees, brake=True, block=True)
+        self.tank.on_for_degrees(left_speed, right_speed, degrees, brake=True, block=block)
+        if self.speed_control is not None:
+            self.speed_control.reset()
+
+    def is_running(self):
+        """Выполняется ли ещё движение, запущенное с block=False"""
+        return self.tank.is_running
+
+    def position(self):
+        """Пробег по энкодерам: среднее положение левого и правого моторов (градусы)"""
+        return (self.tank.left_motor.position + self.tank.right_motor.position) / 2.0
+
+    def turn_position(self):
+        """Поворот по энкодерам: полуразность левого и правого моторов (градусы)"""
+        return (self.tank.left_motor.position - self.tank.right_motor.position) / 2.0
 
 
 class LineFollower(object):
     """Следование по линии с двумя датчиками"""
-    def __init__(self, left_port=INPUT_2, right_port=INPUT_3):
-        self.left = ColorSensor(left_port)
-        self.right = ColorSensor(right_port)
+    def __init__(self, left_port=None, right_port=None, track=None,
+                 error_filter=ERROR_FILTER, intersection_filter=INTERSECTION_FILTER,
+                 hysteresis=INTERSECTION_HYSTERESIS, sensors=None):
+        if sensors is not None:
+            # Готовые датчики (заглушки для бенчмарков и симулятора)
+            self.left, self.right = sensors
+        else:
+            backend = get_backend()
+            self.left = backend.color_sensor(left_port or "2")
+            self.right = backend.color_sensor(right_port or "3")
 
         self.left.mode = 'COL-REFLECT'
         self.right.mode = 'COL-REFLECT'
 
-        self.l_white = L_WHITE
-        self.l_black = L_BLACK
-        self.r_white = R_WHITE
-        self.r_black = R_BLACK
+        # Фильтры задаются отдельно для каждого сигнала и датчика
+        self.l_error_filter = make_filter(error_filter)
+        self.r_error_filter = make_filter(error_filter)
+        self.l_cross_filter = make_filter(intersection_filter)
+        self.r_cross_filter = make_filter(intersection_filter)
+        self.hysteresis = hysteresis
+
+        # Последние нормализованные показания read_error() (для поиска линии)
+        self.l_value = 100.0
+        self.r_value = 100.0
+
+        # Профиль калибровки для этого робота и трассы, иначе константы
+        profile = load_profile(track=track)
+        if profile:
+            self.set_calibration(profile["l_black"], profile["l_white"], profile["r_black"], profile["r_white"])
+        else:
+            self.set_calibration(L_BLACK, L_WHITE, R_BLACK, R_WHITE)
+
+    def set_calibration(self, l_black, l_white, r_black, r_white):
+        """
+        Установить уровни чёрного и белого для обоих датчиков и построить
+        таблицы: сырое значение -> нормализованное отражение / признак чёрного
+        (с гистерезисом вокруг середины между чёрным и белым)
+        """
+        self.l_black = l_black
+        self.l_white = l_white
+        self.r_black = r_black
+        self.r_white = r_white
+
+        raw_values = range(RAW_LUT_SIZE)
+        self.l_norm = tuple(self.norm_reflect(raw, l_black, l_white) for raw in raw_values)
+        self.r_norm = tuple(self.norm_reflect(raw, r_black, r_white) for raw in raw_values)
+
+        l_threshold = (l_black + l_white) / 2
+        r_threshold = (r_black + r_white) / 2
+        margin = self.hysteresis
+        self.l_is_black = Hysteresis(l_threshold - margin, l_threshold + margin, RAW_LUT_SIZE)
+        self.r_is_black = Hysteresis(r_threshold - margin, r_threshold + margin, RAW_LUT_SIZE)
 
     @staticmethod
     def clamp(x, lo, hi):
@@ -140,14 +341,24 @@ class LineFollower(object):
         v = (raw - black) * 100.0 / (white - black)
         return self.clamp(v, 0.0, 100.0)
 
+    def reset_filters(self):
+        """Сбросить историю фильтров (перед новой поездкой или после манёвра)"""
+        for f in (self.l_error_filter, self.r_error_filter, self.l_cross_filter, self.r_cross_filter,
+                  self.l_is_black, self.r_is_black):
+            if f is not None:
+                f.reset()
+
     def read_error(self):
         """Читает датчики и возвращает ошибку (левый - правый)"""
         l_raw = int(self.left.value())
         r_raw = int(self.right.value())
 
-        l = self.norm_reflect(l_raw, self.l_black, self.l_white)
-        r = self.norm_reflect(r_raw, self.r_black, self.r_white)
+        if self.l_error_filter is not None:
+            l_raw = self.l_error_filter.update(l_raw)
+            r_raw = self.r_error_filter.update(r_raw)
 
+        l = self.l_value = self.l_norm[l_raw]
+        r = self.r_value = self.r_norm[r_raw]
         return l - r
 
     def detect_intersection(self):
@@ -155,114 +366,228 @@ class LineFollower(object):
         l_raw = int(self.left.value())
         r_raw = int(self.right.value())
 
-        threshold = (self.l_black + self.l_white) / 2
-        return l_raw < threshold and r_raw < threshold
+        if self.l_cross_filter is not None:
+            l_raw = self.l_cross_filter.update(l_raw)
+            r_raw = self.r_cross_filter.update(r_raw)
 
+        # Последние показания нужны детектору перекрёстков для оценки уверенности
+        self.l_cross_raw = l_raw
+        self.r_cross_raw = r_raw
 
-def movement(robot, follower, display, button, route_name="", total_intersections=TOTAL_INTERSECTIONS, stop_at=STOP_AT_INTERSECTION):
+        # Оба детектора обновляются каждый такт, чтобы гистерезис не терял состояние
+        l_black = self.l_is_black.update(l_raw)
+        r_black = self.r_is_black.update(r_raw)
+        return l_black and r_black
+
+
+def get_route_plan(route_name, track=None, stop_at=STOP_AT_INTERSECTION):
+    """
+    План поездки: (узлы пути по карте или None, действия на перекрёстках)
+    Сначала планировщик по заявке из карты трассы, затем сценарий
+    ROUTE_POST_STOP_ACTIONS (до остановки - проезд прямо).
+    Пустой список действий - старое поведение без сценария; путь карты, не
+    совпадающий со сценарием по числу перекрёстков, не используется
+    """
+    if track is not None:
+        trip = get_planner(track).plan_route(route_name)
+        if trip is not None:
+            return trip.nodes, trip.actions
+
+    path = track.route_path(route_name) if track is not None else None
+    post_stop_actions = get_post_stop_actions(route_name)
+    if not post_stop_actions:
+        return path, []
+
+    actions = [("straight",)] * (stop_at - 1) + [("pickup",)]
+    actions.extend((action,) for action in post_stop_actions)
+    if path and len(path) - 1 != len(actions):
+        # Путь карты не совпадает со сценарием: длины участков были бы не те
+        path = None
+    return path, actions
+
+
+def perform_action(robot, display, action, intersections_passed, display_total, route_name):
+    """Выполнить действие на перекрёстке; возвращает True, если маршрут завершён"""
+    if action == "pickup":
+        robot.stop()
+        display.update("Picking up passengers", SERVER_IP, intersections_passed, display_total, route_name)
+        # Робот стоит: сборка мусора в счёт задержки
+        time.sleep(max(0.0, STOP_DELAY - REALTIME.safe_point()))
+        display.update("Moving", SERVER_IP, intersections_passed, display_total, route_name)
+    elif action == "left":
+        display.update("Turn left", SERVER_IP, intersections_passed, display_total, route_name)
+        robot.drive_degrees(BASE_SPEED, BASE_SPEED, BEFORE_TURN_DEGREES)
+        robot.drive_degrees(-TURN_SPEED, TURN_SPEED, TURN_DEGREES)
+    elif action == "right":
+        display.update("Turn right", SERVER_IP, intersections_passed, display_total, route_name)
+        robot.drive_degrees(BASE_SPEED, BASE_SPEED, BEFORE_TURN_DEGREES)
+        robot.drive_degrees(TURN_SPEED, -TURN_SPEED, TURN_DEGREES)
+    elif action == "straight":
+        # Проезд прямо: следование по линии продолжается, повтор отсекает детектор
+        display.update("Go straight", SERVER_IP, intersections_passed, display_total, route_name)
+    elif action == "u_turn":
+        display.update("U-turn", SERVER_IP, intersections_passed, display_total, route_name)
+        robot.drive_degrees(BASE_SPEED, BASE_SPEED, BEFORE_TURN_DEGREES)
+        robot.drive_degrees(-TURN_SPEED, TURN_SPEED, UTURN_DEGREES)
+    elif action == "pause":
+        robot.stop()
+        display.update("Pause", SERVER_IP, intersections_passed, display_total, route_name)
+        time.sleep(max(0.0, PAUSE_DELAY - REALTIME.safe_point()))
+        display.update("Moving", SERVER_IP, intersections_passed, display_total, route_name)
+        robot.drive_degrees(BASE_SPEED, BASE_SPEED, PASS_INTERSECTION_DEGREES)
+    elif action == "stop":
+        robot.drive_degrees(BASE_SPEED, BASE_SPEED, 370)
+        robot.drive_degrees(-TURN_SPEED, TURN_SPEED, 370)
+        robot.stop()
+        return True
+    # Неизвестное действие: безопасно едем прямо (по линии)
+    return False
+
+
+def movement(robot, follower, display, button, route_name="", total_intersections=TOTAL_INTERSECTIONS, stop_at=STOP_AT_INTERSECTION, cancel=None, track=None, clock=None, recovery=None, metrics=None):
     """
     Едет по линии, считает перекрёстки
-    При нажатии кнопки DOWN - прерывает движение
+    При нажатии кнопки DOWN или установке события cancel - прерывает движение
+    Действия на перекрёстках берутся из плана маршрута (get_route_plan)
+    Скорость меняется плавно (SpeedProfile): разгон после остановок и манёвров,
+    замедление на изгибах линии; если для маршрута есть карта трассы, на длинных
+    участках едет быстрее и заранее тормозит перед ожидаемым перекрёстком
+    Если робот сошёл с линии, ищет её качаниями на месте (recovery.LineRecovery,
+    можно передать свой объект, чтобы забрать метрики поисков); не нашёл - останавливается
+    clock - источник времени для профиля скорости (в симуляторе - модельное время;
+    по умолчанию time.monotonic на момент вызова - его подменяет запись сессий session.py)
+    metrics - метрики для /metrics (по умолчанию общие metrics.METRICS)
+    На время поездки - режим сборки мусора и приоритет потока из MANUAL_GC, SCHED_PRIORITY, NICE
+    Возвращает список засчитанных перекрёстков (IntersectionEvent)
     """
+    clock = clock or time.monotonic
     intersections_passed = 0
-    on_intersection = False
-    picked_up_passengers = False
-    post_stop_intersections = 0
-    route_actions = get_post_stop_actions(route_name)
-
-    # Для маршрутов со сценарием после остановки показываем общее количество
-    # перекрёстков: до остановки + количество действий после остановки.
-    display_total = total_intersections
-    if route_actions:
-        display_total = stop_at + len(route_actions)
+    detector = IntersectionDetector(robot, follower, MIN_INTERSECTION_GAP_DEGREES)
+
+    # План поездки, одометрия и длины участков по карте трассы (если карта есть)
+    odometry = Odometry(robot.tank, WHEEL_DIAMETER, AXLE_TRACK)
+    track = track or load_track()
+    path, plan = get_route_plan(route_name, track, stop_at)
+    edge_lengths = track.path_lengths(path) if path else []
+    edge_start = 0.0
+    target_speed = BASE_SPEED
+    tick = 0
+    profile = SpeedProfile(ACCELERATION, DECELERATION, CURVE_SLOWDOWN, CURVE_MIN_SPEED, clock=clock)
+    if recovery is None:
+        recovery = LineRecovery(robot, follower, LINE_LOST_DEGREES, RECOVERY_SPEED,
+                                RECOVERY_SWEEP_DEGREES, RECOVERY_SWEEPS, clock=clock)
+    recovery.reset()
+    metrics = metrics or METRICS
+
+    # Для маршрутов со сценарием показываем общее количество перекрёстков по плану
+    display_total = len(plan) if plan else total_intersections
 
     display.update("Moving", SERVER_IP, intersections_passed, display_total, route_name)
+    metrics.trip_started(clock())
+    REALTIME.trip_started(MANUAL_GC, SCHED_PRIORITY, NICE)
 
     # Робот выезжает со зоны старта на линию
     robot.drive_degrees(BASE_SPEED, BASE_SPEED, 300)
+    detector.rearm()
+    profile.reset()
+    if path:
+        odometry.set_pose(*track.nodes[path[0]])
 
     # Основной цикл движения по линии с подсчётом перекрёстков
     while True:
-        # Проверка кнопки "вниз" для прерывания движения
-        if button.down:
+        metrics.tick(clock())
+        # Проверка кнопки "вниз" (или внешней команды stop) для прерывания движения
+        if button.down or (cancel is not None and cancel.is_set()):
             robot.stop()
+            metrics.trip_finished("cancelled", clock(), len(recovery.events))
+            REALTIME.trip_finished()
             display.update("Cancelled by user", SERVER_IP, route_name=route_name)
             time.sleep(1.0)
-            return
+            return detector.events
+
+        # Поиск линии после схода: перекрёстки не считаются, пока линия не найдена
+        if recovery.searching:
+            if recovery.update():
+                continue
+            if recovery.failed:
+                metrics.trip_finished("line_lost", clock(), len(recovery.events))
+                REALTIME.trip_finished()
+                display.update("Line lost", SERVER_IP, intersections_passed, display_total, route_name)
+                return detector.events
+            display.update("Moving", SERVER_IP, intersections_passed, display_total, route_name)
+            detector.rearm()
+            profile.reset()
 
-        # Проверка перекрёстка
-        is_intersection = follower.detect_intersection()
+        # Проверка перекрёстка (робот продолжает следовать по линии и через перекрёсток)
+        event = detector.update()
 
-        if is_intersection and not on_intersection:
+        if event is not None:
             # Новый перекрёсток обнаружен
-            on_intersection = True
-            intersections_passed += 1
+            intersections_passed = event.index
+            metrics.intersection()
+
+            # Привязка одометрии к узлу карты и отсчёт следующего участка
+            edge_start = odometry.update()
+            if path and intersections_passed < len(path):
+                odometry.set_pose(*track.nodes[path[intersections_passed]])
 
             display.update("Moving", SERVER_IP, intersections_passed, display_total, route_name)
 
-            # Задержка на нужном перекрёстке
-            just_picked_up = False
-            if intersections_passed == stop_at:
-                robot.stop()
-                display.update("Picking up passengers", SERVER_IP, intersections_passed, display_total, route_name)
-                time.sleep(STOP_DELAY)
-                display.update("Moving", SERVER_IP, intersections_passed, display_total, route_name)
-                picked_up_passengers = True
-                just_picked_up = True
-
-            # Если для маршрута задан сценарий после остановки - выполняем его.
-            # Первый перекрёсток с действиями начинается ПОСЛЕ перекрёстка остановки.
-            if route_actions and picked_up_passengers and not just_picked_up:
-                post_stop_intersections += 1
-                action = route_actions[post_stop_intersections - 1] if post_stop_intersections <= len(route_actions) else "stop"
-
-                if action == "left":
-                    display.update("Turn left", SERVER_IP, intersections_passed, display_total, route_name)
-                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, BEFORE_TURN_DEGREES)
-                    robot.drive_degrees(-TURN_SPEED, TURN_SPEED, TURN_DEGREES)
-                elif action == "right":
-                    display.update("Turn right", SERVER_IP, intersections_passed, display_total, route_name)
-                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, BEFORE_TURN_DEGREES)
-                    robot.drive_degrees(TURN_SPEED, -TURN_SPEED, TURN_DEGREES)
-                elif action == "straight":
-                    display.update("Go straight", SERVER_IP, intersections_passed, display_total, route_name)
-                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, PASS_INTERSECTION_DEGREES)
-                elif action == "u_turn":
-                    display.update("U-turn", SERVER_IP, intersections_passed, display_total, route_name)
-                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, BEFORE_TURN_DEGREES)
-                    robot.drive_degrees(-TURN_SPEED, TURN_SPEED, UTURN_DEGREES)
-                elif action == "pause":
-                    robot.stop()
-                    display.update("Pause", SERVER_IP, intersections_passed, display_total, route_name)
-                    time.sleep(PAUSE_DELAY)
-                    display.update("Moving", SERVER_IP, intersections_passed, display_total, route_name)
-                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, PASS_INTERSECTION_DEGREES)
-                elif action == "stop":
-                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, 370)
-                    robot.drive_degrees(-TURN_SPEED, TURN_SPEED, 370)
-                    robot.stop()
+            if plan:
+                # После последнего пункта плана безопасно завершаем маршрут
+                steps = plan[intersections_passed - 1] if intersections_passed <= len(plan) else ("stop",)
+                finished = False
+                for action in steps:
+                    finished = perform_action(robot, display, action, intersections_passed, display_total, route_name)
+                    if finished:
+                        break
+                if finished:
                     break
-                else:
-                    # Неизвестное действие: безопасно едем прямо
-                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, PASS_INTERSECTION_DEGREES)
-            else:
-                # Проезжаем перекрёсток, чтобы не считать его повторно
-                robot.drive_degrees(BASE_SPEED, BASE_SPEED, PASS_INTERSECTION_DEGREES)
 
-                # Старое поведение для маршрутов без специальных сценариев
-                if not route_actions and intersections_passed >= total_intersections:
+                # После манёвра отсчёт пробега до следующего перекрёстка начинается заново,
+                # а после остановки или поворота на месте - разгон с нуля
+                detector.rearm()
+                edge_start = odometry.update()
+                if any(action != "straight" for action in steps):
+                    profile.reset()
+            else:
+                # Старое поведение для маршрутов без сценария: остановка и финиш по счётчику
+                if intersections_passed == stop_at:
+                    perform_action(robot, display, "pickup", intersections_passed, display_total, route_name)
+                    detector.rearm()
+                    edge_start = odometry.update()
+                    profile.reset()
+
+                if intersections_passed >= total_intersections:
+                    # Съезжаем с последнего перекрёстка и завершаем маршрут
+                    robot.drive_degrees(BASE_SPEED, BASE_SPEED, PASS_INTERSECTION_DEGREES)
                     break
 
-        elif not is_intersection:
-            # Покинули перекрёсток - сбрасываем флаг
-            on_intersection = False
+        # Целевая скорость по карте: быстрее на длинном участке, к ожидаемому
+        # перекрёстку - торможение до BASE_SPEED (или до APPROACH_STOP_SPEED перед остановкой)
+        if edge_lengths:
+            tick += 1
+            if event is not None:
+                target_speed = BASE_SPEED
+            elif tick % ODOMETRY_EVERY == 0:
+                remaining = 0.0
+                if intersections_passed < len(edge_lengths):
+                    remaining = edge_lengths[intersections_passed] - (odometry.update() - edge_start)
+                end_speed = BASE_SPEED
+                if intersections_passed < len(plan) and any(a in STOP_ACTIONS for a in plan[intersections_passed]):
+                    end_speed = min(BASE_SPEED, APPROACH_STOP_SPEED)
+                target_speed = min(LONG_EDGE_SPEED, profile.approach_limit(remaining - SLOW_ZONE_MM, end_speed))
 
         # Движение по линии
         error = follower.read_error()
+        if recovery.watch(error):
+            display.update("Searching line", SERVER_IP, intersections_passed, display_total, route_name)
+            continue
+        speed = profile.update(profile.curve_limit(target_speed, error))
         turn = KP * error
 
-        left_speed = BASE_SPEED - turn
-        right_speed = BASE_SPEED + turn
+        left_speed = speed - turn
+        right_speed = speed + turn
 
         left_speed = follower.clamp(left_speed, -MAX_SPEED, MAX_SPEED)
         right_speed = follower.clamp(right_speed, -MAX_SPEED, MAX_SPEED)
@@ -270,11 +595,22 @@ def movement(robot, follower, display, button, route_name="", total_intersection
         robot.drive(left_speed, right_speed)
 
     robot.stop()
+    metrics.trip_finished("finished", clock(), len(recovery.events))
+    REALTIME.trip_finished()
     display.update("Finished", SERVER_IP, route_name=route_name)
+    return detector.events
 
 
 def main():
-    button = Button()
+    from urllib.error import URLError, HTTPError
+    # Кнопки по событиям устройства: проверка button.down в такте - чтение атрибута
+    button = get_backend().buttons()
+
+    # Профилировщик: SIGUSR1 или ВЛЕВО + ВПРАВО (1 с) - вкл/выкл, файл в traces/
+    install_profiler(button)
+
+    # Настройки регулятора из профиля автоподбора (если он есть)
+    apply_tuning()
 
     # Инициализация робота (один раз)
     robot = Robot()
@@ -283,6 +619,13 @@ def main():
     # Инициализация обновления дисплея в отдельном потоке
     display = DisplayUpdater()
 
+    # Метрики для Prometheus: GET http://<робот>:METRICS_PORT/metrics
+    if METRICS_PORT:
+        start_server(METRICS_PORT)
+
+    # Объекты инициализации - в постоянное поколение сборщика (MANUAL_GC)
+    REALTIME.after_init(MANUAL_GC)
+
     # Основной цикл работы
     while True:
         # Ждём набора заявок или нажатия кнопки
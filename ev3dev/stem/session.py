@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Запись сессий run.main() на трассе и их воспроизведение вне робота
+
+Запись (record) запускает обычный run.main(), но устройства бэкенда HAL,
+часы и сон модуля run, fetch_routes() и reset_route() обёрнуты: каждое
+значение, которое видит программа, пишется в traces/session_<время>.log:
+    первая строка - заголовок JSON (настройки run.py, профиль калибровки,
+                    профиль автоподбора, модель моторов, карта трассы);
+    далее         - "t<TAB>вид<TAB>имя<TAB>значение JSON", t - секунды от начала.
+Виды событий: o - открытие устройства, s - датчик, p - энкодер, r - is_running,
+b - кнопка, v - батарея, h - ответ сервера, m - команда моторам, c - часы, z - сон.
+Пишутся только события главного потока (поток дисплея и профилировщик не мешают).
+
+Воспроизведение (replay) запускает тот же run.main() на записи: датчики,
+энкодеры, кнопки и ответы сервера отдаются в том же порядке, часы - записанные,
+сон ничего не ждёт, поэтому сессия проигрывается во много раз быстрее реального
+времени. Команды моторам сравниваются с записанными. Если программа запросила
+не то, что было записано (другое устройство или другой порядок чтений),
+воспроизведение останавливается с указанием события: поведение изменилось.
+Лишние или недостающие чтения часов и сон расхождением не считаются.
+
+Запуск:
+    ./session.py record [--output traces/session.log]     (на роботе, вместо ./run.py)
+    ./session.py replay traces/session_*.log [--diffs 5]   (на компьютере, пакетом)
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import importlib
+import threading
+
+import hal
+from hal.base import NullDisplay
+from traces import TRACES_DIR
+
+FLUSH_INTERVAL = 1.0 # Как часто сбрасывать запись на диск (секунды)
+BUTTON_NAMES = ("up", "down", "left", "right", "enter", "backspace")
+SOFT_KINDS = ("c", "z") # Часы и сон: при воспроизведении не обязаны совпадать по числу
+
+
+class SessionEnd(BaseException):
+    """
+    Запись кончилась. BaseException, а не Exception: цикл ожидания run.main()
+    перехватывает любые Exception и иначе крутился бы без конца
+    """
+
+
+class ReplayDivergence(BaseException):
+    """Программа запросила не то событие, что было записано"""
+
+
+# --- Запись ---
+
+class SessionLog(object):
+    """Файл событий сессии; пишет только поток, создавший запись, и не внутри обёрток HTTP"""
+    def __init__(self, path, header):
+        self.path = path
+        self.start = time.monotonic()
+        self.thread = threading.current_thread()
+        self.paused = 0
+        self.events = 0
+        self.next_flush = self.start + FLUSH_INTERVAL
+        header = dict(header)
+        header["clock_base"] = self.start
+        self.file = open(path, "w")
+        self.file.write(json.dumps(header, sort_keys=True) + "\n")
+
+    def active(self):
+        return self.paused == 0 and threading.current_thread() is self.thread
+
+    def record(self, kind, name, value):
+        if not self.active():
+            return
+        now = time.monotonic()
+        self.file.write("{:.4f}\t{}\t{}\t{}\n".format(now - self.start, kind, name, json.dumps(value)))
+        self.events += 1
+        if now >= self.next_flush:
+            self.next_flush = now + FLUSH_INTERVAL
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingTime(object):
+    """Замена модуля time в run: часы и сон пишутся в запись"""
+    def __init__(self, log):
+        self.log = log
+
+    def monotonic(self):
+        value = time.monotonic()
+        self.log.record("c", "", value)
+        return value
+
+    def sleep(self, seconds):
+        self.log.record("z", "", seconds)
+        time.sleep(seconds)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class RecordingSensor(object):
+    def __init__(self, sensor, port, log):
+        self._sensor = sensor
+        self._port = str(port)
+        self._log = log
+
+    @property
+    def mode(self):
+        return self._sensor.mode
+
+    @mode.setter
+    def mode(self, value):
+        self._sensor.mode = value
+
+    def value(self, n=0):
+        value = self._sensor.value(n)
+        self._log.record("s", self._port, value)
+        return value
+
+
+class RecordingMotor(object):
+    def __init__(self, motor, side, log):
+        self._motor = motor
+        self._side = side
+        self._log = log
+
+    @property
+    def position(self):
+        value = self._motor.position
+        self._log.record("p", self._side, value)
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self._motor, name)
+
+
+class RecordingTank(object):
+    """Привод: команды пишутся до пропуска повторов в hal.base.Tank (как их отдаёт программа)"""
+    def __init__(self, tank, log):
+        self._tank = tank
+        self._log = log
+        self.left_motor = RecordingMotor(tank.left_motor, "left", log)
+        self.right_motor = RecordingMotor(tank.right_motor, "right", log)
+
+    def on(self, left_speed, right_speed):
+        self._log.record("m", "on", [left_speed, right_speed])
+        self._tank.on(left_speed, right_speed)
+
+    def on_duty(self, left_duty, right_duty):
+        self._log.record("m", "on_duty", [left_duty, right_duty])
+        self._tank.on_duty(left_duty, right_duty)
+
+    def off(self, brake=True):
+        self._log.record("m", "off", [brake])
+        self._tank.off(brake=brake)
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        self._log.record("m", "on_for_degrees", [left_speed, right_speed, degrees, brake, block])
+        self._tank.on_for_degrees(left_speed, right_speed, degrees, brake=brake, block=block)
+
+    @property
+    def is_running(self):
+        value = self._tank.is_running
+        self._log.record("r", "", value)
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self._tank, name)
+
+
+class RecordingButtons(object):
+    def __init__(self, buttons, log):
+        self._buttons = buttons
+        self._log = log
+
+    def __getattr__(self, name):
+        value = getattr(self._buttons, name)
+        if name in BUTTON_NAMES:
+            self._log.record("b", name, bool(value))
+        return value
+
+
+class RecordingBackend(object):
+    """Бэкенд HAL поверх настоящего: всё, что прочитано главным потоком, пишется в запись"""
+    def __init__(self, backend, log):
+        self.backend = backend
+        self.log = log
+
+    def tank(self, left_port="C", right_port="B", elide=True):
+        tank = self.backend.tank(left_port, right_port, elide)
+        self.log.record("o", "tank", {"left_max": getattr(tank, "left_max", 1050),
+                                      "right_max": getattr(tank, "right_max", 1050)})
+        return RecordingTank(tank, self.log)
+
+    def color_sensor(self, port):
+        self.log.record("o", "sensor:{}".format(port), None)
+        return RecordingSensor(self.backend.color_sensor(port), port, self.log)
+
+    def battery_voltage(self):
+        value = self.backend.battery_voltage()
+        self.log.record("v", "", value)
+        return value
+
+    def buttons(self):
+        self.log.record("o", "buttons", None)
+        return RecordingButtons(self.backend.buttons(), self.log)
+
+    def display(self):
+        return self.backend.display()
+
+
+def recording_call(log, name, func):
+    """Обёртка fetch_routes/reset_route: пишется ответ или ошибка, а не HTTP внутри"""
+    def call(*args):
+        log.paused += 1
+        try:
+            result = func(*args)
+        except Exception as e:
+            log.paused -= 1
+            log.record("h", name, {"error": "{}: {}".format(type(e).__name__, e)})
+            raise
+        log.paused -= 1
+        log.record("h", name, {"result": result})
+        return result
+    return call
+
+
+def session_header(run):
+    """Всё, что run.main() берёт с диска робота, и настройки run.py на момент записи"""
+    from track import TRACKS_DIR
+    from calibration import DEFAULT_TRACK
+
+    track = None
+    try:
+        with open(os.path.join(TRACKS_DIR, "{}.json".format(DEFAULT_TRACK))) as f:
+            track = json.load(f)
+    except (OSError, IOError, ValueError):
+        pass
+    settings = dict((name, value) for name, value in vars(run).items()
+                    if name.isupper() and isinstance(value, (bool, int, float, str)))
+    return {
+        "session": 1,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "settings": settings,
+        "calibration": run.load_profile(),
+        "tuning": run.load_tuning(),
+        "motor_model": run.load_model() if run.DRIVE_MODE == "dps" else None,
+        "track": track,
+    }
+
+
+def record(path=None):
+    """run.main() с записью сессии до Ctrl+C или SIGTERM"""
+    import run
+
+    if path is None:
+        if not os.path.isdir(TRACES_DIR):
+            os.makedirs(TRACES_DIR)
+        path = os.path.join(TRACES_DIR, "session_{}.log".format(time.strftime("%Y%m%d_%H%M%S")))
+    log = SessionLog(path, session_header(run))
+    hal.set_backend(RecordingBackend(hal.get_backend(), log))
+    run.time = RecordingTime(log)
+    run.fetch_routes = recording_call(log, "fetch", run.fetch_routes)
+    run.reset_route = recording_call(log, "reset", run.reset_route)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Recording to {}".format(path))
+    try:
+        run.main()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+        print("{} events recorded".format(log.events))
+
+
+# --- Воспроизведение ---
+
+class Player(object):
+    """События записи по порядку; входы отдаются программе, команды сравниваются"""
+    def __init__(self, path, max_diffs=5):
+        self.path = path
+        with open(path) as f:
+            self.header = json.loads(f.readline())
+            self.events = []
+            for line in f:
+                t, kind, name, value = line.rstrip("\n").split("\t", 3)
+                self.events.append((float(t), kind, name, json.loads(value)))
+        self.base = self.header.get("clock_base", 0.0)
+        self.pos = 0
+        self.now = self.base
+        self.commands = 0
+        self.diffs = 0
+        self.first_diffs = [] # (номер события, t, команда, записано, сейчас)
+        self.max_diffs = max_diffs
+
+    def _describe(self, index):
+        t, kind, name, _ = self.events[index]
+        return "event {} (t={:.3f} s): recorded {} {}".format(index + 1, t, kind, name)
+
+    def _next(self, kind, name):
+        """Следующее событие, кроме часов и сна; другое - расхождение"""
+        events = self.events
+        while self.pos < len(events) and events[self.pos][1] in SOFT_KINDS:
+            self.pos += 1
+        if self.pos >= len(events):
+            raise SessionEnd()
+        t, event_kind, event_name, value = events[self.pos]
+        if event_kind != kind or event_name != name:
+            raise ReplayDivergence("{}, program asked for {} {}".format(self._describe(self.pos), kind, name))
+        self.pos += 1
+        self.now = self.base + t
+        return value
+
+    def input(self, kind, name=""):
+        return self._next(kind, name)
+
+    def command(self, name, args):
+        recorded = self._next("m", name)
+        self.commands += 1
+        if recorded != args:
+            self.diffs += 1
+            if len(self.first_diffs) < self.max_diffs:
+                self.first_diffs.append((self.pos, self.now - self.base, name, recorded, args))
+
+    def clock(self):
+        events = self.events
+        if self.pos < len(events) and events[self.pos][1] == "c":
+            self.now = events[self.pos][3]
+            self.pos += 1
+        elif self.pos < len(events):
+            self.now = self.base + events[self.pos][0]
+        else:
+            raise SessionEnd()
+        return self.now
+
+    def sleep(self, seconds):
+        if self.pos < len(self.events) and self.events[self.pos][1] == "z":
+            self.pos += 1
+
+    def http(self, name):
+        def call(*args):
+            response = self._next("h", name)
+            if "error" in response:
+                raise IOError(response["error"])
+            return response["result"]
+        return call
+
+    @property
+    def duration(self):
+        return self.events[-1][0] if self.events else 0.0
+
+
+class ReplayTime(object):
+    """Замена модуля time в run: записанные часы, сон без ожидания"""
+    def __init__(self, player):
+        self.player = player
+
+    def monotonic(self):
+        return self.player.clock()
+
+    def sleep(self, seconds):
+        self.player.sleep(seconds)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class ReplaySensor(object):
+    mode = "COL-REFLECT"
+
+    def __init__(self, player, port):
+        self.player = player
+        self.port = str(port)
+
+    def value(self, n=0):
+        return self.player.input("s", self.port)
+
+
+class ReplayMotor(object):
+    def __init__(self, player, side):
+        self.player = player
+        self.side = side
+
+    @property
+    def position(self):
+        return self.player.input("p", self.side)
+
+
+class ReplayTank(object):
+    def __init__(self, player, info):
+        self.player = player
+        self.left_max = info["left_max"]
+        self.right_max = info["right_max"]
+        self.left_motor = ReplayMotor(player, "left")
+        self.right_motor = ReplayMotor(player, "right")
+
+    def on(self, left_speed, right_speed):
+        self.player.command("on", [left_speed, right_speed])
+
+    def on_duty(self, left_duty, right_duty):
+        self.player.command("on_duty", [left_duty, right_duty])
+
+    def off(self, brake=True):
+        self.player.command("off", [brake])
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        self.player.command("on_for_degrees", [left_speed, right_speed, degrees, brake, block])
+
+    @property
+    def is_running(self):
+        return self.player.input("r")
+
+
+class ReplayButtons(object):
+    def __init__(self, player):
+        self.player = player
+
+    def __getattr__(self, name):
+        if name in BUTTON_NAMES:
+            return self.player.input("b", name)
+        raise AttributeError(name)
+
+
+class ReplayBackend(object):
+    """Бэкенд HAL из записи"""
+    def __init__(self, player):
+        self.player = player
+
+    def tank(self, left_port="C", right_port="B", elide=True):
+        return ReplayTank(self.player, self.player.input("o", "tank"))
+
+    def color_sensor(self, port):
+        self.player.input("o", "sensor:{}".format(port))
+        return ReplaySensor(self.player, port)
+
+    def battery_voltage(self):
+        return self.player.input("v")
+
+    def buttons(self):
+        self.player.input("o", "buttons")
+        return ReplayButtons(self.player)
+
+    def display(self):
+        return NullDisplay()
+
+
+def replay(path, max_diffs=5):
+    """
+    Проиграть запись через свежий run.main()
+    Возвращает словарь: events, duration, wall, commands, diffs, first_diffs, settings, error
+    """
+    import run
+    from display import DisplayUpdater
+    from track import TrackMap
+
+    class ReplayDisplay(DisplayUpdater):
+        """Дисплей без потока обновления и без вывода"""
+        def __init__(self):
+            DisplayUpdater.__init__(self, NullDisplay())
+
+        def start(self):
+            pass
+
+        def stop(self):
+            pass
+
+    player = Player(path, max_diffs)
+    header = player.header
+    importlib.reload(run) # константы и кэши run - как при запуске программы
+    changed = sorted(name for name, value in header.get("settings", {}).items() if getattr(run, name, None) != value)
+    hal.set_backend(ReplayBackend(player))
+    run.time = ReplayTime(player)
+    run.fetch_routes = player.http("fetch")
+    run.reset_route = player.http("reset")
+    run.load_profile = lambda robot=None, track=None: header.get("calibration")
+    run.load_tuning = lambda robot=None: header.get("tuning")
+    run.load_model = lambda robot=None, path=None: header.get("motor_model")
+    run.load_track = lambda name=None: TrackMap.from_dict(header["track"]) if header.get("track") else None
+    run.DisplayUpdater = ReplayDisplay
+    run.install_profiler = lambda buttons=None: None
+    run.METRICS_PORT = 0
+
+    error = None
+    started = time.perf_counter()
+    try:
+        run.main()
+    except SessionEnd:
+        pass
+    except ReplayDivergence as e:
+        error = str(e)
+    finally:
+        importlib.reload(run)
+    return {
+        "events": len(player.events),
+        "replayed": player.pos,
+        "duration": player.duration,
+        "wall": time.perf_counter() - started,
+        "commands": player.commands,
+        "diffs": player.diffs,
+        "first_diffs": player.first_diffs,
+        "settings": changed,
+        "error": error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record robot sessions and replay them off the robot")
+    commands = parser.add_subparsers(dest="command")
+    record_parser = commands.add_parser("record", help="запустить run.main() с записью сессии")
+    record_parser.add_argument("--output", help="файл записи (по умолчанию traces/session_<время>.log)")
+    replay_parser = commands.add_parser("replay", help="проиграть записи и сравнить команды моторам")
+    replay_parser.add_argument("files", nargs="+")
+    replay_parser.add_argument("--diffs", type=int, default=3, help="сколько расхождений команд показать")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.output)
+        return
+    if args.command != "replay":
+        parser.error("expected record or replay")
+
+    failed = 0
+    for path in args.files:
+        result = replay(path, args.diffs)
+        speedup = result["duration"] / result["wall"] if result["wall"] > 0 else 0.0
+        ok = result["error"] is None and result["diffs"] == 0
+        failed += 0 if ok else 1
+        print("{}: {} events, {:.1f} s recorded, replayed in {:.2f} s ({:.0f}x), {} commands, {} differ - {}".format(
+            os.path.basename(path), result["events"], result["duration"], result["wall"], speedup,
+            result["commands"], result["diffs"], "ok" if ok else "CHANGED"))
+        if result["settings"]:
+            print("  settings changed since recording: {}".format(", ".join(result["settings"])))
+        for index, t, name, recorded, now in result["first_diffs"]:
+            print("  event {} (t={:.3f} s) {}: recorded {}, now {}".format(index, t, name, recorded, now))
+        if result["error"]:
+            print("  diverged at {} of {} events: {}".format(result["replayed"], result["events"], result["error"]))
+    if failed:
+        print("{} of {} sessions changed".format(failed, len(args.files)))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
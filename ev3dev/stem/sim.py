@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Симулятор привода робота для проверок вне EV3
+
+SimTank повторяет используемую часть интерфейса ev3dev2 MoveTank
+(on, off, on_for_degrees, is_running, left_motor/right_motor.position) и
+передаётся в run.Robot(tank=...). Время модельное: world.step(dt) двигает
+колёса и истинное положение робота (x, y, heading) с известной геометрией.
+Блокирующий on_for_degrees сам прокручивает время до окончания движения.
+
+Для прогона movement() целиком есть линия на полу (SimLine) и датчики
+отражения (SimColorSensor) для run.LineFollower(sensors=...). С auto_step
+каждая команда tank.on() продвигает модель на один такт, а инерция мотора
+(motor_tau) и сцепление колёс (traction) делают резкие скачки скорости
+заметными: колёса проскальзывают, робот сходит с линии.
+
+Напряжение батареи (battery_voltage) ограничивает скорость: в режиме
+скорости (on, как run-forever с регулятором драйвера) мотор не разгоняется
+выше доступной при этом напряжении, а в режиме скважности (on_duty, как
+run-direct) скорость пропорциональна скважности и напряжению за вычетом
+потерь на трение (motor_drag).
+"""
+
+import math
+import random
+from collections import deque
+
+MAX_SPEED_DPS = 1050.0 # Скорость мотора при 100% (градусы/сек), как у LargeMotor EV3
+NOMINAL_VOLTAGE = 8.0 # Напряжение батареи, при котором 100% скважности дают MAX_SPEED_DPS
+
+
+class SimMotor(object):
+    """Мотор с энкодером: скорость в % от максимальной, положение в целых градусах"""
+    def __init__(self):
+        self.speed = 0.0 # заданная скорость (%)
+        self.actual = 0.0 # фактическая скорость с учётом инерции (%)
+        self.exact_position = 0.0
+        self.target = None # цель on_for_degrees (градусы) или None
+        self.duty = None # скважность (%) в режиме on_duty, иначе None
+        # Характеристика мотора (motor_model.py, SimWorld.apply_motor_model)
+        self.max_dps = MAX_SPEED_DPS # скорость при 100% скважности и номинальном напряжении
+        self.tau = None # своя постоянная времени (None - motor_tau модели)
+        self.drag = None # свои потери на трение (None - motor_drag модели)
+        self.dead_steps = 0 # запаздывание реакции на команду (тактов модели)
+        self.overshoot = 0.0 # перебег on_for_degrees на скорости 100% (градусы)
+        self._delay = deque()
+
+    @property
+    def position(self):
+        return int(round(self.exact_position))
+
+    @property
+    def is_running(self):
+        return self.speed != 0.0 or bool(self.duty)
+
+    def advance(self, dt, tau=0.0, supply=1.0, drag=0.0):
+        """
+        Повернуть вал за dt секунд; возвращает поворот в градусах
+        supply - доля номинального напряжения, drag - потери на трение (% скорости)
+        """
+        gain = self.max_dps / MAX_SPEED_DPS
+        if self.duty is not None:
+            wanted = self.duty * supply
+            wanted = 0.0 if abs(wanted) <= drag else (wanted - math.copysign(drag, wanted)) * gain
+        else:
+            limit = (100.0 * supply - drag) * gain
+            wanted = limit if self.speed > limit else -limit if self.speed < -limit else self.speed
+        if self.dead_steps and self.target is None:
+            # Запаздывание: команда доходит до мотора через dead_steps тактов
+            delay = self._delay
+            delay.append(wanted)
+            while len(delay) <= self.dead_steps:
+                delay.appendleft(0.0)
+            while len(delay) > self.dead_steps + 1:
+                delay.popleft()
+            wanted = delay.popleft()
+        if tau > 0.0 and self.target is None:
+            # Инерция: фактическая скорость догоняет заданную с постоянной времени tau
+            self.actual += (wanted - self.actual) * min(1.0, dt / tau)
+        else:
+            self.actual = wanted
+        delta = self.actual / 100.0 * MAX_SPEED_DPS * dt
+        if self.target is not None:
+            remaining = self.target - self.exact_position
+            if abs(delta) >= abs(remaining):
+                delta = remaining
+                self.speed = 0.0
+                self.actual = 0.0
+                self.target = None
+        self.exact_position += delta
+        return delta
+
+
+class SimWorld(object):
+    """Истинное положение робота и модельное время"""
+    def __init__(self, wheel_diameter=56.0, axle_track=120.0, slip=0.0, dt=0.01, seed=1,
+                 motor_tau=0.0, traction=None, battery_voltage=NOMINAL_VOLTAGE, motor_drag=0.0):
+        self.wheel_diameter = wheel_diameter
+        self.axle_track = axle_track
+        self.slip = slip # относительный шум проскальзывания колёс (0 - идеальные колёса)
+        self.motor_tau = motor_tau # постоянная времени разгона мотора (секунды, 0 - мгновенно)
+        self.traction = traction # предельное ускорение колеса по полу (мм/с^2, None - без пробуксовки)
+        self.battery_voltage = battery_voltage # напряжение батареи (В)
+        self.motor_drag = motor_drag # потери скорости на трение в режиме скважности (%)
+        self.dt = dt
+        self.rnd = random.Random(seed)
+        self.time = 0.0
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0
+        self.left = SimMotor()
+        self.right = SimMotor()
+        self.ground_left = 0.0 # скорость колёс относительно пола (мм/с)
+        self.ground_right = 0.0
+        self.observers = [] # функции observer(world), вызываются после каждого шага
+
+    def place(self, x, y, heading):
+        """Поставить робота в точку (x, y) с курсом heading (радианы)"""
+        self.x, self.y, self.heading = float(x), float(y), float(heading)
+
+    def _grip(self, ground, wheel, dt):
+        """Скорость колеса по полу: меняется не быстрее, чем позволяет сцепление"""
+        limit = self.traction * dt
+        if wheel > ground + limit:
+            return ground + limit
+        if wheel < ground - limit:
+            return ground - limit
+        return wheel
+
+    def step(self, dt=None):
+        """Продвинуть модель на dt секунд"""
+        dt = self.dt if dt is None else dt
+        mm_per_degree = math.pi * self.wheel_diameter / 360.0
+
+        supply = self.battery_voltage / NOMINAL_VOLTAGE
+        dl = self._advance(self.left, dt, supply) * mm_per_degree
+        dr = self._advance(self.right, dt, supply) * mm_per_degree
+        if self.traction is not None:
+            # Пробуксовка: энкодер считает обороты колеса, а по полу робот едет медленнее
+            self.ground_left = self._grip(self.ground_left, dl / dt, dt)
+            self.ground_right = self._grip(self.ground_right, dr / dt, dt)
+            dl = self.ground_left * dt
+            dr = self.ground_right * dt
+        if self.slip:
+            # Проскальзывание: колесо проходит по полу не столько, сколько показал энкодер
+            dl *= 1.0 + self.rnd.gauss(0.0, self.slip)
+            dr *= 1.0 + self.rnd.gauss(0.0, self.slip)
+
+        ds = (dl + dr) / 2.0
+        dtheta = (dr - dl) / self.axle_track
+        mid = self.heading + dtheta / 2.0
+        self.x += ds * math.cos(mid)
+        self.y += ds * math.sin(mid)
+        self.heading = (self.heading + dtheta + math.pi) % (2.0 * math.pi) - math.pi
+        self.time += dt
+        for observer in self.observers:
+            observer(self)
+
+    def clock(self):
+        """Модельное время (для movement(clock=...))"""
+        return self.time
+
+
+    def _advance(self, motor, dt, supply):
+        tau = self.motor_tau if motor.tau is None else motor.tau
+        drag = self.motor_drag if motor.drag is None else motor.drag
+        return motor.advance(dt, tau, supply, drag)
+
+    def apply_motor_model(self, model):
+        """Параметры моторов из характеристики motor_model.py (словарь с ключами left/right)"""
+        for motor, side in ((self.left, "left"), (self.right, "right")):
+            params = model[side]
+            motor.max_dps = float(params["max_dps"])
+            motor.tau = float(params["tau_s"])
+            motor.drag = float(params["drag_duty"])
+            motor.dead_steps = int(round(params["dead_time_s"] / self.dt))
+            motor.overshoot = float(params["overshoot_deg"])
+
+
+class SimTank(object):
+    """Замена ev3dev2 MoveTank поверх SimWorld"""
+    def __init__(self, world, auto_step=False):
+        self.world = world
+        self.auto_step = auto_step # on() продвигает модель на такт (цикл управления без sleep)
+        self.left_motor = world.left
+        self.right_motor = world.right
+
+    @property
+    def is_running(self):
+        return self.left_motor.is_running or self.right_motor.is_running
+
+    def on(self, left_speed, right_speed):
+        self.left_motor.target = None
+        self.right_motor.target = None
+        self.left_motor.duty = None
+        self.right_motor.duty = None
+        self.left_motor.speed = float(left_speed)
+        self.right_motor.speed = float(right_speed)
+        if self.auto_step:
+            self.world.step()
+
+    def on_duty(self, left_duty, right_duty):
+        """Скважность в % (run-direct): скорость зависит от напряжения и нагрузки"""
+        for motor, duty in ((self.left_motor, left_duty), (self.right_motor, right_duty)):
+            motor.target = None
+            motor.speed = 0.0
+            motor.duty = max(-100.0, min(100.0, float(duty))) # как драйвер: не больше 100%
+        if self.auto_step:
+            self.world.step()
+
+    def off(self, brake=True):
+        self.on(0, 0)
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        """Как в ev3dev2: быстрый мотор проходит degrees, медленный - пропорционально"""
+        fastest = max(abs(left_speed), abs(right_speed))
+        if fastest == 0 or degrees == 0:
+            return
+        for motor, speed in ((self.left_motor, left_speed), (self.right_motor, right_speed)):
+            motor.duty = None
+            motor.speed = float(speed)
+            motor.target = motor.exact_position + degrees * speed / float(fastest)
+            # Перебег при торможении растёт со скоростью
+            motor.target += math.copysign(motor.overshoot * abs(speed) / 100.0, degrees * speed)
+            if speed == 0:
+                motor.target = None
+        if block:
+            while self.is_running:
+                self.world.step()
+
+
+class SimLine(object):
+    """
+    Чёрная линия на белом поле: набор отрезков (x1, y1, x2, y2) одной ширины
+    Для быстрого поиска ближайшего отрезка поле разбито на квадратные ячейки
+    """
+    def __init__(self, segments, width=20.0, cell=50.0):
+        self.segments = [tuple(float(v) for v in seg) for seg in segments]
+        self.half_width = width / 2.0
+        self.cell = float(cell)
+        self.grid = {}
+        reach = self.half_width + self.cell # запас, чтобы соседняя ячейка тоже знала об отрезке
+        for seg in self.segments:
+            x1, y1, x2, y2 = seg
+            for cx in range(int(math.floor((min(x1, x2) - reach) / cell)), int(math.floor((max(x1, x2) + reach) / cell)) + 1):
+                for cy in range(int(math.floor((min(y1, y2) - reach) / cell)), int(math.floor((max(y1, y2) + reach) / cell)) + 1):
+                    self.grid.setdefault((cx, cy), []).append(seg)
+
+    def distance(self, x, y):
+        """Расстояние от точки до ближайшей оси линии (мм); далеко от линии - бесконечность"""
+        best = float("inf")
+        for x1, y1, x2, y2 in self.grid.get((int(math.floor(x / self.cell)), int(math.floor(y / self.cell))), ()):
+            dx, dy = x2 - x1, y2 - y1
+            length2 = dx * dx + dy * dy
+            t = 0.0 if length2 == 0.0 else ((x - x1) * dx + (y - y1) * dy) / length2
+            t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+            d = math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+            if d < best:
+                best = d
+        return best
+
+
+def lap_line(width=1400.0, height=800.0, radius=200.0, marker_length=120.0, corner_steps=12):
+    """
+    Замкнутый круг: прямоугольник со скруглёнными углами и поперечными метками
+    (перекрёстками) посередине каждой стороны
+    Возвращает (отрезки линии, точки меток, длина круга в мм); круг начинается
+    в левом нижнем конце нижней стороны, движение против часовой стрелки
+    """
+    r = radius
+    corners = ((width - r, r, -90.0), (width - r, height - r, 0.0), (r, height - r, 90.0), (r, r, 180.0))
+    points = []
+    for cx, cy, start in corners:
+        for k in range(corner_steps + 1):
+            angle = math.radians(start + 90.0 * k / corner_steps)
+            points.append((cx + r * math.cos(angle), cy + r * math.sin(angle)))
+    points.append(points[0])
+    segments = [(a[0], a[1], b[0], b[1]) for a, b in zip(points, points[1:])]
+
+    half = marker_length / 2.0
+    markers = ((width / 2.0, 0.0), (width, height / 2.0), (width / 2.0, height), (0.0, height / 2.0))
+    for mx, my in markers:
+        if my in (0.0, height):
+            segments.append((mx, my - half, mx, my + half))
+        else:
+            segments.append((mx - half, my, mx + half, my))
+
+    length = 2.0 * (width - 2.0 * r) + 2.0 * (height - 2.0 * r) + 2.0 * math.pi * r
+    return segments, markers, length
+
+
+class SimColorSensor(object):
+    """
+    Датчик отражения над полем SimLine, закреплён на роботе в точке
+    (forward вперёд от оси колёс, lateral влево) и видит пятно радиуса spot
+    """
+    def __init__(self, world, line, forward=70.0, lateral=0.0, white=70, black=8, spot=4.0, noise=1.0):
+        self.world = world
+        self.line = line
+        self.forward = forward
+        self.lateral = lateral
+        self.white = white
+        self.black = black
+        self.spot = spot
+        self.noise = noise
+        self.mode = "COL-REFLECT"
+
+    def position(self):
+        w = self.world
+        c, s = math.cos(w.heading), math.sin(w.heading)
+        return w.x + self.forward * c - self.lateral * s, w.y + self.forward * s + self.lateral * c
+
+    def value(self, n=0):
+        x, y = self.position()
+        d = self.line.distance(x, y)
+        # Доля пятна над чёрным: линейный переход на краю линии шириной 2 * spot
+        cover = (self.line.half_width + self.spot - d) / (2.0 * self.spot)
+        cover = 0.0 if cover < 0.0 else 1.0 if cover > 1.0 else cover
+        raw = self.white - (self.white - self.black) * cover
+        if self.noise:
+            raw += self.world.rnd.gauss(0.0, self.noise)
+        return int(round(min(100.0, max(0.0, raw))))
+
+
+def line_sensors(world, line, spacing=32.0, forward=70.0, **kwargs):
+    """
+    Пара датчиков для LineFollower(sensors=...): расстояние между ними spacing
+    Датчик левого канала стоит справа от линии: при таком монтаже знак
+    ошибки l - r совпадает с регулятором в run.movement()
+    """
+    left = SimColorSensor(world, line, forward, -spacing / 2.0, **kwargs)
+    right = SimColorSensor(world, line, forward, spacing / 2.0, **kwargs)
+    return left, right
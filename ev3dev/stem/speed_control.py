@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Замкнутое управление скоростью колёс в градусах в секунду
+
+В обычном режиме (tank.on) скорость задаётся в % и поддерживается
+регулятором драйвера ev3dev. Когда батарея садится, 90% становятся
+недостижимы: мотор упирается в напряжение, а второе колесо продолжает ехать
+со своей скоростью - пропорция скоростей (поворот) нарушается, и никто
+об этом не знает.
+
+WheelSpeedController управляет моторами скважностью (tank.on_duty,
+run-direct) и сам замыкает контур:
+- цель для каждого колеса - градусы в секунду;
+- скорость колеса - разность показаний энкодеров за такт (сглаженная);
+- прямая связь по напряжению: скважность для цели пересчитывается на
+  текущее напряжение батареи (опрос раз в voltage_every тактов);
+- ПИ-поправка по ошибке скорости с ограничением интеграла;
+- если цель недостижима при текущем напряжении, обе цели уменьшаются в
+  одной пропорции - поворот сохраняется, снижается только скорость;
+- ошибка отслеживания пишется в заранее выделенный кольцевой журнал,
+  summary() даёт СКО и максимум, save() - CSV для анализа.
+"""
+
+import os
+import math
+import time
+from array import array
+
+NOMINAL_VOLTAGE = 8.0 # Напряжение, при котором 100% скважности дают max_dps (В)
+LOG_FIELDS = ("time", "volts", "left_target", "left_speed", "left_duty", "right_target", "right_speed", "right_duty")
+
+
+class WheelSpeedController(object):
+    """ПИ-регулятор скорости двух колёс (град/с) поверх скважности мотора"""
+    def __init__(self, tank, voltage=None, max_dps=1050.0, kp=0.02, ki=0.2, drag_duty=0.0,
+                 speed_alpha=0.5, voltage_every=50, voltage_alpha=0.2, integral_limit=30.0, integral_band=60.0,
+                 log_size=3000, clock=time.monotonic):
+        self.tank = tank
+        self.voltage = voltage # функция без аргументов -> напряжение (В); None - всегда номинальное
+        self.max_dps = float(max_dps) # скорость при 100% скважности и номинальном напряжении
+        self.left_max_dps = self.right_max_dps = self.max_dps
+        self.kp = float(kp) # % скважности на 1 град/с ошибки
+        self.ki = float(ki) # % скважности на 1 град ошибки (интеграл ошибки скорости)
+        self.drag_duty = float(drag_duty) # скважность, уходящая на трение (%)
+        self.left_drag = self.right_drag = self.drag_duty
+        self.speed_alpha = float(speed_alpha) # сглаживание измеренной скорости
+        self.voltage_every = voltage_every # опрашивать напряжение раз в N тактов
+        self.voltage_alpha = float(voltage_alpha) # сглаживание напряжения
+        self.integral_limit = float(integral_limit) # предел интегральной поправки (% скважности)
+        self.integral_band = float(integral_band) # интеграл копится, только когда |ошибка| меньше (град/с)
+        self.clock = clock
+
+        self.volts = NOMINAL_VOLTAGE
+        self.ticks = 0
+        self.limited = 0 # тактов, в которые цель была урезана по напряжению
+
+        # Журнал: по массиву на поле, без выделения памяти в такте
+        self.log_size = log_size
+        self.log = dict((name, array("d", [0.0]) * log_size) for name in LOG_FIELDS)
+        self.reset_log()
+        self.reset()
+
+    def reset(self):
+        """Забыть скорости и интегралы (после остановки или движения на градусы)"""
+        self.last_time = None
+        self.last_left = None
+        self.last_right = None
+        self.left_speed = 0.0
+        self.right_speed = 0.0
+        self.left_integral = 0.0
+        self.right_integral = 0.0
+
+    def apply_model(self, model):
+        """Прямая связь по характеристике моторов (motor_model.load_model): своя для каждого колеса"""
+        self.left_max_dps = model["left"]["max_dps"]
+        self.right_max_dps = model["right"]["max_dps"]
+        self.left_drag = model["left"]["drag_duty"]
+        self.right_drag = model["right"]["drag_duty"]
+
+    def reset_log(self):
+        self.log_index = 0
+        self.log_count = 0
+        self.samples = 0
+        self.square_sum = 0.0
+        self.max_error = 0.0
+        self.limited = 0
+
+    def _read_voltage(self):
+        if self.voltage is None:
+            return
+        if self.ticks % self.voltage_every == 0:
+            volts = self.voltage()
+            if self.ticks == 0:
+                self.volts = volts
+            else:
+                self.volts += self.voltage_alpha * (volts - self.volts)
+
+    def available_dps(self):
+        """
+        Наибольшая скорость колёс при текущем напряжении (по более слабому колесу)
+        Трение - известное drag плюс накопленная интегральная поправка: в
+        установившемся режиме она равна неучтённой части трения
+        """
+        supply = 100.0 * self.volts / NOMINAL_VOLTAGE
+        scale = self.volts / NOMINAL_VOLTAGE
+        left_drag = self.left_drag + abs(self.left_integral) * scale
+        right_drag = self.right_drag + abs(self.right_integral) * scale
+        return min(self.left_max_dps * (supply - left_drag),
+                   self.right_max_dps * (supply - right_drag)) / 100.0
+
+    def _duty(self, target, speed, integral, max_dps, drag):
+        """Скважность: прямая связь по напряжению + П-часть (интеграл считается отдельно)"""
+        if target == 0.0:
+            feedforward = 0.0
+        else:
+            feedforward = target / max_dps * 100.0 + math.copysign(drag, target)
+            feedforward *= NOMINAL_VOLTAGE / self.volts
+        return feedforward + self.kp * (target - speed) + integral
+
+    def drive(self, left_dps, right_dps):
+        """Такт регулятора: цели в град/с для левого и правого колеса"""
+        now = self.clock()
+        left = self.tank.left_motor.position
+        right = self.tank.right_motor.position
+        self._read_voltage()
+        self.ticks += 1
+
+        measured = self.last_time is not None
+        if measured:
+            dt = now - self.last_time
+            if dt > 0.0:
+                a = self.speed_alpha
+                self.left_speed += a * ((left - self.last_left) / dt - self.left_speed)
+                self.right_speed += a * ((right - self.last_right) / dt - self.right_speed)
+        else:
+            dt = 0.0
+        self.last_time = now
+        self.last_left = left
+        self.last_right = right
+
+        # Недостижимая цель: обе скорости уменьшаются в одной пропорции
+        available = self.available_dps()
+        fastest = max(abs(left_dps), abs(right_dps))
+        if fastest > available > 0.0:
+            scale = available / fastest
+            left_dps *= scale
+            right_dps *= scale
+            self.limited += 1
+
+        left_error = left_dps - self.left_speed
+        right_error = right_dps - self.right_speed
+        left_duty = self._duty(left_dps, self.left_speed, self.left_integral, self.left_max_dps, self.left_drag)
+        right_duty = self._duty(right_dps, self.right_speed, self.right_integral, self.right_max_dps, self.right_drag)
+        # Интеграл копится только около цели (не на разгоне) и пока скважность не упёрлась в предел
+        if abs(left_duty) < 100.0 and abs(left_error) < self.integral_band:
+            self.left_integral = self._clamp(self.left_integral + self.ki * left_error * dt)
+        if abs(right_duty) < 100.0 and abs(right_error) < self.integral_band:
+            self.right_integral = self._clamp(self.right_integral + self.ki * right_error * dt)
+        if left_dps == 0.0 and right_dps == 0.0:
+            self.left_integral = self.right_integral = 0.0
+
+        self.tank.on_duty(left_duty, right_duty)
+        self._record(now, left_dps, left_duty, right_dps, right_duty, left_error if measured else None, right_error)
+
+    def _clamp(self, value):
+        limit = self.integral_limit
+        return limit if value > limit else -limit if value < -limit else value
+
+    def _record(self, now, left_dps, left_duty, right_dps, right_duty, left_error, right_error):
+        if left_error is not None:
+            # Первый такт после reset() без измеренной скорости в статистику не идёт
+            self.samples += 2
+            self.square_sum += left_error * left_error + right_error * right_error
+            worst = max(abs(left_error), abs(right_error))
+            if worst > self.max_error:
+                self.max_error = worst
+
+        i = self.log_index
+        log = self.log
+        log["time"][i] = now
+        log["volts"][i] = self.volts
+        log["left_target"][i] = left_dps
+        log["left_speed"][i] = self.left_speed
+        log["left_duty"][i] = max(-100.0, min(100.0, left_duty))
+        log["right_target"][i] = right_dps
+        log["right_speed"][i] = self.right_speed
+        log["right_duty"][i] = max(-100.0, min(100.0, right_duty))
+        self.log_index = (i + 1) % self.log_size
+        if self.log_count < self.log_size:
+            self.log_count += 1
+
+    def summary(self):
+        """Ошибка отслеживания скорости с последнего reset_log()"""
+        return {
+            "samples": self.samples,
+            "rms_dps": round(math.sqrt(self.square_sum / self.samples), 1) if self.samples else None,
+            "max_dps": round(self.max_error, 1),
+            "volts": round(self.volts, 2),
+            "limited": self.limited,
+        }
+
+    def rows(self):
+        """Записи журнала от старых к новым"""
+        start = (self.log_index - self.log_count) % self.log_size
+        for k in range(self.log_count):
+            i = (start + k) % self.log_size
+            yield tuple(self.log[name][i] for name in LOG_FIELDS)
+
+    def save(self, path):
+        """Сохранить журнал в CSV"""
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with open(path, "w") as f:
+            f.write(",".join(LOG_FIELDS) + "\n")
+            for row in self.rows():
+                f.write(",".join("{:.3f}".format(v) for v in row) + "\n")
+        return path
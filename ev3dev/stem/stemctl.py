@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Клиент для резидентного режима (daemon.py)
+
+Примеры:
+    ./stemctl.py status
+    ./stemctl.py start green 0
+    ./stemctl.py calibrate
+    ./stemctl.py calibrate white
+    ./stemctl.py stop
+    ./stemctl.py profile
+"""
+
+import os
+import sys
+import socket
+
+SOCKET_PATH = os.environ.get("STEM_SOCKET", "/tmp/stem.sock") # Путь к UNIX-сокету демона
+TIMEOUT = 10.0 # Таймаут ответа демона (секунды)
+
+
+def send_command(command, socket_path=SOCKET_PATH, timeout=TIMEOUT):
+    """Отправить команду демону и вернуть строку ответа"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        sock.sendall((command + "\n").encode("utf-8"))
+        chunks = []
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith(b"\n"):
+                break
+        return b"".join(chunks).decode("utf-8", "replace").strip()
+    finally:
+        sock.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: stemctl.py start [ROUTE [INDEX]] | stop | status | calibrate [auto|white|black] | quit")
+        return 2
+
+    try:
+        print(send_command(" ".join(sys.argv[1:])))
+    except (OSError, socket.timeout) as e:
+        print("Daemon is not available ({}): {}".format(SOCKET_PATH, e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
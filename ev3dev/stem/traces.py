@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Записи показаний датчиков линии (трассы) для воспроизведения вне робота
+
+Формат файла - CSV с заголовком из комментариев:
+    # intersections=3
+    # l_black=8
+    t,left,right,label
+    0.000,62,58,0
+    ...
+Колонка label необязательна: 1 - датчики над перекрёстком (разметка).
+Записи складываются в каталог traces/ рядом с программой.
+"""
+
+import os
+import random
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACES_DIR = os.path.join(HERE, "traces") # Каталог записей датчиков
+
+
+class ReplaySensor(object):
+    """Заглушка ColorSensor: по кругу отдаёт записанные значения"""
+    def __init__(self, values):
+        self.values = values
+        self.pos = -1
+
+    def value(self, n=0):
+        self.pos = (self.pos + 1) % len(self.values)
+        return self.values[self.pos]
+
+
+def load_trace(path):
+    """Прочитать запись: словарь с header, t, left, right, label (или None)"""
+    header = {}
+    t, left, right, label = [], [], [], []
+    columns = None
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                key, _, value = line[1:].partition("=")
+                header[key.strip()] = value.strip()
+                continue
+            if columns is None:
+                columns = line.split(",")
+                continue
+            row = dict(zip(columns, line.split(",")))
+            t.append(float(row["t"]))
+            left.append(int(row["left"]))
+            right.append(int(row["right"]))
+            if "label" in row:
+                label.append(int(row["label"]))
+
+    return {
+        "header": header,
+        "t": t,
+        "left": left,
+        "right": right,
+        "label": label if len(label) == len(t) else None,
+    }
+
+
+def save_trace(path, t, left, right, label=None, header=None):
+    """Сохранить запись в CSV"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with open(path, "w") as f:
+        for key, value in sorted((header or {}).items()):
+            f.write("# {}={}\n".format(key, value))
+        if label is None:
+            f.write("t,left,right\n")
+            for row in zip(t, left, right):
+                f.write("{:.4f},{},{}\n".format(*row))
+        else:
+            f.write("t,left,right,label\n")
+            for row in zip(t, left, right, label):
+                f.write("{:.4f},{},{},{}\n".format(*row))
+
+
+def synthetic_trace(seconds=60.0, dt=0.01, white=62, black=9, noise=3.0,
+                    intersection_every=4.0, intersection_ticks=12,
+                    spike_prob=0.01, seed=1):
+    """
+    Размеченная синтетическая запись: белое с шумом, периодические
+    перекрёстки (оба датчика на чёрном) и одиночные выбросы к чёрному
+    на случайном датчике или на обоих сразу
+    """
+    rnd = random.Random(seed)
+    n = int(seconds / dt)
+    period = int(intersection_every / dt)
+
+    def clip(v):
+        return max(0, min(100, int(round(v))))
+
+    t, left, right, label = [], [], [], []
+    for i in range(n):
+        on_cross = period > 0 and (i % period) >= period - intersection_ticks
+        base = black if on_cross else white
+        l = base + rnd.gauss(0, noise)
+        r = base + rnd.gauss(0, noise)
+
+        if not on_cross and rnd.random() < spike_prob:
+            which = rnd.randint(0, 2)
+            if which in (0, 2):
+                l = black + rnd.gauss(0, noise)
+            if which in (1, 2):
+                r = black + rnd.gauss(0, noise)
+
+        t.append(i * dt)
+        left.append(clip(l))
+        right.append(clip(r))
+        label.append(1 if on_cross else 0)
+
+    intersections = sum(1 for i in range(1, n) if label[i] and not label[i - 1])
+    header = {"synthetic": 1, "intersections": intersections,
+              "l_black": black, "l_white": white, "r_black": black, "r_white": white}
+    return {"header": header, "t": t, "left": left, "right": right, "label": label}
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Карта трассы: перекрёстки (узлы) и участки линии между ними (рёбра)
+
+Карта хранится в tracks/<трасса>.json (имя трассы то же, что и для профилей
+калибровки, см. calibration.DEFAULT_TRACK):
+    {
+      "nodes": {"S": [0, 0], "A": [400, 0], ...},   # координаты узлов (мм)
+      "edges": [["S", "A"], ["A", "B", 520], ...],  # длина (мм) необязательна
+      "routes": {"green": ["S", "A", "B", ...]}     # узлы, которые проезжает маршрут
+    }
+Если длина ребра не указана, берётся расстояние между узлами по прямой.
+Узел маршрута с индексом k - перекрёсток номер k (S - зона старта).
+Остальные ключи файла (start, requests, turn_costs, ...) доступны в options
+и используются планировщиком маршрутов (planner.py).
+Карта с ошибкой (неверный JSON, ребро или маршрут через неизвестный узел,
+маршрут по несуществующему участку) не загружается: movement() едет без
+карты, как при отсутствии файла.
+"""
+
+import os
+import json
+import math
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRACKS_DIR = os.path.join(HERE, "tracks") # Каталог карт трасс
+
+# Загруженные карты: путь -> (время изменения файла, TrackMap)
+_loaded = {}
+
+
+class TrackMap(object):
+    """Граф трассы с длинами участков"""
+    def __init__(self, nodes, edges, routes=None, options=None):
+        self.nodes = dict((name, (float(xy[0]), float(xy[1]))) for name, xy in nodes.items())
+        self.edges = {}
+        for edge in edges:
+            a, b = edge[0], edge[1]
+            if a not in self.nodes or b not in self.nodes:
+                raise ValueError("edge {}-{} references unknown node".format(a, b))
+            length = float(edge[2]) if len(edge) > 2 else self.straight_distance(a, b)
+            self.edges[(a, b)] = length
+            self.edges[(b, a)] = length
+        self.routes = dict((name.lower(), list(path)) for name, path in (routes or {}).items())
+        self.options = options or {}
+        self.planner = None # RoutePlanner, создаётся planner.get_planner()
+        self._validate()
+
+    def _validate(self):
+        """ValueError, если маршруты, старт или заявки ссылаются на неизвестные узлы и участки"""
+        for name, path in self.routes.items():
+            for a, b in zip(path, path[1:]):
+                if (a, b) not in self.edges:
+                    raise ValueError("route {} uses unknown edge {}-{}".format(name, a, b))
+            if path and path[0] not in self.nodes:
+                raise ValueError("route {} starts at unknown node {}".format(name, path[0]))
+        stops = list(self.options.get("start", []))
+        for pair in self.options.get("requests", {}).values():
+            stops.extend(pair)
+        for node in stops:
+            if node not in self.nodes:
+                raise ValueError("unknown node {} in start or requests".format(node))
+
+    @classmethod
+    def from_dict(cls, data):
+        options = dict((key, value) for key, value in data.items() if key not in ("nodes", "edges", "routes"))
+        return cls(data.get("nodes", {}), data.get("edges", []), data.get("routes", {}), options)
+
+    def straight_distance(self, a, b):
+        (ax, ay), (bx, by) = self.nodes[a], self.nodes[b]
+        return math.hypot(bx - ax, by - ay)
+
+    def edge_length(self, a, b):
+        """Длина участка между соседними узлами (KeyError, если участка нет)"""
+        return self.edges[(a, b)]
+
+    def route_path(self, route_name):
+        """Последовательность узлов маршрута (поиск по подстроке, как в run.py) или None"""
+        normalized = str(route_name or "").strip().lower()
+        for name, path in self.routes.items():
+            if name in normalized:
+                return path
+        return None
+
+    def path_lengths(self, path):
+        """Длины участков вдоль пути: [S->1, 1->2, ...]"""
+        return [self.edge_length(a, b) for a, b in zip(path, path[1:])]
+
+    def nearest_node(self, x, y):
+        """Ближайший узел к точке и расстояние до него"""
+        best, best_d = None, None
+        for name, (nx, ny) in self.nodes.items():
+            d = math.hypot(nx - x, ny - y)
+            if best_d is None or d < best_d:
+                best, best_d = name, d
+        return best, best_d
+
+
+def load_track(name=None):
+    """
+    Загрузить карту трассы или вернуть None, если файла нет или в нём ошибка
+    Пока файл не изменился, возвращается тот же объект (вместе с кэшем планировщика)
+    """
+    from calibration import DEFAULT_TRACK
+
+    path = os.path.join(TRACKS_DIR, "{}.json".format(name or DEFAULT_TRACK))
+    try:
+        mtime = os.path.getmtime(path)
+        cached = _loaded.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path) as f:
+            track = TrackMap.from_dict(json.load(f))
+    except (OSError, IOError, ValueError, KeyError, TypeError, IndexError, AttributeError):
+        return None
+
+    _loaded[path] = (mtime, track)
+    return track
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Пропускная способность шлюза UART на симулированных станциях
+
+Каждая станция - пара псевдотерминалов: поток пишет в ведущую сторону
+строки CARD=/REMOVE= (со своими картами, повторами и испорченными
+строками), шлюз читает ведомую сторону, как настоящий /dev/ttyUSB.
+События уходят на route_server.py в этом же процессе. Замеряется:
+    ingest lines/s - строк разобрано шлюзом в секунду;
+    end-to-end/s   - строк в секунду до применения последнего события сервером;
+    requests       - сколько запросов POST /api/batch понадобилось.
+После прогона счётчики сервера сверяются с прямым применением тех же
+строк к VoteTable (шлюз не должен терять и переставлять события).
+Перед прогонами проверяется, что одно событие (неполный пакет) доходит до
+сервера за --flush-ms (плюс FLUSH_SLACK на запрос), иначе код выхода 1.
+
+Запуск:
+    ./bench_gateway.py [--stations 4] [--lines 20000] [--batch-sizes 1 10 100] [--flush-ms 50]
+"""
+
+import os
+import time
+import random
+import argparse
+import threading
+
+from gateway import FLUSH_INTERVAL, Forwarder, Gateway, Deduplicator, open_serial
+from protocol import ROUTES_COUNT, parse_line
+from route_server import RouteServer
+from votes import VoteTable
+
+CARDS_PER_STATION = 2000 # Разных карт на станцию
+REMOVE_SHARE = 0.1 # Доля отмен
+REPEAT_SHARE = 0.05 # Доля повторов предыдущей строки (дребезг)
+INVALID_SHARE = 0.02 # Доля испорченных строк
+WRITE_LINES = 64 # Строк в одной записи в псевдотерминал
+FLUSH_SLACK = 0.05 # Запас на запрос к серверу при проверке одного события (секунды)
+
+
+def station_lines(station, count, seed):
+    """Строки одной станции; карты станций не пересекаются"""
+    rnd = random.Random(seed)
+    lines = []
+    previous = None
+    for _ in range(count):
+        roll = rnd.random()
+        if previous is not None and roll < REPEAT_SHARE:
+            line = previous
+        elif roll < REPEAT_SHARE + INVALID_SHARE:
+            line = "CARD=XYZ;ROUTE={}".format(rnd.randrange(ROUTES_COUNT + 2))
+        else:
+            uid = "{:02X}{:06X}".format(station, rnd.randrange(CARDS_PER_STATION))
+            if rnd.random() < REMOVE_SHARE:
+                line = "REMOVE={}".format(uid)
+            else:
+                line = "CARD={};ROUTE={}".format(uid, rnd.randrange(ROUTES_COUNT))
+        lines.append(line)
+        previous = line
+    return lines
+
+
+def expected_counts(all_lines):
+    """Итог прямого применения строк (повторы ничего не меняют)"""
+    table = VoteTable()
+    for lines in all_lines:
+        table.apply([e for e in (parse_line(line) for line in lines) if e is not None])
+    return table.data()
+
+
+def writer(fd, lines):
+    for k in range(0, len(lines), WRITE_LINES):
+        data = "".join(line + "\r\n" for line in lines[k:k + WRITE_LINES]).encode("ascii")
+        while data:
+            data = data[os.write(fd, data):]
+
+
+def run(stations, lines_per_station, batch_size):
+    server = RouteServer(("127.0.0.1", 0))
+    server.serve_in_thread()
+    forwarder = Forwarder(server.url, batch_size)
+    gateway = Gateway(forwarder, Deduplicator())
+
+    all_lines = [station_lines(k, lines_per_station, k) for k in range(stations)]
+    writers = []
+    masters = []
+    for k, lines in enumerate(all_lines):
+        master, slave = os.openpty()
+        gateway.add_device(open_serial(os.ttyname(slave)), "station{}".format(k))
+        os.close(slave)
+        masters.append(master)
+        writers.append(threading.Thread(target=writer, args=(master, lines)))
+
+    # Закрытие ведущей стороны теряет непрочитанные данные: ждём, пока шлюз разберёт все строки
+    total = stations * lines_per_station
+    serving = threading.Thread(target=gateway.serve)
+    start = time.perf_counter()
+    serving.start()
+    for thread in writers:
+        thread.start()
+    while gateway.lines < total:
+        time.sleep(0.001)
+    ingested = time.perf_counter() - start
+    gateway.stop()
+    serving.join()
+    gateway.close()
+    forwarder.close(timeout=60.0)
+    done = time.perf_counter() - start
+    for thread in writers:
+        thread.join()
+    for fd in masters:
+        os.close(fd)
+
+    # version не сравнивается: объединённые в пакете события меняют таблицу меньшее число раз
+    data, expected = server.votes.data(), expected_counts(all_lines)
+    correct = (data["routes"], data["total"]) == (expected["routes"], expected["total"])
+    server.shutdown()
+    server.server_close()
+    return total / ingested, total / done, forwarder.batches, gateway.summary(), correct
+
+
+def check_flush(flush_interval):
+    """Время доставки одного события (неполного пакета) до сервера; None - не дошло"""
+    server = RouteServer(("127.0.0.1", 0))
+    server.serve_in_thread()
+    forwarder = Forwarder(server.url, flush_interval=flush_interval)
+    deadline = flush_interval + FLUSH_SLACK
+    try:
+        # Первое событие после паузы: поток отправки уже спит на пустой очереди
+        time.sleep(0.1)
+        start = time.perf_counter()
+        forwarder.put(parse_line("CARD=01000001;ROUTE=0"))
+        while forwarder.sent < 1:
+            if time.perf_counter() - start > 10 * deadline:
+                return None, deadline
+            time.sleep(0.001)
+        delivered = time.perf_counter() - start
+        if sum(route["count"] for route in server.votes.data()["routes"]) != 1:
+            return None, deadline
+        return delivered, deadline
+    finally:
+        forwarder.close()
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UART gateway throughput with simulated stations")
+    parser.add_argument("--stations", type=int, default=4, help="станций (пар псевдотерминалов)")
+    parser.add_argument("--lines", type=int, default=20000, help="строк на станцию")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100], help="размеры пакетов")
+    parser.add_argument("--flush-ms", type=float, default=FLUSH_INTERVAL * 1000, help="flush_interval шлюза (мс)")
+    args = parser.parse_args()
+
+    delivered, deadline = check_flush(args.flush_ms / 1000.0)
+    if delivered is None or delivered > deadline:
+        print("single event: {} (limit {:.0f} ms) - FAIL".format(
+            "not delivered" if delivered is None else "{:.1f} ms".format(delivered * 1000), deadline * 1000))
+        raise SystemExit(1)
+    print("single event: delivered in {:.1f} ms (limit {:.0f} ms)".format(delivered * 1000, deadline * 1000))
+
+    print("{} stations x {} lines".format(args.stations, args.lines))
+    print("{:>6} {:>15} {:>14} {:>9} {:>8} {:>9} {:>10} {:>8}".format(
+        "batch", "ingest lines/s", "end-to-end/s", "requests", "invalid", "repeats", "coalesced", "correct"))
+    for batch_size in args.batch_sizes:
+        ingest, end_to_end, requests, summary, correct = run(args.stations, args.lines, batch_size)
+        print("{:>6} {:>15.0f} {:>14.0f} {:>9} {:>8} {:>9} {:>10} {:>8}".format(
+            batch_size, ingest, end_to_end, requests, summary["invalid"], summary["duplicates"],
+            summary["coalesced"], "yes" if correct else "NO"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочная проверка hub.py: сотни клиентов WebSocket
+
+route_server.py работает в этом процессе, hub.py - отдельным процессом
+(его процессорное время меряется отдельно), клиенты - сокеты в одном
+потоке на selectors. Заявки приходят с частотой --rate, каждая - новая
+карта, так что итог total однозначно задаёт момент заявки. Задержка
+заявки k у клиента = приём первого сообщения с total >= k - время заявки
+(включая ожидание опроса хаба). --slow клиентов с маленьким буфером приёма
+не читают сокет до конца прогона: хаб должен слить для них изменения, не
+задерживая остальных, а после прогона они должны получить итог. Если за
+--seconds быстрый клиент получил меньше, чем вмещают буфер отправки хаба
+(SEND_BUFFER, ядро удваивает) и буфер приёма медленного клиента, заявки
+подаются дальше, пока не получит (не дольше FILL_TIMEOUT): иначе медленные
+клиенты успевают принять всё и слияние не проверяется. Прогон без слитых
+изменений (при --slow > 0) - ошибка: нужно больше обновлений (меньше
+--poll-ms или больше --seconds).
+
+Печатается: задержка рассылки (p50/p90/p99/max), сообщений на клиента,
+слитые изменения и процессор хаба (% одного ядра).
+
+Запуск:
+    ./bench_hub.py [--clients 300] [--slow 10] [--rate 100] [--seconds 5] [--poll-ms 20]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import socket
+import signal
+import struct
+import argparse
+import resource
+import selectors
+import threading
+import subprocess
+
+from hub import SEND_BUFFER, STALL_TIMEOUT, accept_key
+from protocol import CARD, ROUTES_COUNT, Event
+from route_server import RouteServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONVERGE_TIMEOUT = 10.0 # Сколько ждать итога у всех клиентов после последней заявки (секунды)
+SLOW_RCVBUF = 1024 # Буфер приёма медленного клиента (ядро округлит до минимума)
+FILL_TIMEOUT = STALL_TIMEOUT / 2 # Добавочная подача заявок (секунды): дольше хаб отключит заполненных медленных клиентов
+
+
+class WsClient(object):
+    """Клиент WebSocket без маскировки исходящих (он ничего не шлёт после рукопожатия)"""
+    def __init__(self, port, slow=False):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if slow:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_RCVBUF)
+        self.sock.connect(("127.0.0.1", port))
+        self.key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self.sock.sendall(("GET /ws HTTP/1.1\r\nHost: 127.0.0.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                           "Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n".format(self.key)
+                           ).encode("ascii"))
+        self.sock.setblocking(False)
+        self.slow = slow
+        self.buf = b""
+        self.upgraded = False
+        self.messages = 0
+        self.bytes = 0 # байт кадров WebSocket после рукопожатия
+        self.total = None
+        self.received = [] # (время приёма, total)
+
+    def feed(self, chunk, now):
+        self.buf += chunk
+        if not self.upgraded:
+            end = self.buf.find(b"\r\n\r\n")
+            if end < 0:
+                return
+            head = self.buf[:end].decode("latin-1")
+            if " 101 " not in head.split("\r\n")[0] or accept_key(self.key) not in head:
+                raise IOError("bad handshake: " + head.split("\r\n")[0])
+            self.upgraded = True
+            self.buf = self.buf[end + 4:]
+        buf = self.buf
+        while len(buf) >= 2:
+            length = buf[1] & 0x7F
+            offset = 2
+            if length == 126:
+                if len(buf) < 4:
+                    break
+                length = struct.unpack("!H", buf[2:4])[0]
+                offset = 4
+            if len(buf) < offset + length:
+                break
+            message = json.loads(buf[offset:offset + length].decode("utf-8"))
+            buf = buf[offset + length:]
+            self.messages += 1
+            self.bytes += offset + length
+            self.total = message["total"]
+            self.received.append((now, self.total))
+        self.buf = buf
+
+
+class ClientPool(object):
+    """Все клиенты в одном потоке; медленные не читаются, пока не вызван release_slow()"""
+    def __init__(self, port, count, slow):
+        self.selector = selectors.DefaultSelector()
+        self.clients = []
+        for k in range(count + slow):
+            client = WsClient(port, slow=k >= count)
+            self.clients.append(client)
+            if not client.slow:
+                self.selector.register(client.sock, selectors.EVENT_READ, client)
+        self.errors = 0
+        self._running = True
+        self.thread = threading.Thread(target=self._loop, name="clients")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def release_slow(self):
+        for client in self.clients:
+            if client.slow:
+                self.selector.register(client.sock, selectors.EVENT_READ, client)
+
+    def _loop(self):
+        while self._running:
+            for key, _ in self.selector.select(0.1):
+                now = time.monotonic()
+                try:
+                    chunk = key.data.sock.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                if not chunk:
+                    self.selector.unregister(key.fileobj)
+                    self.errors += 1
+                    continue
+                key.data.feed(chunk, now)
+
+    def converged(self, total, slow):
+        return all(c.total == total for c in self.clients if c.slow == slow)
+
+    def close(self):
+        self._running = False
+        self.thread.join()
+        for client in self.clients:
+            client.sock.close()
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_hub(upstream, poll_ms):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "hub.py"), "--host", "127.0.0.1",
+                                "--port", str(port), "--upstream", upstream, "--poll-ms", str(poll_ms), "--summary"],
+                               stdout=subprocess.PIPE, universal_newlines=True)
+    process.stdout.readline() # "Hub on port ..." - слушающий сокет готов
+    return process, port
+
+
+def wait_for(predicate, timeout):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * p / 100.0)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the WebSocket hub with many clients")
+    parser.add_argument("--clients", type=int, default=300, help="клиентов, читающих сразу")
+    parser.add_argument("--slow", type=int, default=10, help="клиентов, не читающих до конца прогона")
+    parser.add_argument("--rate", type=float, default=100.0, help="заявок в секунду")
+    parser.add_argument("--seconds", type=float, default=5.0, help="длительность подачи заявок")
+    parser.add_argument("--poll-ms", type=float, default=20.0, help="период опроса сервера хабом (мс)")
+    args = parser.parse_args()
+
+    server = RouteServer(("127.0.0.1", 0))
+    server.serve_in_thread()
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    hub, port = start_hub(server.url, args.poll_ms)
+    started = time.monotonic()
+    pool = ClientPool(port, args.clients, args.slow)
+    wait_for(lambda: pool.converged(0, False), CONVERGE_TIMEOUT) # все подключились и получили состояние
+
+    # Сколько байт должно уйти медленному клиенту, чтобы его буферы заполнились
+    fast = [c for c in pool.clients if not c.slow]
+    slow = [c for c in pool.clients if c.slow]
+    fill_bytes = 2 * SEND_BUFFER + slow[0].sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) if slow else 0
+    sent_before = fast[0].bytes if fast else 0
+
+    # Подача заявок: total == k после k-й заявки
+    rnd = random.Random(1)
+    applied = {}
+    count = int(args.rate * args.seconds)
+    started_votes = next_at = time.monotonic()
+    k = 0
+    while k < count or (fast and fast[0].bytes - sent_before < fill_bytes
+                        and time.monotonic() - started_votes < args.seconds + FILL_TIMEOUT):
+        k += 1
+        server.votes.apply([Event(CARD, "{:08X}".format(k), rnd.randrange(ROUTES_COUNT))])
+        applied[k] = time.monotonic()
+        next_at += 1.0 / args.rate
+        time.sleep(max(0.0, next_at - time.monotonic()))
+    count = k
+
+    fast_ok = wait_for(lambda: pool.converged(count, False), CONVERGE_TIMEOUT)
+    pool.release_slow()
+    slow_ok = wait_for(lambda: pool.converged(count, True), CONVERGE_TIMEOUT)
+
+    errors = pool.errors # дальше хаб закрывает соединения сам
+    hub.send_signal(signal.SIGINT)
+    summary = json.loads(hub.stdout.read().strip().splitlines()[-1])
+    hub.wait()
+    elapsed = time.monotonic() - started
+    pool.close()
+    server.shutdown()
+    done = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (done.ru_utime - usage.ru_utime) + (done.ru_stime - usage.ru_stime)
+
+    # Заявка k доставлена клиенту первым сообщением с total >= k (слитые тоже учитываются)
+    latencies = []
+    for client in pool.clients:
+        if client.slow:
+            continue
+        seen = 0
+        for t, total in client.received:
+            latencies.extend(1000.0 * (t - applied[k]) for k in range(seen + 1, total + 1))
+            seen = max(seen, total)
+    latencies.sort()
+    print("{} clients + {} slow, {} votes at {:.0f}/s, hub polls every {:.0f} ms".format(
+        args.clients, args.slow, count, args.rate, args.poll_ms))
+    print("broadcast latency ms: p50 {:.1f}  p90 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+        _percentile(latencies, 50), _percentile(latencies, 90), _percentile(latencies, 99),
+        latencies[-1] if latencies else 0.0))
+    print("messages per client: fast {:.0f}, slow {:.0f} (of {} votes; hub updates {})".format(
+        sum(c.messages for c in fast) / float(len(fast) or 1), sum(c.messages for c in slow) / float(len(slow) or 1),
+        count, summary["updates"]))
+    print("hub: {} messages, {} frames encoded, {} coalesced, {} dropped, {} upstream polls".format(
+        summary["messages"], summary["encoded"], summary["coalesced"], summary["dropped"], summary["polls"]))
+    print("hub CPU: {:.2f} s in {:.1f} s ({:.1f}% of one core)".format(cpu, elapsed, 100.0 * cpu / elapsed))
+    print("final state: fast {}, slow {}".format("ok" if fast_ok else "STALE", "ok" if slow_ok else "STALE"))
+    coalesced_ok = not slow or summary["coalesced"] > 0
+    if not coalesced_ok:
+        print("slow clients never blocked: {} bytes sent to each, buffers hold {} - backpressure not exercised".format(
+            fast[0].bytes - sent_before if fast else 0, fill_bytes))
+    if not (fast_ok and slow_ok and coalesced_ok) or errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Хранилище заявок (store.py): пропускная способность и время восстановления
+
+Пропускная способность: --threads потоков (как потоки HTTP-сервера)
+отправляют заявки по одной (apply с одним событием) для --cards разных
+карт в течение --seconds. Режимы:
+    fsync per vote - каждый apply() сам пишет и делает fsync;
+    group commit   - один fsync на всех, кто успел дописать записи;
+    no fsync       - без fsync (верхняя граница, не устойчиво к сбою).
+По каждому режиму: заявок в секунду, число fsync, заявок на fsync и
+задержка apply() (p50, p99).
+
+Восстановление: таблица на --cards карт и ещё столько же переназначений.
+Открытие каталога замеряется дважды: только по журналу и по снимку с
+коротким хвостом журнала. Оборванная последняя запись (отключение
+питания посреди write) должна отбрасываться без потери остальных.
+
+Запуск:
+    ./bench_store.py [--cards 100000] [--threads 16] [--seconds 3] [--dir /tmp/votes-bench]
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+from protocol import CARD, ROUTES_COUNT, Event
+from store import VoteStore
+
+FILL_BATCH = 1000 # Событий в одном apply() при заполнении таблицы
+TAIL_SHARE = 0.05 # Хвост журнала после снимка (доля от числа карт)
+
+
+def card_uid(index):
+    return "{:08X}".format(index)
+
+
+def votes(rnd, cards, count):
+    return [Event(CARD, card_uid(rnd.randrange(cards)), rnd.randrange(ROUTES_COUNT)) for _ in range(count)]
+
+
+def fill(store, cards, seed=1):
+    """Каждой карте - заявка, затем столько же случайных переназначений"""
+    rnd = random.Random(seed)
+    for start in range(0, cards, FILL_BATCH):
+        store.apply([Event(CARD, card_uid(i), rnd.randrange(ROUTES_COUNT))
+                     for i in range(start, min(cards, start + FILL_BATCH))])
+    for _ in range(0, cards, FILL_BATCH):
+        store.apply(votes(rnd, cards, FILL_BATCH))
+
+
+def throughput(directory, cards, threads, seconds, group_commit, sync):
+    store = VoteStore(directory, group_commit=group_commit, sync=sync)
+    fill(store, cards)
+    commits = store.commits
+    latencies = [[] for _ in range(threads)]
+    counts = [0] * threads
+    end = time.monotonic() + seconds
+
+    def worker(k):
+        rnd = random.Random(100 + k)
+        events = votes(rnd, cards, 10000)
+        i = 0
+        clock = time.perf_counter
+        while time.monotonic() < end:
+            start = clock()
+            store.apply([events[i % len(events)]])
+            latencies[k].append(clock() - start)
+            i += 1
+        counts[k] = i
+
+    workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    start = time.monotonic()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - start
+    commits = store.commits - commits
+    store.close()
+
+    ordered = sorted(t for part in latencies for t in part)
+    total = sum(counts)
+    return {
+        "votes_s": total / elapsed,
+        "fsyncs": commits,
+        "per_fsync": total / float(commits) if commits else 0.0,
+        "p50_ms": 1000.0 * ordered[len(ordered) // 2],
+        "p99_ms": 1000.0 * ordered[int(len(ordered) * 0.99)],
+    }
+
+
+def reopen(directory):
+    start = time.perf_counter()
+    store = VoteStore(directory)
+    elapsed = time.perf_counter() - start
+    store.close()
+    return store, elapsed
+
+
+def recovery(directory, cards):
+    """Время открытия по одному журналу и по снимку + хвосту журнала"""
+    results = []
+    # Снимки отключены: всё состояние только в журнале
+    store = VoteStore(directory, sync=False, snapshot_records=float("inf"))
+    fill(store, cards)
+    expected = dict(store.cards)
+    store.close()
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    recovered, elapsed = reopen(directory)
+    results.append(("log only", elapsed, recovered.recovered_records, size, recovered.cards == expected))
+
+    store = VoteStore(directory, sync=False, snapshot_records=float("inf"))
+    store.snapshot()
+    rnd = random.Random(2)
+    for _ in range(int(cards * TAIL_SHARE) // FILL_BATCH):
+        store.apply(votes(rnd, cards, FILL_BATCH))
+    expected = dict(store.cards)
+    store.close()
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    recovered, elapsed = reopen(directory)
+    results.append(("snapshot + log", elapsed, recovered.recovered_records, size, recovered.cards == expected))
+
+    # Оборванная запись в конце журнала: отбрасывается только она
+    wal = sorted(name for name in os.listdir(directory) if name.startswith("wal-"))[-1]
+    with open(os.path.join(directory, wal), "ab") as f:
+        f.write(b"0badc0de C FFFF")
+    recovered, elapsed = reopen(directory)
+    results.append(("torn tail", elapsed, recovered.recovered_records, size,
+                    recovered.cards == expected and recovered.truncated == 15))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vote store throughput (group commit vs fsync per vote) and recovery time")
+    parser.add_argument("--cards", type=int, default=100000, help="разных карт")
+    parser.add_argument("--threads", type=int, default=16, help="потоков, отправляющих заявки")
+    parser.add_argument("--seconds", type=float, default=3.0, help="длительность замера каждого режима")
+    parser.add_argument("--dir", help="каталог для файлов (по умолчанию временный; важна файловая система)")
+    args = parser.parse_args()
+
+    base = args.dir or tempfile.mkdtemp(prefix="stem-votes-")
+    modes = (("fsync per vote", False, True), ("group commit", True, True), ("no fsync", True, False))
+    ok = True
+    try:
+        print("{} cards, {} threads, {:.1f} s per mode, files in {}".format(args.cards, args.threads, args.seconds, base))
+        print("{:<16} {:>9} {:>8} {:>10} {:>8} {:>8}".format("mode", "votes/s", "fsyncs", "votes/sync", "p50 ms", "p99 ms"))
+        for k, (label, group_commit, sync) in enumerate(modes):
+            r = throughput(os.path.join(base, "throughput-{}".format(k)), args.cards, args.threads,
+                           args.seconds, group_commit, sync)
+            print("{:<16} {:>9.0f} {:>8} {:>10.1f} {:>8.2f} {:>8.2f}".format(
+                label, r["votes_s"], r["fsyncs"], r["per_fsync"], r["p50_ms"], r["p99_ms"]))
+
+        print()
+        print("{:<16} {:>10} {:>10} {:>12} {:>6}".format("recovery", "time ms", "records", "bytes", "ok"))
+        for label, elapsed, records, size, correct in recovery(os.path.join(base, "recovery"), args.cards):
+            ok = ok and correct
+            print("{:<16} {:>10.1f} {:>10} {:>12} {:>6}".format(label, 1000.0 * elapsed, records, size,
+                                                               "yes" if correct else "NO"))
+    finally:
+        if args.dir is None:
+            shutil.rmtree(base, ignore_errors=True)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
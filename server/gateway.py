@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Шлюз UART -> сервер маршрутов для станций выбора маршрута
+
+Станция (Arduino с RFID, arduino/stem_arduino) подключается к компьютеру
+по USB-UART и шлёт те же строки, что и на ESP: CARD=<HEX>;ROUTE=<idx> и
+REMOVE=<HEX>. Шлюз читает одно или несколько устройств через select,
+собирает строки как pollSerial() прошивки, проверяет их (protocol.py),
+отбрасывает повтор последнего события карты в пределах dedup-окна (дребезг
+кнопки, повторная отправка) и пересылает события на route_server.py
+пакетами POST /api/batch:
+- пакет уходит, когда набралось batch_size событий или прошло flush_interval
+  с первого события в пакете;
+- в пакете от одной карты остаётся только последнее событие (итог тот же);
+- при ошибке сети события остаются в очереди и уходят следующей попыткой,
+  очередь ограничена max_queue (старые события отбрасываются).
+
+Проверка без станции - пара псевдотерминалов (bench_gateway.py).
+
+Запуск:
+    ./gateway.py --device /dev/ttyUSB0 --device /dev/ttyUSB1 --server http://127.0.0.1:8080
+"""
+
+import os
+import json
+import time
+import select
+import socket
+import termios
+import argparse
+import threading
+from collections import OrderedDict
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import urlsplit
+
+from protocol import MAX_LINE, parse_line
+
+BAUD_RATE = 115200 # Скорость UART станции (Serial.begin в прошивке)
+BATCH_SIZE = 100 # Событий в пакете
+FLUSH_INTERVAL = 0.05 # Наибольшая задержка события в шлюзе (секунды)
+DEDUP_WINDOW = 2.0 # Повтор события карты за это время отбрасывается (секунды)
+MAX_QUEUE = 100000 # Наибольшая очередь событий при недоступном сервере
+RETRY_DELAY = 0.5 # Пауза перед повтором отправки после ошибки (секунды)
+HTTP_TIMEOUT = 2.0
+
+
+def open_serial(path, baud=BAUD_RATE):
+    """Открыть устройство UART в сыром режиме (8N1, без эха и обработки строк)"""
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    if os.isatty(fd):
+        attrs = termios.tcgetattr(fd)
+        attrs[0] = 0 # iflag
+        attrs[1] = 0 # oflag
+        attrs[2] = termios.CS8 | termios.CREAD | termios.CLOCAL # cflag
+        attrs[3] = 0 # lflag
+        speed = getattr(termios, "B{}".format(baud))
+        attrs[4] = attrs[5] = speed
+        attrs[6][termios.VMIN] = 1
+        attrs[6][termios.VTIME] = 0
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+
+class LineReader(object):
+    """Сборка строк из байтов устройства; длинная строка сбрасывается, как в прошивке"""
+    def __init__(self):
+        self.buf = b""
+        self.overflows = 0
+
+    def feed(self, chunk):
+        lines = []
+        data = self.buf + chunk
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break
+            if end - start <= MAX_LINE:
+                lines.append(data[start:end].decode("ascii", "replace"))
+            else:
+                self.overflows += 1
+            start = end + 1
+        self.buf = data[start:]
+        if len(self.buf) > MAX_LINE:
+            self.buf = b""
+            self.overflows += 1
+        return lines
+
+
+class Deduplicator(object):
+    """
+    Повтор предыдущего события той же карты с той же станции внутри окна
+    отбрасывается. Сравнивается только с последним событием карты: заявка,
+    отмена и снова та же заявка - три разных события
+    """
+    def __init__(self, window=DEDUP_WINDOW, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.last = {} # (станция, UID) -> (ключ события, время)
+        self.pruned_at = clock()
+
+    def accept(self, event):
+        now = self.clock()
+        card = (event.station, event.uid)
+        key = event.key()
+        last = self.last.get(card)
+        if now - self.pruned_at > self.window:
+            self._prune(now)
+        if last is not None and last[0] == key and now - last[1] <= self.window:
+            return False
+        self.last[card] = (key, now)
+        return True
+
+    def _prune(self, now):
+        self.pruned_at = now
+        for card in [card for card, (_, t) in self.last.items() if now - t > self.window]:
+            del self.last[card]
+
+
+class Forwarder(object):
+    """Очередь событий и фоновая отправка пакетами на сервер маршрутов"""
+    def __init__(self, url, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = (parts.path.rstrip("/") or "") + "/api/batch"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self.queue = []
+        self.first_at = None # когда в пустую очередь пришло первое событие
+        self.cond = threading.Condition()
+        self.connection = None
+
+        self.sent = 0 # событий принято сервером
+        self.batches = 0
+        self.coalesced = 0 # событий, заменённых более поздним событием той же карты
+        self.dropped = 0 # событий, вытесненных из переполненной очереди
+        self.errors = 0
+
+        self._running = True
+        self.thread = threading.Thread(target=self._loop, name="forwarder")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, event):
+        with self.cond:
+            if not self.queue:
+                self.first_at = time.monotonic()
+            self.queue.append(event)
+            if len(self.queue) > self.max_queue:
+                drop = len(self.queue) - self.max_queue
+                del self.queue[:drop]
+                self.dropped += drop
+            # Первое событие в пустой очереди - поток отправки начинает отсчёт flush_interval
+            if len(self.queue) == 1 or len(self.queue) >= self.batch_size:
+                self.cond.notify()
+
+    def _take(self):
+        """Дождаться полного пакета или истечения flush_interval; None - остановка"""
+        with self.cond:
+            while self._running:
+                if self.queue:
+                    wait = self.first_at + self.flush_interval - time.monotonic()
+                    if len(self.queue) >= self.batch_size or wait <= 0:
+                        break
+                else:
+                    wait = None
+                self.cond.wait(wait)
+            if not self.queue:
+                return None
+            batch = self.queue[:self.batch_size]
+            del self.queue[:self.batch_size]
+            self.first_at = time.monotonic() if self.queue else None
+            return batch
+
+    @staticmethod
+    def coalesce(batch):
+        """Последнее событие каждой карты в порядке последних событий"""
+        last = OrderedDict()
+        for event in batch:
+            last.pop(event.uid, None)
+            last[event.uid] = event
+        return list(last.values())
+
+    def _post(self, events):
+        body = json.dumps({"events": [e.to_dict() for e in events]}, separators=(",", ":")).encode("utf-8")
+        if self.connection is None:
+            self.connection = HTTPConnection(self.host, self.port, timeout=HTTP_TIMEOUT)
+            self.connection.connect()
+            # Заголовки и тело уходят разными send(): без NODELAY каждый запрос ждёт отложенного ACK
+            self.connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self.connection.request("POST", self.path, body, {"Content-Type": "application/json"})
+            response = self.connection.getresponse()
+            response.read()
+        except (HTTPException, OSError):
+            self.connection.close()
+            self.connection = None
+            raise
+        if response.status >= 500:
+            raise IOError("server error {}".format(response.status))
+        # 4xx - пакет не принят и повтор не поможет (событие уже проверено шлюзом)
+        return response.status == 200
+
+    def _loop(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            events = self.coalesce(batch)
+            self.coalesced += len(batch) - len(events)
+            while True:
+                try:
+                    if self._post(events):
+                        self.sent += len(events)
+                        self.batches += 1
+                    else:
+                        self.errors += 1
+                    break
+                except (IOError, OSError, HTTPException):
+                    self.errors += 1
+                    if not self._running:
+                        return
+                    time.sleep(RETRY_DELAY)
+
+    def pending(self):
+        with self.cond:
+            return len(self.queue)
+
+    def close(self, timeout=2.0):
+        """Отправить оставшиеся события и остановить поток"""
+        with self.cond:
+            self._running = False
+            self.cond.notify()
+        self.thread.join(timeout)
+        if self.connection is not None and not self.thread.is_alive():
+            self.connection.close()
+
+
+class Gateway(object):
+    """Чтение строк со всех устройств станций и передача событий в Forwarder"""
+    def __init__(self, forwarder, dedup=None):
+        self.forwarder = forwarder
+        self.dedup = dedup if dedup is not None else Deduplicator()
+        self.devices = {} # fd -> (станция, LineReader)
+        self.overflows = 0 # длинные строки отключённых устройств
+        self.lines = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self._wake_r, self._wake_w = os.pipe()
+        self._running = True
+
+    def add_device(self, fd, station):
+        self.devices[fd] = (station, LineReader())
+
+    def handle_line(self, line, station):
+        self.lines += 1
+        event = parse_line(line, station)
+        if event is None:
+            self.invalid += 1
+        elif not self.dedup.accept(event):
+            self.duplicates += 1
+        else:
+            self.forwarder.put(event)
+
+    def serve(self):
+        """Цикл select до stop() или закрытия всех устройств"""
+        while self._running and self.devices:
+            ready, _, _ = select.select(list(self.devices) + [self._wake_r], [], [])
+            for fd in ready:
+                if fd == self._wake_r:
+                    return
+                try:
+                    chunk = os.read(fd, 4096)
+                except (IOError, OSError):
+                    chunk = b""
+                if not chunk:
+                    # Устройство отключено (или закрыт конец псевдотерминала)
+                    self.overflows += self.devices.pop(fd)[1].overflows
+                    continue
+                station, reader = self.devices[fd]
+                for line in reader.feed(chunk):
+                    self.handle_line(line, station)
+
+    def stop(self):
+        self._running = False
+        os.write(self._wake_w, b"x")
+
+    def close(self):
+        """Закрыть устройства (после выхода из serve)"""
+        for fd, (_, reader) in list(self.devices.items()):
+            self.overflows += reader.overflows
+            os.close(fd)
+        self.devices.clear()
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+
+    def summary(self):
+        return {
+            "lines": self.lines,
+            "invalid": self.invalid,
+            "duplicates": self.duplicates,
+            "overflows": self.overflows + sum(reader.overflows for _, reader in self.devices.values()),
+            "sent": self.forwarder.sent,
+            "batches": self.forwarder.batches,
+            "coalesced": self.forwarder.coalesced,
+            "dropped": self.forwarder.dropped,
+            "errors": self.forwarder.errors,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UART gateway from card-reader stations to the route server")
+    parser.add_argument("--device", action="append", required=True, help="устройство UART станции (можно несколько)")
+    parser.add_argument("--server", default="http://127.0.0.1:8080", help="адрес route_server.py")
+    parser.add_argument("--baud", type=int, default=BAUD_RATE, help="скорость UART")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="событий в пакете")
+    parser.add_argument("--flush-ms", type=float, default=FLUSH_INTERVAL * 1000, help="наибольшая задержка пакета (мс)")
+    parser.add_argument("--dedup-s", type=float, default=DEDUP_WINDOW, help="окно отбрасывания повторов (с)")
+    args = parser.parse_args()
+
+    forwarder = Forwarder(args.server, args.batch_size, args.flush_ms / 1000.0)
+    gateway = Gateway(forwarder, Deduplicator(args.dedup_s))
+    for path in args.device:
+        gateway.add_device(open_serial(path, args.baud), os.path.basename(path))
+    print("Gateway: {} -> {}".format(", ".join(args.device), args.server))
+    try:
+        gateway.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        forwarder.close()
+        gateway.close()
+        print(gateway.summary())
+
+
+if __name__ == "__main__":
+    main()
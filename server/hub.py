@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Рассылка счётчиков маршрутов браузерам по WebSocket
+
+Страница мониторинга (INDEX_HTML прошивки, index.html) опрашивает /data
+каждые 300-400 мс из каждой открытой вкладки: десять зрителей - десять
+опросов ESP. Хаб опрашивает сервер маршрутов (ESP или route_server.py)
+сам, одним keep-alive соединением, и рассылает изменения всем браузерам:
+- при подключении клиент получает всё состояние:
+      {"type": "full", "seq", "routes": [{"index", "name", "count"}], "total"}
+  затем только изменения относительно того, что он уже получил:
+      {"type": "diff", "seq", "changes": [[index, count], ...], "total"};
+- все клиенты обслуживаются одним потоком (selectors), кадр для клиентов
+  с одинаковым известным им состоянием кодируется один раз;
+- медленный клиент не тормозит остальных: пока его предыдущее сообщение не
+  ушло в сокет, новые не копятся - при освобождении он получит одно
+  сообщение от своего состояния сразу к последнему (coalescing); клиент,
+  не принимающий данные дольше STALL_TIMEOUT, отключается;
+- из браузера можно прислать текст "reset" или "reset <маршрут>" - хаб
+  передаст сброс серверу маршрутов.
+GET / - страница мониторинга на WebSocket (dashboard.html), GET /data -
+последнее состояние в формате сервера.
+
+Запуск:
+    ./hub.py --upstream http://192.168.1.104 [--port 8081] [--poll-ms 100]
+"""
+
+import os
+import json
+import time
+import socket
+import base64
+import struct
+import hashlib
+import argparse
+import selectors
+import threading
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import urlsplit
+
+from protocol import ROUTES_COUNT, ROUTES_TYPE, parse_data
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_PATH = os.path.join(HERE, "dashboard.html")
+DEFAULT_PORT = 8081
+POLL_INTERVAL = 0.1 # Период опроса сервера маршрутов (секунды)
+STALL_TIMEOUT = 10.0 # Клиент, не принимающий данные дольше, отключается (секунды)
+MAX_REQUEST = 8192 # Наибольший HTTP-запрос рукопожатия (байты)
+MAX_MESSAGE = 1024 # Наибольшее сообщение от браузера (байты)
+SEND_BUFFER = 8192 # Буфер отправки сокета клиента: больше - медленный клиент копит устаревшие изменения в ядре
+HTTP_TIMEOUT = 2.0
+RETRY_DELAY = 1.0 # Пауза после ошибки опроса (секунды)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept для Sec-WebSocket-Key (RFC 6455, 4.2.2)"""
+    digest = hashlib.sha1((key + WS_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def encode_frame(payload, opcode=OP_TEXT):
+    """Кадр сервера: FIN, без маски"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def decode_frames(buf):
+    """
+    Кадры браузера из буфера: ([(opcode, payload)], остаток).
+    Кадры клиента обязаны быть с маской; фрагменты не поддерживаются -
+    браузер шлёт короткие команды одним кадром
+    """
+    frames = []
+    while len(buf) >= 2:
+        b0, b1 = buf[0], buf[1]
+        if not b1 & 0x80 or not b0 & 0x80:
+            raise ValueError("unmasked or fragmented frame")
+        length = b1 & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buf) < 4:
+                break
+            length = struct.unpack("!H", buf[2:4])[0]
+            offset = 4
+        elif length == 127:
+            if len(buf) < 10:
+                break
+            length = struct.unpack("!Q", buf[2:10])[0]
+            offset = 10
+        if length > MAX_MESSAGE:
+            raise ValueError("message too large")
+        if len(buf) < offset + 4 + length:
+            break
+        mask = buf[offset:offset + 4]
+        data = buf[offset + 4:offset + 4 + length]
+        payload = bytes(data[i] ^ mask[i & 3] for i in range(length))
+        frames.append((b0 & 0x0F, payload))
+        buf = buf[offset + 4 + length:]
+    return frames, buf
+
+
+class Upstream(object):
+    """Опрос /data сервера маршрутов одним соединением; publish(data) - при изменении"""
+    def __init__(self, url, publish, interval=POLL_INTERVAL):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.publish = publish
+        self.interval = interval
+        self.connection = None
+        self.last_body = None
+        self.etag = None # ETag последнего ответа /data: без изменений сервер ответит 304
+        self.content_type = ""
+        self.response_etag = None
+        self.resets = [] # маршруты для сброса (None - все)
+        self.cond = threading.Condition()
+
+        self.polls = 0
+        self.changes = 0
+        self.errors = 0
+
+        self._running = True
+        self.thread = threading.Thread(target=self._loop, name="upstream")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _get(self, path, headers=None):
+        """Тело ответа; None для 304"""
+        while True:
+            fresh = self.connection is None
+            if fresh:
+                self.connection = HTTPConnection(self.host, self.port, timeout=HTTP_TIMEOUT)
+                self.connection.connect()
+                self.connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                self.connection.request("GET", self.prefix + path, headers=headers or {})
+                response = self.connection.getresponse()
+                body = response.read()
+                break
+            except (HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                # Сервер мог закрыть простаивавшее соединение - одна попытка с новым
+                if fresh:
+                    raise
+        if response.status == 304:
+            return None
+        if response.status != 200:
+            raise IOError("{} -> HTTP {}".format(path, response.status))
+        self.content_type = response.getheader("Content-Type", "")
+        self.response_etag = response.getheader("ETag")
+        return body
+
+    def reset(self, route=None):
+        with self.cond:
+            self.resets.append(route)
+            self.cond.notify()
+
+    def _loop(self):
+        while self._running:
+            with self.cond:
+                resets = self.resets
+                self.resets = []
+            try:
+                for route in resets:
+                    self._get("/reset" if route is None else "/reset?route={}".format(route))
+                headers = {"Accept": ROUTES_TYPE + ", application/json"}
+                if self.etag:
+                    headers["If-None-Match"] = self.etag
+                body = self._get("/data", headers)
+                self.polls += 1
+                # 304 или те же байты (сервер без ETag): ответ не разбирается
+                if body is not None and body != self.last_body:
+                    self.last_body = body
+                    self.etag = self.response_etag
+                    self.changes += 1
+                    self.publish(parse_data(body, self.content_type))
+                delay = self.interval
+            except (IOError, OSError, HTTPException, ValueError):
+                self.errors += 1
+                delay = RETRY_DELAY
+            with self.cond:
+                if not self.resets and self._running:
+                    self.cond.wait(delay)
+
+    def close(self):
+        with self.cond:
+            self._running = False
+            self.cond.notify()
+        self.thread.join(HTTP_TIMEOUT)
+        if self.connection is not None and not self.thread.is_alive():
+            self.connection.close()
+
+
+class Client(object):
+    """Соединение браузера: HTTP-запрос, затем WebSocket"""
+    __slots__ = ("sock", "inbuf", "outbuf", "websocket", "closing", "counts", "total",
+                 "dirty", "blocked_at", "coalesced")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = b""
+        self.outbuf = bytearray()
+        self.websocket = False
+        self.closing = False # закрыть после отправки outbuf
+        self.counts = None # счётчики, уже отправленные клиенту (None - ещё ничего)
+        self.total = None
+        self.dirty = False # есть изменения, которые клиент ещё не получил
+        self.blocked_at = None # с какого момента outbuf не уходит целиком
+        self.coalesced = 0
+
+
+class Hub(object):
+    """Сервер WebSocket: один поток, selectors, рассылка изменений всем клиентам"""
+    def __init__(self, address=("", DEFAULT_PORT), send_buffer=SEND_BUFFER):
+        self.send_buffer = send_buffer
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self._wake_r, self._wake_w = os.pipe()
+        self.selector.register(self._wake_r, selectors.EVENT_READ)
+        with open(DASHBOARD_PATH, "rb") as f:
+            self.dashboard = f.read()
+
+        self.lock = threading.Lock()
+        self.latest = None # последнее состояние от сервера маршрутов
+        self.counts = None # его счётчики кортежем (для сравнения с состоянием клиентов)
+        self.seq = 0
+        self.checked_at = time.monotonic()
+        self.upstream = None
+        self.clients = {} # сокет -> Client
+        self._running = True
+
+        self.messages = 0 # сообщений поставлено в очередь клиентам
+        self.encoded = 0 # кадров закодировано (остальные взяты из кэша)
+        self.coalesced = 0 # изменений, слитых для медленных клиентов
+        self.dropped = 0 # клиентов, отключённых за остановку приёма
+        self.connections = 0
+
+    @property
+    def port(self):
+        return self.listener.getsockname()[1]
+
+    def publish(self, data):
+        """Новое состояние (из потока Upstream)"""
+        counts = tuple(item["count"] for item in data["routes"])
+        with self.lock:
+            self.latest = data
+            self.counts = counts
+            self.seq += 1
+        os.write(self._wake_w, b"x")
+
+    # --- рассылка ---
+
+    def _state(self):
+        with self.lock:
+            return self.latest, self.counts, self.seq
+
+    def _message(self, client, state, cache):
+        """Кадр от известного клиенту состояния к последнему; один на всех с тем же состоянием"""
+        latest, counts, seq = state
+        base = None if client.counts is None else client.counts + (client.total,)
+        frame = cache.get(base)
+        if frame is None:
+            if base is None:
+                message = {"type": "full", "seq": seq, "routes": latest["routes"], "total": latest["total"]}
+            else:
+                changes = [[i, c] for i, (old, c) in enumerate(zip(client.counts, counts)) if old != c]
+                message = {"type": "diff", "seq": seq, "changes": changes, "total": latest["total"]}
+            frame = encode_frame(json.dumps(message, separators=(",", ":")).encode("utf-8"))
+            cache[base] = frame
+            self.encoded += 1
+        client.counts = counts
+        client.total = latest["total"]
+        return frame
+
+    def _update(self, client, state, cache):
+        """Отправить клиенту изменения или отметить, что он их ждёт"""
+        if client.outbuf:
+            # Предыдущее сообщение ещё не ушло: не копим очередь, отправим итог позже
+            if not client.dirty:
+                client.dirty = True
+            else:
+                client.coalesced += 1
+                self.coalesced += 1
+            return
+        client.dirty = False
+        latest, counts, _ = state
+        if client.counts == counts and client.total == latest["total"]:
+            return
+        client.outbuf += self._message(client, state, cache)
+        self.messages += 1
+        self._flush(client)
+
+    def _broadcast(self):
+        state = self._state()
+        if state[0] is None:
+            return
+        cache = {}
+        for client in list(self.clients.values()):
+            if client.websocket and not client.closing:
+                self._update(client, state, cache)
+
+    # --- сокеты ---
+
+    def _accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.send_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        self.clients[sock] = Client(sock)
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.connections += 1
+
+    def _drop(self, client):
+        if client.sock not in self.clients:
+            return
+        self.selector.unregister(client.sock)
+        del self.clients[client.sock]
+        client.sock.close()
+
+    def _flush(self, client):
+        try:
+            sent = client.sock.send(client.outbuf)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._drop(client)
+            return
+        del client.outbuf[:sent]
+        if client.outbuf:
+            if client.blocked_at is None:
+                client.blocked_at = time.monotonic()
+                self.selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+            return
+        if client.blocked_at is not None:
+            client.blocked_at = None
+            self.selector.modify(client.sock, selectors.EVENT_READ)
+        if client.closing:
+            self._drop(client)
+        elif client.dirty:
+            self._update(client, self._state(), {})
+
+    def _send_http(self, client, status, body, content_type):
+        head = "HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nCache-Control: no-store\r\n" \
+               "Connection: close\r\n\r\n".format(status, content_type, len(body))
+        client.outbuf += head.encode("ascii") + body
+        client.closing = True
+        self._flush(client)
+
+    def _handshake(self, client):
+        end = client.inbuf.find(b"\r\n\r\n")
+        if end < 0:
+            if len(client.inbuf) > MAX_REQUEST:
+                self._drop(client)
+            return
+        lines = client.inbuf[:end].decode("latin-1").split("\r\n")
+        client.inbuf = client.inbuf[end + 4:]
+        parts = lines[0].split()
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        path = parts[1].split("?")[0] if len(parts) > 1 else ""
+        if len(parts) < 3 or parts[0] != "GET":
+            self._send_http(client, "405 Method Not Allowed", b"Method not allowed", "text/plain; charset=utf-8")
+        elif path == "/ws" and headers.get("upgrade", "").lower() == "websocket" and "sec-websocket-key" in headers:
+            client.outbuf += ("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                              "Sec-WebSocket-Accept: {}\r\n\r\n".format(accept_key(headers["sec-websocket-key"]))
+                              ).encode("ascii")
+            client.websocket = True
+            state = self._state()
+            if state[0] is not None:
+                client.outbuf += self._message(client, state, {})
+                self.messages += 1
+            self._flush(client)
+        elif path == "/":
+            self._send_http(client, "200 OK", self.dashboard, "text/html; charset=utf-8")
+        elif path == "/data":
+            with self.lock:
+                latest = self.latest
+            if latest is None:
+                self._send_http(client, "503 Service Unavailable", b"No data yet", "text/plain; charset=utf-8")
+            else:
+                body = json.dumps(latest, separators=(",", ":")).encode("utf-8")
+                self._send_http(client, "200 OK", body, "application/json; charset=utf-8")
+        else:
+            self._send_http(client, "404 Not Found", b"Not found", "text/plain; charset=utf-8")
+
+    def _command(self, text):
+        """Команда браузера: reset или reset <маршрут>"""
+        parts = text.split()
+        if not parts or parts[0] != "reset" or self.upstream is None:
+            return
+        if len(parts) == 1:
+            self.upstream.reset()
+        elif parts[1].isdigit() and int(parts[1]) < ROUTES_COUNT:
+            self.upstream.reset(int(parts[1]))
+
+    def _read(self, client):
+        try:
+            chunk = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            self._drop(client)
+            return
+        if client.closing:
+            return
+        client.inbuf += chunk
+        if not client.websocket:
+            self._handshake(client)
+            return
+        try:
+            frames, client.inbuf = decode_frames(client.inbuf)
+        except ValueError:
+            self._drop(client)
+            return
+        for opcode, payload in frames:
+            if opcode == OP_TEXT:
+                self._command(payload.decode("utf-8", "replace"))
+            elif opcode == OP_PING:
+                client.outbuf += encode_frame(payload, OP_PONG)
+                self._flush(client)
+            elif opcode == OP_CLOSE:
+                client.outbuf += encode_frame(payload[:2], OP_CLOSE)
+                client.closing = True
+                self._flush(client)
+                return
+        if len(client.inbuf) > MAX_MESSAGE + 14:
+            self._drop(client)
+
+    def _check_stalled(self):
+        now = time.monotonic()
+        if now - self.checked_at < 1.0:
+            return
+        self.checked_at = now
+        for client in list(self.clients.values()):
+            if client.blocked_at is not None and now - client.blocked_at > STALL_TIMEOUT:
+                self.dropped += 1
+                self._drop(client)
+
+    def serve(self):
+        """Цикл до stop()"""
+        while self._running:
+            for key, events in self.selector.select(1.0):
+                if key.fileobj is self.listener:
+                    self._accept()
+                elif key.fileobj == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    self._broadcast()
+                else:
+                    client = self.clients.get(key.fileobj)
+                    if client is None:
+                        continue
+                    if events & selectors.EVENT_WRITE:
+                        self._flush(client)
+                    if events & selectors.EVENT_READ and key.fileobj in self.clients:
+                        self._read(client)
+            self._check_stalled()
+
+    def stop(self):
+        self._running = False
+        os.write(self._wake_w, b"x")
+
+    def close(self):
+        for client in list(self.clients.values()):
+            self._drop(client)
+        self.selector.close()
+        self.listener.close()
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+
+    def summary(self):
+        return {
+            "connections": self.connections,
+            "clients": sum(1 for c in self.clients.values() if c.websocket),
+            "updates": self.seq,
+            "messages": self.messages,
+            "encoded": self.encoded,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "polls": self.upstream.polls if self.upstream else 0,
+            "poll_errors": self.upstream.errors if self.upstream else 0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket fan-out of route counts to monitoring dashboards")
+    parser.add_argument("--upstream", default="http://192.168.1.104", help="сервер маршрутов (ESP или route_server.py)")
+    parser.add_argument("--host", default="", help="адрес прослушивания")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="порт HTTP/WebSocket")
+    parser.add_argument("--poll-ms", type=float, default=POLL_INTERVAL * 1000, help="период опроса сервера маршрутов (мс)")
+    parser.add_argument("--sndbuf", type=int, default=SEND_BUFFER, help="буфер отправки клиента (байты, 0 - как в системе)")
+    parser.add_argument("--summary", action="store_true", help="при выходе напечатать счётчики в JSON")
+    args = parser.parse_args()
+
+    hub = Hub((args.host, args.port), args.sndbuf)
+    hub.upstream = Upstream(args.upstream, hub.publish, args.poll_ms / 1000.0)
+    print("Hub on port {} <- {}".format(hub.port, args.upstream), flush=True)
+    try:
+        hub.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.upstream.close()
+        summary = hub.summary()
+        hub.close()
+        print(json.dumps(summary) if args.summary else summary, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+Строки станций выбора маршрута (Arduino с RFID) и события заявок
+
+Arduino (arduino/stem_arduino) шлёт по UART строки:
+    CARD=<HEX UID>;ROUTE=<индекс>   - заявка карты на маршрут
+    REMOVE=<HEX UID>                - отмена заявки карты
+Разбор повторяет processSerialLine() прошивки stem_esp_server: пробелы
+считаются разделителями, UID - только HEX-символы, маршрут - 0..ROUTES_COUNT-1,
+строки длиннее MAX_LINE отбрасываются. UID приводится к верхнему регистру,
+чтобы одна карта с разных станций давала один ключ.
+
+Ответ /data бывает в JSON и, если клиент просит ROUTES_TYPE в Accept, в
+компактном двоичном виде (pack_data/unpack_data, сетевой порядок байт):
+    "SR", формат (1), число маршрутов (u8), версия (u32), всего карт (u32),
+    по каждому маршруту: заявок (u32), длина имени (u8), имя (ASCII).
+"""
+
+import json
+import struct
+
+ROUTE_NAMES = ("GREEN", "BLUE", "YELLOW") # Маршруты, как ROUTE_NAMES в прошивке
+ROUTES_COUNT = len(ROUTE_NAMES)
+MAX_LINE = 120 # Длина строки, после которой прошивка сбрасывает приём
+MAX_UID = 250 # Длина HEX UID, как ограничение uidLen в прошивке
+
+CARD = "card"
+REMOVE = "remove"
+
+ROUTES_TYPE = "application/x-stem-routes" # Двоичный ответ /data
+_DATA_MAGIC = b"SR"
+_DATA_FORMAT = 1
+_DATA_HEAD = struct.Struct("!2sBBII")
+_ROUTE_HEAD = struct.Struct("!IB")
+
+_HEX = frozenset("0123456789abcdefABCDEF")
+
+
+class Event(object):
+    """Заявка (CARD) или её отмена (REMOVE) от станции"""
+    __slots__ = ("kind", "uid", "route", "station")
+
+    def __init__(self, kind, uid, route=None, station=None):
+        self.kind = kind
+        self.uid = uid
+        self.route = route # индекс маршрута для CARD, None для REMOVE
+        self.station = station # имя станции (устройства), откуда пришла строка
+
+    def key(self):
+        return (self.kind, self.uid, self.route)
+
+    def to_dict(self):
+        data = {"kind": self.kind, "uid": self.uid}
+        if self.route is not None:
+            data["route"] = self.route
+        if self.station is not None:
+            data["station"] = self.station
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Событие из JSON пакета; ValueError, если оно не прошло бы разбор строки"""
+        kind = data.get("kind")
+        uid = valid_uid(str(data.get("uid", "")))
+        if kind == CARD:
+            route = data.get("route")
+            if not isinstance(route, int) or not 0 <= route < ROUTES_COUNT:
+                raise ValueError("bad route: {!r}".format(route))
+            return cls(CARD, uid, route, data.get("station"))
+        if kind == REMOVE:
+            return cls(REMOVE, uid, None, data.get("station"))
+        raise ValueError("bad kind: {!r}".format(kind))
+
+    def to_line(self):
+        if self.kind == CARD:
+            return "CARD={};ROUTE={}".format(self.uid, self.route)
+        return "REMOVE={}".format(self.uid)
+
+    def __repr__(self):
+        return "Event({})".format(self.to_line())
+
+
+def valid_uid(uid):
+    """UID в верхнем регистре; ValueError для пустого, длинного или не HEX"""
+    uid = uid.strip()
+    if not uid or len(uid) > MAX_UID or not _HEX.issuperset(uid):
+        raise ValueError("bad uid: {!r}".format(uid))
+    return uid.upper()
+
+
+def _value(line, key):
+    """Значение key до ';' или конца строки (как parseKeyValue() в прошивке)"""
+    p = line.find(key)
+    if p < 0:
+        return ""
+    p += len(key)
+    end = line.find(";", p)
+    return (line[p:] if end < 0 else line[p:end]).strip()
+
+
+def parse_line(line, station=None):
+    """Событие из строки станции или None, если прошивка бы её проигнорировала"""
+    line = line.strip()
+    if not line or len(line) > MAX_LINE:
+        return None
+    try:
+        if line.startswith("REMOVE="):
+            return Event(REMOVE, valid_uid(line[7:]), None, station)
+
+        line = line.replace(" ", ";")
+        uid = valid_uid(_value(line, "CARD="))
+        route = int(_value(line, "ROUTE="))
+    except ValueError:
+        return None
+    if not 0 <= route < ROUTES_COUNT:
+        return None
+    return Event(CARD, uid, route, station)
+
+
+def pack_data(data):
+    """Ответ /data (словарь VoteTable.data()) в двоичном виде"""
+    routes = data["routes"]
+    parts = [_DATA_HEAD.pack(_DATA_MAGIC, _DATA_FORMAT, len(routes), data.get("version", 0), data["total"])]
+    for item in routes:
+        name = item["name"].encode("ascii")
+        parts.append(_ROUTE_HEAD.pack(item["count"], len(name)))
+        parts.append(name)
+    return b"".join(parts)
+
+
+def unpack_data(body):
+    """Двоичный ответ /data -> словарь как у JSON; ValueError для чужого формата"""
+    try:
+        magic, form, count, version, total = _DATA_HEAD.unpack_from(body)
+        if magic != _DATA_MAGIC or form != _DATA_FORMAT:
+            raise ValueError("bad routes payload")
+        offset = _DATA_HEAD.size
+        routes = []
+        for index in range(count):
+            routes_count, length = _ROUTE_HEAD.unpack_from(body, offset)
+            offset += _ROUTE_HEAD.size
+            name = body[offset:offset + length].decode("ascii")
+            offset += length
+            routes.append({"index": index, "name": name, "count": routes_count})
+    except struct.error as e:
+        raise ValueError(str(e))
+    return {"routes": routes, "total": total, "version": version}
+
+
+def parse_data(body, content_type):
+    """Ответ /data в любом из двух видов (ESP отвечает только JSON)"""
+    if content_type and content_type.split(";")[0].strip() == ROUTES_TYPE:
+        return unpack_data(body)
+    return json.loads(body.decode("utf-8"))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сервер маршрутов на компьютере вместо веб-сервера ESP
+
+HTTP-контракт тот же, что у прошивки stem_esp_server, поэтому робот
+(run.fetch_routes / reset_route) и страница мониторинга работают без
+изменений:
+    GET /                 - страница мониторинга (index.html);
+    GET /data             - {"routes": [{"index", "name", "count"}], "total", "version"};
+                            ETag меняется с каждым изменением заявок: с
+                            If-None-Match и тем же ETag ответ - 304 без тела;
+                            с Accept: application/x-stem-routes - двоичный
+                            ответ (protocol.pack_data);
+    GET /reset            - сбросить все заявки;
+    GET /reset?route=N    - сбросить заявки маршрута N.
+Заявки приходят не по UART, а от шлюзов станций (gateway.py) пакетами:
+    POST /api/batch       - {"events": [{"kind", "uid", "route"}, ...]}
+                            -> {"ok": true, "received": n, "changed": k}
+Так несколько станций с RFID могут работать на один сервер.
+
+С --data-dir заявки хранятся на диске (store.py: журнал и снимки) и
+переживают перезапуск; ответ на /api/batch и /reset уходит после fsync
+(при ошибке записи на диск - 503).
+
+Запуск:
+    ./route_server.py [--port 8080] [--data-dir votes]
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from protocol import Event, ROUTES_COUNT, ROUTES_TYPE, pack_data
+from votes import VoteTable
+from store import VoteStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = os.path.join(HERE, "index.html") # Страница мониторинга (как INDEX_HTML прошивки)
+DEFAULT_PORT = 8080
+MAX_BODY = 1 << 20 # Наибольший размер пакета событий (байты)
+
+
+class RouteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive: шлюз шлёт пакеты по одному соединению
+    disable_nagle_algorithm = True # ответ - заголовки и тело отдельными записями
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body, content_type="text/plain; charset=utf-8", headers=None):
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {"Cache-Control": "no-store"}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code, data):
+        self._send(code, json.dumps(data, separators=(",", ":")), "application/json; charset=utf-8")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/":
+            self._send(200, self.server.index_html, "text/html; charset=utf-8")
+        elif url.path == "/data":
+            self._send_data()
+        elif url.path == "/reset":
+            query = parse_qs(url.query)
+            if "route" in query:
+                try:
+                    route = int(query["route"][0])
+                except ValueError:
+                    route = -1
+                if not 0 <= route < ROUTES_COUNT:
+                    self._send(400, "Bad route")
+                    return
+                self._reset(route)
+                return
+            self._reset(None)
+        else:
+            self._send(404, "Not found")
+
+    def _reset(self, route):
+        try:
+            self.server.votes.reset(route)
+        except (IOError, OSError) as e:
+            # Хранилище не смогло записать журнал (store.py)
+            self._send(503, "Store error: {}".format(e))
+            return
+        self._send(200, "OK ALL RESET" if route is None else "OK ROUTE RESET")
+
+    def _send_data(self):
+        data = self.server.votes.data()
+        etag = '"{}-{}"'.format(self.server.boot_id, data["version"])
+        # no-cache: браузер может хранить ответ, но каждый раз сверяет ETag
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+        match = self.headers.get("If-None-Match")
+        if match and etag in [tag.strip().replace("W/", "", 1) for tag in match.split(",")]:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+        elif ROUTES_TYPE in self.headers.get("Accept", ""):
+            self._send(200, pack_data(data), ROUTES_TYPE, headers)
+        else:
+            self._send(200, json.dumps(data, separators=(",", ":")), "application/json; charset=utf-8", headers)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/api/batch":
+            self._send(404, "Not found")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self._send(413, "Batch too large")
+            return
+        try:
+            batch = json.loads(self.rfile.read(length).decode("utf-8"))
+            events = [Event.from_dict(item) for item in batch["events"]]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self._send_json(400, {"ok": False, "error": str(e)})
+            return
+        try:
+            changed = self.server.votes.apply(events)
+        except (IOError, OSError) as e:
+            self._send_json(503, {"ok": False, "error": str(e)})
+            return
+        self._send_json(200, {"ok": True, "received": len(events), "changed": changed})
+
+
+class RouteServer(ThreadingMixIn, HTTPServer):
+    """HTTP-сервер маршрутов; serve_in_thread() - для проверок и бенчмарков"""
+    daemon_threads = True
+
+    def __init__(self, address=("", DEFAULT_PORT), votes=None):
+        HTTPServer.__init__(self, address, RouteHandler)
+        self.votes = votes if votes is not None else VoteTable()
+        # Версия заявок начинается заново с каждым запуском: ETag отличает запуски
+        self.boot_id = "{:08x}".format(int(time.time() * 1000) & 0xFFFFFFFF)
+        with open(INDEX_PATH, "rb") as f:
+            self.index_html = f.read()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format("127.0.0.1" if host in ("", "0.0.0.0") else host, port)
+
+    def serve_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, name="route-server")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route server (same HTTP contract as the ESP firmware)")
+    parser.add_argument("--host", default="", help="адрес прослушивания")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="порт HTTP")
+    parser.add_argument("--data-dir", help="каталог журнала и снимков заявок (без него - только в памяти)")
+    args = parser.parse_args()
+
+    votes = None
+    if args.data_dir:
+        votes = VoteStore(args.data_dir)
+        print("Recovered {} cards from {} ({} log records, {} bytes of torn tail dropped)".format(
+            len(votes.cards), args.data_dir, votes.recovered_records, votes.truncated))
+    server = RouteServer((args.host, args.port), votes)
+    print("Route server on {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if votes is not None:
+            votes.close()
+
+
+if __name__ == "__main__":
+    main()
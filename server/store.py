@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+
+"""
+Заявки на диске: журнал упреждающей записи (WAL) и снимки
+
+Прошивка ESP держит заявки только в RAM (cards[MAX_CARDS], routeCounts[]):
+перезагрузка теряет всех ожидающих пассажиров. VoteStore - та же таблица
+VoteTable (словарь UID -> маршрут), но каждое изменение сначала попадает
+в журнал:
+
+- журнал - файлы wal-<номер>.log, только дописываются. Запись - строка
+  "<crc32> <команда>": C <uid> <маршрут>, R <uid>, Z (сброс всех),
+  Z <маршрут>. Пишутся только события, которые что-то изменили;
+- групповая фиксация: apply() возвращается, когда его записи на диске
+  (fsync), но fsync делает один поток-фиксатор за всех, кто успел
+  дописать записи, пока шёл предыдущий fsync;
+- снимок snapshot-<номер>.snap - вся таблица на момент конца журнала
+  с этим номером. После snapshot_records записей журнал переключается на
+  новый файл, снимок пишется в фоне (временный файл, fsync, rename), затем
+  старые журналы и снимки удаляются;
+- восстановление: последний снимок и журналы после него; запись с
+  неверной контрольной суммой (оборванная при отключении питания) и всё
+  после неё отбрасываются;
+- ошибка записи журнала (диск заполнен, EIO) запоминается в failure:
+  ждущие и все следующие apply() и reset() получают IOError вместо
+  вечного ожидания fsync (сервер отвечает 503); хранилище нужно открыть
+  заново. Ошибка снимка (snapshot_error) запись не останавливает - журналы
+  до снимка остаются на диске, следующий снимок пробуется как обычно.
+"""
+
+import os
+import re
+import zlib
+import threading
+
+from protocol import CARD, ROUTES_COUNT
+from votes import VoteTable
+
+SNAPSHOT_RECORDS = 200000 # Записей журнала между снимками
+SNAPSHOT_MAGIC = "STEMSNAP 1"
+
+_WAL_NAME = re.compile(r"^wal-(\d{8})\.log$")
+_SNAPSHOT_NAME = re.compile(r"^snapshot-(\d{8})\.snap$")
+
+
+def _wal_name(segment):
+    return "wal-{:08d}.log".format(segment)
+
+
+def _snapshot_name(segment):
+    return "snapshot-{:08d}.snap".format(segment)
+
+
+def _record(payload):
+    data = payload.encode("ascii")
+    return b"%08x " % zlib.crc32(data) + data + b"\n"
+
+
+def _fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class VoteStore(VoteTable):
+    """VoteTable с журналом и снимками в каталоге directory"""
+    def __init__(self, directory, group_commit=True, sync=True, snapshot_records=SNAPSHOT_RECORDS):
+        VoteTable.__init__(self)
+        self.directory = directory
+        self.group_commit = group_commit # False - каждый apply() сам делает fsync
+        self.sync = sync # False - без fsync (только для сравнения в бенчмарке)
+        self.snapshot_records = snapshot_records
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.recovered_records = 0
+        self.truncated = 0 # отброшено байт оборванного хвоста журнала
+        self.segment = self._recover()
+        self.wal = open(os.path.join(directory, _wal_name(self.segment)), "ab")
+        self.wal_records = 0
+
+        # Групповая фиксация: записи копятся в pending, фиксатор пишет и делает fsync
+        self.pending = []
+        self.appended = 0 # номер последней дописанной записи
+        self.durable = 0 # номер последней записи на диске
+        self.commits = 0 # сколько раз делался fsync
+        self.commit_cond = threading.Condition(self.lock)
+        self.writing = False # фиксатор пишет группу без self.lock
+        self.rotating = False
+        self.failure = None # ошибка записи журнала: дальше хранилище не принимает изменений
+        self.snapshot_error = None # ошибка последнего снимка в фоне
+        self._running = True
+        self._snapshot_thread = None
+        self.committer = None
+        if group_commit:
+            self.committer = threading.Thread(target=self._commit_loop, name="wal-commit")
+            self.committer.daemon = True
+            self.committer.start()
+
+    # --- восстановление ---
+
+    def _segments(self, pattern):
+        found = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def _recover(self):
+        """Снимок + журналы после него; возвращает номер журнала для дозаписи"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Снимок, не дописанный до rename
+                os.remove(os.path.join(self.directory, name))
+        base = 0
+        for segment in reversed(self._segments(_SNAPSHOT_NAME)):
+            if self._load_snapshot(segment):
+                base = segment
+                break
+        wals = [s for s in self._segments(_WAL_NAME) if s > base]
+        for segment in wals:
+            if not self._replay(segment):
+                # Обрыв внутри журнала: более поздние журналы продолжают испорченную историю
+                for later in wals[wals.index(segment) + 1:]:
+                    os.remove(os.path.join(self.directory, _wal_name(later)))
+                return segment
+        return wals[-1] if wals else base + 1
+
+    def _load_snapshot(self, segment):
+        path = os.path.join(self.directory, _snapshot_name(segment))
+        cards = {}
+        try:
+            with open(path, "r") as f:
+                header = f.readline().split()
+                if " ".join(header[:2]) != SNAPSHOT_MAGIC or int(header[2]) != segment:
+                    return False
+                count = int(header[3])
+                for line in f:
+                    uid, route = line.split()
+                    cards[uid] = int(route)
+        except (IOError, OSError, ValueError, IndexError):
+            return False
+        if len(cards) != count:
+            return False
+        self.cards = cards
+        self.counts = [0] * ROUTES_COUNT
+        for route in cards.values():
+            self.counts[route] += 1
+        return True
+
+    def _replay(self, segment):
+        """Применить журнал; False, если в нём оборванная или испорченная запись (хвост отрезается)"""
+        path = os.path.join(self.directory, _wal_name(segment))
+        good = 0
+        with open(path, "rb") as f:
+            data = f.read()
+        for line in data.splitlines(True):
+            if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+                break
+            payload = line[9:-1]
+            try:
+                if int(line[:8], 16) != zlib.crc32(payload):
+                    break
+                self._redo(payload.decode("ascii").split())
+            except (ValueError, IndexError):
+                break
+            good += len(line)
+            self.recovered_records += 1
+        if good == len(data):
+            return True
+        self.truncated += len(data) - good
+        with open(path, "r+b") as f:
+            f.truncate(good)
+        return False
+
+    def _redo(self, fields):
+        op = fields[0]
+        if op == "C":
+            self._vote(fields[1], int(fields[2]))
+        elif op == "R":
+            self._remove(fields[1])
+        elif op == "Z":
+            self._reset(int(fields[1]) if len(fields) > 1 else None)
+        else:
+            raise ValueError("bad record: {}".format(op))
+
+    # --- запись ---
+
+    def _fail(self, error):
+        """Запомнить ошибку записи журнала и разбудить ждущих (под self.lock)"""
+        if self.failure is None:
+            self.failure = error
+        self.commit_cond.notify_all()
+
+    def _check(self):
+        if self.failure is not None:
+            raise IOError("vote log write failed: {}".format(self.failure))
+
+    def _append(self, payloads):
+        """Дописать записи (под self.lock); возвращает номер последней"""
+        data = b"".join(_record(p) for p in payloads)
+        self.wal_records += len(payloads)
+        try:
+            if self.group_commit:
+                self.pending.append(data)
+                self.appended += 1
+                self.commit_cond.notify_all()
+            else:
+                self.wal.write(data)
+                self.wal.flush()
+                if self.sync:
+                    os.fsync(self.wal.fileno())
+                self.commits += 1
+                self.appended += 1
+                self.durable = self.appended
+            if self.wal_records >= self.snapshot_records:
+                self._start_snapshot()
+        except (IOError, OSError) as e:
+            self._fail(e)
+            self._check()
+        return self.appended
+
+    def _commit_loop(self):
+        with self.lock:
+            while True:
+                while (not self.pending or self.rotating) and self._running:
+                    self.commit_cond.wait()
+                if not self.pending:
+                    return
+                data = b"".join(self.pending)
+                del self.pending[:]
+                upto = self.appended
+                # Пишем без общей блокировки: тем временем apply() копят следующую группу
+                self.writing = True
+                self.lock.release()
+                error = None
+                try:
+                    self.wal.write(data)
+                    self.wal.flush()
+                    if self.sync:
+                        os.fsync(self.wal.fileno())
+                except (IOError, OSError) as e:
+                    error = e
+                finally:
+                    self.lock.acquire()
+                    self.writing = False
+                if error is not None:
+                    # Неизвестно, что из группы легло на диск: дальше не пишем
+                    self._fail(error)
+                    return
+                self.commits += 1
+                self.durable = upto
+                self.commit_cond.notify_all()
+
+    def _wait_durable(self, seq):
+        with self.lock:
+            while self.durable < seq:
+                self._check()
+                self.commit_cond.wait()
+
+    def apply(self, events):
+        """Применить события; возвращается, когда изменения записаны на диск (IOError - не записаны)"""
+        with self.lock:
+            self._check()
+            changed = []
+            for event in events:
+                if self._apply(event):
+                    if event.kind == CARD:
+                        changed.append("C {} {}".format(event.uid, event.route))
+                    else:
+                        changed.append("R {}".format(event.uid))
+            if not changed:
+                return 0
+            seq = self._append(changed)
+        self._wait_durable(seq)
+        return len(changed)
+
+    def reset(self, route=None):
+        with self.lock:
+            self._check()
+            self._reset(route)
+            seq = self._append(["Z" if route is None else "Z {}".format(route)])
+        self._wait_durable(seq)
+
+    # --- снимки ---
+
+    def _start_snapshot(self):
+        """Переключить журнал и записать снимок в фоне (под self.lock)"""
+        if self.rotating or self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        self.rotating = True
+        # Группа, которую пишет фиксатор, должна лечь в старый журнал раньше pending
+        while self.writing:
+            self.commit_cond.wait()
+        self._check()
+        segment = self.segment
+        if self.pending:
+            self.wal.write(b"".join(self.pending))
+            del self.pending[:]
+        self.wal.flush()
+        if self.sync:
+            os.fsync(self.wal.fileno())
+        self.durable = self.appended
+        self.wal.close()
+        self.segment = segment + 1
+        self.wal = open(os.path.join(self.directory, _wal_name(self.segment)), "ab")
+        if self.sync:
+            _fsync_dir(self.directory)
+        self.wal_records = 0
+        self.rotating = False
+        self.commit_cond.notify_all()
+        cards = dict(self.cards)
+        self._snapshot_thread = threading.Thread(target=self._write_snapshot, args=(segment, cards),
+                                                 name="snapshot")
+        self._snapshot_thread.start()
+
+    def _write_snapshot(self, segment, cards):
+        path = os.path.join(self.directory, _snapshot_name(segment))
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write("{} {} {}\n".format(SNAPSHOT_MAGIC, segment, len(cards)))
+                f.writelines("{} {}\n".format(uid, route) for uid, route in cards.items())
+                f.flush()
+                if self.sync:
+                    os.fsync(f.fileno())
+            os.rename(tmp_path, path)
+            if self.sync:
+                _fsync_dir(self.directory)
+        except (IOError, OSError) as e:
+            # Журналы до снимка не удаляются - восстановление пройдёт без него
+            self.snapshot_error = e
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.snapshot_error = None
+        # Снимок на месте: журналы до него и старые снимки больше не нужны
+        for old in self._segments(_WAL_NAME):
+            if old <= segment:
+                os.remove(os.path.join(self.directory, _wal_name(old)))
+        for old in self._segments(_SNAPSHOT_NAME):
+            if old < segment:
+                os.remove(os.path.join(self.directory, _snapshot_name(old)))
+
+    def snapshot(self):
+        """Снимок сейчас (и дождаться его записи)"""
+        with self.lock:
+            self._check()
+            self._start_snapshot()
+            thread = self._snapshot_thread
+        thread.join()
+        if self.snapshot_error is not None:
+            raise IOError("snapshot failed: {}".format(self.snapshot_error))
+
+    def close(self):
+        """Дописать журнал, дождаться снимка и закрыть файлы"""
+        with self.lock:
+            self._running = False
+            self.commit_cond.notify_all()
+        if self.committer is not None:
+            self.committer.join()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        self.wal.close()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Заявки карт на маршруты в памяти
+
+Как cards[] и routeCounts[] прошивки stem_esp_server, но без ограничения
+MAX_CARDS и с индексом по UID (словарь) вместо перебора таблицы:
+одна карта - одна заявка, повторная заявка переназначает маршрут.
+version растёт при каждом изменении: по нему сервер отдаёт ETag, и
+клиент с If-None-Match получает 304 вместо повторной загрузки.
+"""
+
+import threading
+
+from protocol import CARD, REMOVE, ROUTE_NAMES, ROUTES_COUNT
+
+
+class VoteTable(object):
+    """UID карты -> маршрут и счётчики маршрутов; методы потокобезопасны"""
+    def __init__(self):
+        self.cards = {}
+        self.counts = [0] * ROUTES_COUNT
+        self.version = 0 # номер изменения (с запуска)
+        self.lock = threading.Lock()
+
+    def _vote(self, uid, route):
+        old = self.cards.get(uid)
+        if old == route:
+            return False
+        if old is not None:
+            self.counts[old] -= 1
+        self.cards[uid] = route
+        self.counts[route] += 1
+        self.version += 1
+        return True
+
+    def _remove(self, uid):
+        old = self.cards.pop(uid, None)
+        if old is None:
+            return False
+        self.counts[old] -= 1
+        self.version += 1
+        return True
+
+    def _apply(self, event):
+        if event.kind == CARD:
+            return self._vote(event.uid, event.route)
+        if event.kind == REMOVE:
+            return self._remove(event.uid)
+        return False
+
+    def apply(self, events):
+        """Применить события по порядку; возвращает, сколько из них что-то изменили"""
+        with self.lock:
+            return sum(1 for event in events if self._apply(event))
+
+    def _reset(self, route):
+        self.version += 1
+        if route is None:
+            self.cards.clear()
+            self.counts = [0] * ROUTES_COUNT
+            return
+        for uid in [uid for uid, r in self.cards.items() if r == route]:
+            del self.cards[uid]
+        self.counts[route] = 0
+
+    def reset(self, route=None):
+        """Сбросить все заявки или заявки одного маршрута"""
+        with self.lock:
+            self._reset(route)
+
+    def data(self):
+        """Ответ /data: {"routes": [{"index", "name", "count"}, ...], "total", "version"}"""
+        with self.lock:
+            counts = list(self.counts)
+            total = len(self.cards)
+            version = self.version
+        return {
+            "routes": [{"index": i, "name": name, "count": counts[i]} for i, name in enumerate(ROUTE_NAMES)],
+            "total": total,
+            "version": version,
+        }